@@ -0,0 +1,164 @@
+#! /usr/bin/env python
+'''Run the endpoint handlers against moto stand-ins of the AWS services'''
+
+import io
+import os
+import sys
+import json
+import time
+import logging
+import importlib
+import contextlib
+import collections
+import jwt
+import boto3
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules used by several functions, next to the modules of each function
+SHARED_SRC = os.path.join(ROOT, 'shared', 'src')
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+import manage_table  # pylint: disable=wrong-import-position
+
+
+REGION = 'eu-west-1'
+FILES_TABLE = 'bench-files'
+SESSIONS_TABLE = 'bench-upload-sessions'
+FILES_BUCKET = 'bench-files'
+SENDER_EMAIL = 'noreply@example.com'
+USER_ID = 'bench-user'
+KEY_ID = 'bench-key'
+ENDPOINTS = {
+    'upload': ('upload-file', 'upload_file'),
+    'list': ('get-user-files', 'get_user_files'),
+    'delete': ('delete-user-file', 'delete_user_file'),
+    'share': ('share-file', 'share_file')
+}
+
+
+class Environment():
+    '''The AWS resources, the user and the token the handlers run with'''
+
+    def __init__(self, jwks_file):
+        self.jwks_file = jwks_file
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.user_pool_id = None
+
+    def setup(self):
+        '''Create the resources in the running moto mock'''
+        for name, value in (
+                ('AWS_ACCESS_KEY_ID', 'testing'),
+                ('AWS_SECRET_ACCESS_KEY', 'testing'),
+                ('AWS_DEFAULT_REGION', REGION)):
+            os.environ.setdefault(name, value)
+        dynamodb = boto3.client('dynamodb')
+        table_args = collections.namedtuple('TableArgs', ['table', 'index'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            manage_table.create_table(dynamodb, table_args(FILES_TABLE, manage_table.USER_FILES_INDEX))
+            manage_table.create_sessions_table(dynamodb, table_args(SESSIONS_TABLE, None))
+        boto3.client('s3').create_bucket(
+            Bucket=FILES_BUCKET,
+            CreateBucketConfiguration={'LocationConstraint': REGION}
+        )
+        cognito = boto3.client('cognito-idp')
+        self.user_pool_id = cognito.create_user_pool(PoolName='bench')['UserPool']['Id']
+        cognito.admin_create_user(
+            UserPoolId=self.user_pool_id,
+            Username=USER_ID,
+            UserAttributes=[
+                {'Name': 'name', 'Value': 'Bench User'},
+                {'Name': 'email', 'Value': 'bench@example.com'}
+            ]
+        )
+        boto3.client('ses').verify_email_identity(EmailAddress=SENDER_EMAIL)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.key.public_key()))
+        jwk.update({'kid': KEY_ID, 'alg': 'RS256', 'use': 'sig'})
+        with open(self.jwks_file, 'w') as jwks_file:
+            json.dump({'keys': [jwk]}, jwks_file)
+        os.environ.update({
+            'FILE_SHARING_TABLE': FILES_TABLE,
+            'UPLOAD_SESSIONS_TABLE': SESSIONS_TABLE,
+            'USER_FILES_BUCKET': FILES_BUCKET,
+            'COGNITO_USER_POOL_ID': self.user_pool_id,
+            'JWKS_FILE': self.jwks_file,
+            'SENDER_EMAIL': SENDER_EMAIL,
+            'SENDER_SES_ARN': 'arn:aws:ses:{}:123456789012:identity/{}'.format(REGION, SENDER_EMAIL),
+            # Measure the handlers, not the SES quota of the account
+            'SES_MAX_SEND_RATE': '1000000',
+            'METRICS_ENABLED': 'false'
+        })
+
+    def token(self, profile_claims=True):
+        '''A signed ID token of the benchmark user'''
+        claims = {
+            'cognito:username': USER_ID,
+            'token_use': 'id',
+            'iss': 'https://cognito-idp.{}.amazonaws.com/{}'.format(REGION, self.user_pool_id),
+            'exp': int(time.time()) + 24 * 3600,
+            'iat': int(time.time())
+        }
+        if profile_claims:
+            claims.update({'name': 'Bench User', 'email': 'bench@example.com'})
+        return 'Bearer ' + jwt.encode(claims, self.key, algorithm='RS256', headers={'kid': KEY_ID})
+
+
+class CallCounter():
+    '''Count the AWS calls made by the clients of an endpoint'''
+
+    def __init__(self):
+        self.calls = collections.Counter()
+
+    def __call__(self, model, **_):
+        self.calls[model.service_model.service_name] += 1
+
+    def reset(self):
+        '''Forget the calls counted so far'''
+        calls = self.calls
+        self.calls = collections.Counter()
+        return calls
+
+
+@contextlib.contextmanager
+def use_endpoint(scenario):
+    '''Import the handler of an endpoint apart from the other endpoints
+
+    The endpoints import the shared modules (constants, log, aws_clients...),
+    which keep state at module level: they are swapped in sys.modules along
+    with the modules of the endpoint while it runs.
+    '''
+    endpoint, module_name = ENDPOINTS[scenario]
+    src = os.path.join(ROOT, 'endpoints', endpoint, 'src')
+    names = set(
+        name[:-3] for folder in (src, SHARED_SRC)
+        for name in os.listdir(folder) if name.endswith('.py')
+    )
+    saved = dict((name, sys.modules.pop(name)) for name in names if name in sys.modules)
+    sys.path[0:0] = [src, SHARED_SRC]
+    try:
+        handler_module = importlib.import_module(module_name)
+        # The handlers log at INFO level, which would be timed as well
+        logging.getLogger().setLevel(logging.WARNING)
+        counter = CallCounter()
+        importlib.import_module('aws_clients')._get_session().events.register('before-call', counter)
+        yield handler_module, counter
+    finally:
+        sys.path.remove(src)
+        sys.path.remove(SHARED_SRC)
+        for name in names:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+
+
+def build_event(method, path, token, body=None, **extra):
+    '''Build an API Gateway proxy event'''
+    event = {
+        'httpMethod': method,
+        'path': path,
+        'headers': {'Authorization': token},
+        'queryStringParameters': None,
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False
+    }
+    event.update(extra)
+    return event
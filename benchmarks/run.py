@@ -0,0 +1,197 @@
+#! /usr/bin/env python
+'''Benchmark the endpoint handlers against moto and save the results'''
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import tempfile
+import tracemalloc
+from moto import mock_aws
+import harness
+import scenarios
+
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values, rank):
+    '''Nearest-rank percentile of sorted values'''
+    index = max(0, int(round(rank / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def latency_stats(latencies):
+    '''Summarize latencies given in seconds, in milliseconds'''
+    values = sorted(latency * 1000 for latency in latencies)
+    stats = {
+        'min': round(values[0], 3),
+        'mean': round(sum(values) / len(values), 3),
+        'max': round(values[-1], 3)
+    }
+    for rank in PERCENTILES:
+        stats['p{}'.format(rank)] = round(percentile(values, rank), 3)
+    return stats
+
+
+def param_grid(scenario, overrides):
+    '''Every combination of the scenario parameters'''
+    params = dict(scenarios.SCENARIOS[scenario]['params'])
+    for name, values in overrides.items():
+        if name in params:
+            params[name] = values
+    names = sorted(params)
+    for values in itertools.product(*(params[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def run_case(scenario, params, args):
+    '''Measure one scenario with one set of parameters, on fresh resources'''
+    with mock_aws(), tempfile.TemporaryDirectory() as folder:
+        env = harness.Environment(os.path.join(folder, 'jwks.json'))
+        env.setup()
+        count = args.warmup + args.iterations + args.memory_samples
+        events = scenarios.SCENARIOS[scenario]['build_events'](env, params, count)
+        with harness.use_endpoint(scenario) as (handler_module, counter):
+            handler = handler_module.lambda_handler
+            errors = 0
+            for event in events[:args.warmup]:
+                handler(event, None)
+            counter.reset()
+            latencies = []
+            started_at = time.perf_counter()
+            for event in events[args.warmup:args.warmup + args.iterations]:
+                request_started_at = time.perf_counter()
+                response = handler(event, None)
+                latencies.append(time.perf_counter() - request_started_at)
+                if response['statusCode'] >= 400:
+                    errors += 1
+            elapsed = time.perf_counter() - started_at
+            calls = counter.reset()
+            # tracemalloc slows the allocations down, it gets its own requests
+            peak_memory = 0
+            for event in events[args.warmup + args.iterations:]:
+                tracemalloc.start()
+                handler(event, None)
+                peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+    aws_calls = dict(
+        (service, round(count / float(args.iterations), 2))
+        for service, count in sorted(calls.items())
+    )
+    aws_calls['total'] = round(sum(calls.values()) / float(args.iterations), 2)
+    return {
+        'scenario': scenario,
+        'params': params,
+        'requests': args.iterations,
+        'errors': errors,
+        'latency_ms': latency_stats(latencies),
+        'throughput_rps': round(args.iterations / elapsed, 2),
+        'peak_memory_kb': round(peak_memory / 1024.0, 1) if args.memory_samples else None,
+        'aws_calls_per_request': aws_calls
+    }
+
+
+def case_key(result):
+    '''Identify a case across result files'''
+    return result['scenario'], json.dumps(result['params'], sort_keys=True)
+
+
+def print_result(result, baseline=None):
+    '''Print one result line, with its change against the baseline'''
+    latency = result['latency_ms']
+    line = '{:<8} {:<60} p50 {:>9.2f}ms  p99 {:>9.2f}ms  {:>8.1f} req/s  {:>9} KB  {:>5} calls'.format(
+        result['scenario'],
+        json.dumps(result['params'], sort_keys=True),
+        latency['p50'],
+        latency['p99'],
+        result['throughput_rps'],
+        '-' if result['peak_memory_kb'] is None else result['peak_memory_kb'],
+        result['aws_calls_per_request']['total']
+    )
+    if result['errors']:
+        line += '  {} errors'.format(result['errors'])
+    if baseline is not None:
+        line += '  (p50 {:+.1f}%, p99 {:+.1f}%)'.format(
+            100.0 * (latency['p50'] - baseline['latency_ms']['p50']) / baseline['latency_ms']['p50'],
+            100.0 * (latency['p99'] - baseline['latency_ms']['p99']) / baseline['latency_ms']['p99']
+        )
+    print(line)
+
+
+def parse_param(value):
+    '''Parse NAME=VALUE[,VALUE...] into a name and its values'''
+    name, _, values = value.partition('=')
+    if not values:
+        raise argparse.ArgumentTypeError('Expected NAME=VALUE[,VALUE...]')
+    return name, [int(item) if item.isdigit() else item for item in values.split(',')]
+
+
+def parse_args(argv):
+    '''Parse the command line'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--scenario',
+        nargs='+',
+        choices=sorted(scenarios.SCENARIOS),
+        default=sorted(scenarios.SCENARIOS),
+        help='The endpoints to benchmark'
+    )
+    parser.add_argument('--iterations', type=int, default=50, help='Measured requests per case')
+    parser.add_argument('--warmup', type=int, default=5, help='Requests sent before measuring')
+    parser.add_argument(
+        '--memory-samples',
+        type=int,
+        default=3,
+        help='Extra requests traced for the peak memory, 0 to skip'
+    )
+    parser.add_argument(
+        '--param',
+        type=parse_param,
+        action='append',
+        default=[],
+        help='Override a dataset parameter, e.g. file_size=1024,1048576'
+    )
+    parser.add_argument('--output', help='The JSON results file, in benchmarks/results by default')
+    parser.add_argument('--compare', help='A previous JSON results file to compare with')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    '''Command line entrypoint'''
+    args = parse_args(argv)
+    overrides = dict(args.param)
+    baselines = {}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baselines = dict(
+                (case_key(result), result) for result in json.load(baseline_file)['results']
+            )
+    results = []
+    for scenario in args.scenario:
+        for params in param_grid(scenario, overrides):
+            result = run_case(scenario, params, args)
+            print_result(result, baselines.get(case_key(result)))
+            results.append(result)
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        output = os.path.join(RESULTS_FOLDER, time.strftime('%Y%m%d-%H%M%S.json'))
+    with open(output, 'w') as output_file:
+        json.dump({
+            'created_at': int(time.time()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'results': results
+        }, output_file, indent=2)
+    print('Results saved to {}'.format(output))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,148 @@
+#! /usr/bin/env python
+'''The requests of each benchmarked endpoint and the data they run on'''
+
+import os
+import uuid
+import base64
+import boto3
+import harness
+
+
+def write_files(user_id, count, upload_objects=False, prefix='file'):
+    '''Register uploaded files of a user, return their ids and names'''
+    table = boto3.resource('dynamodb').Table(harness.FILES_TABLE)
+    s3_client = boto3.client('s3')
+    files = []
+    with table.batch_writer() as batch:
+        for index in range(count):
+            file_id = str(uuid.uuid4())
+            file_name = '{}-{:08d}.txt'.format(prefix, index)
+            batch.put_item(Item={
+                'file_id': file_id,
+                'file_name': file_name,
+                'user_id': user_id,
+                'file_status': 'UPLOADED',
+                'file_size': 16
+            })
+            if upload_objects:
+                s3_client.put_object(
+                    Bucket=harness.FILES_BUCKET,
+                    Key=user_id+'/'+file_name,
+                    Body=b'benchmark data\n'
+                )
+            files.append((file_id, file_name))
+    return files
+
+
+def fill_table(files_per_user, table_size):
+    '''Give files to the benchmark user, then to other users up to table_size'''
+    files = write_files(harness.USER_ID, files_per_user)
+    others = max(0, table_size - files_per_user)
+    # Spread the other files over users owning 100 files each
+    for first in range(0, others, 100):
+        write_files('other-{}'.format(first // 100), min(100, others - first))
+    return files
+
+
+def upload_events(env, params, count):
+    '''Upload count new files of params['file_size'] bytes'''
+    token = env.token()
+    file_data = os.urandom(params['file_size'])
+    encoded = base64.b64encode(file_data).decode('ascii')
+    events = []
+    for index in range(count):
+        file_name = 'upload-{:08d}.bin'.format(index)
+        if params['body'] == 'raw':
+            event = harness.build_event(
+                'POST',
+                '/v1/users/{}/files'.format(harness.USER_ID),
+                token,
+                body=encoded,
+                isBase64Encoded=True
+            )
+            event['headers'].update({
+                'Content-Type': 'application/octet-stream',
+                'X-File-Name': file_name
+            })
+        else:
+            event = harness.build_event(
+                'POST',
+                '/v1/users/{}/files'.format(harness.USER_ID),
+                token,
+                {'file_data': encoded, 'remote_file_name': file_name}
+            )
+        events.append(event)
+    return events
+
+
+def list_events(env, params, count):
+    '''List the first page of a user owning params['files_per_user'] files'''
+    fill_table(params['files_per_user'], params['table_size'])
+    event = harness.build_event(
+        'GET',
+        '/v1/users/{}/files'.format(harness.USER_ID),
+        env.token(),
+        queryStringParameters={'limit': str(params['page_size'])}
+    )
+    return [event] * count
+
+
+def delete_events(env, params, count):
+    '''Delete count files, one by one, of a user owning params['files_per_user'] files'''
+    fill_table(params['files_per_user'], params['table_size'])
+    files = write_files(harness.USER_ID, count, upload_objects=True, prefix='delete')
+    token = env.token()
+    return [
+        harness.build_event(
+            'DELETE',
+            '/v1/users/{}/files/{}'.format(harness.USER_ID, file_id),
+            token
+        )
+        for file_id, _ in files
+    ]
+
+
+def share_events(env, params, count):
+    '''Share a file with params['recipients'] recipients'''
+    fill_table(0, params['table_size'])
+    table = boto3.resource('dynamodb').Table(harness.FILES_TABLE)
+    file_id = str(uuid.uuid4())
+    table.put_item(Item={
+        'file_id': file_id,
+        'file_name': 'shared.txt',
+        'user_id': harness.USER_ID,
+        'file_status': 'UPLOADED'
+    })
+    boto3.client('s3').put_object(
+        Bucket=harness.FILES_BUCKET,
+        Key=harness.USER_ID+'/shared.txt',
+        Body=b'benchmark data\n'
+    )
+    event = harness.build_event(
+        'POST',
+        '/v1/users/{}/files/{}/share'.format(harness.USER_ID, file_id),
+        env.token(),
+        {'share_with': ['recipient-{}@example.com'.format(index) for index in range(params['recipients'])]}
+    )
+    return [event] * count
+
+
+# The parameters of every scenario, with their default values
+SCENARIOS = {
+    'upload': {
+        'build_events': upload_events,
+        'params': {'file_size': [1024, 1024 * 1024], 'body': ['json', 'raw']}
+    },
+    'list': {
+        'build_events': list_events,
+        'params': {'files_per_user': [10, 1000], 'table_size': [5000], 'page_size': [100]}
+    },
+    'delete': {
+        'build_events': delete_events,
+        'params': {'files_per_user': [10, 1000], 'table_size': [5000]}
+    },
+    'share': {
+        'build_events': share_events,
+        'params': {'recipients': [1, 10, 50], 'table_size': [1000]}
+    }
+}
@@ -0,0 +1,220 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Delete many files of a user with the batch APIs'''
+
+import os
+import time
+import logging
+import constants
+import aws_clients
+import manifest
+import parallel
+import file_cache
+
+
+# Limits of BatchGetItem, DeleteObjects and BatchWriteItem
+BATCH_GET_SIZE = 100
+DELETE_OBJECTS_SIZE = 1000
+BATCH_WRITE_SIZE = 25
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05
+
+LOGGER = logging.getLogger(__name__)
+
+
+def chunks(items, size):
+    '''Split a list in lists of at most size items'''
+    return [items[index:index + size] for index in range(0, len(items), size)]
+
+
+def backoff(attempt):
+    '''Wait before retrying the unprocessed items'''
+    time.sleep(RETRY_BASE_DELAY * 2 ** attempt)
+
+
+def get_owned_files(user_id, file_ids):
+    '''Get the files of the list owned by the user, by file_id'''
+    table_name = os.environ['FILE_SHARING_TABLE']
+    dynamodb = aws_clients.get_resource('dynamodb')
+    owned_files = {}
+    for file_ids_chunk in chunks(file_ids, BATCH_GET_SIZE):
+        request_items = {
+            table_name: {
+                # The whole records, to restore the ones whose object stays
+                'Keys': [{'file_id': file_id} for file_id in file_ids_chunk]
+            }
+        }
+        for attempt in range(MAX_ATTEMPTS):
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for item in response['Responses'].get(table_name, []):
+                if item['user_id'] == user_id:
+                    owned_files[item['file_id']] = item
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                break
+            backoff(attempt)
+        else:
+            raise Exception('Cannot read all the files, try again')
+    return owned_files
+
+
+def get_all_files(user_id):
+    '''Get all the files of the user, by file_id'''
+    from boto3.dynamodb.conditions import Key
+    table = aws_clients.get_table(os.environ['FILE_SHARING_TABLE'])
+    query_args = {
+        'IndexName': os.getenv(constants.USER_FILES_INDEX, constants.DEFAULT_USER_FILES_INDEX),
+        'KeyConditionExpression': Key('user_id').eq(user_id)
+    }
+    user_files = {}
+    while True:
+        response = table.query(**query_args)
+        for item in response['Items']:
+            user_files[item['file_id']] = item
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return user_files
+
+
+def delete_objects(user_id, files):
+    '''Delete the objects of the files, return the errors by file_id'''
+    s3_client = aws_clients.get_client('s3', os.getenv(constants.REGION))
+    file_ids_by_key = {}
+    for file_infos in files:
+        if file_infos.get('file_status') == constants.FILE_STATUS_PENDING:
+            # Its staged upload, the live object of the name belongs to another record
+            file_key = constants.PENDING_UPLOADS_PREFIX+user_id+'/'+file_infos['file_id']
+        else:
+            file_key = user_id+'/'+file_infos['file_name']
+        file_ids_by_key.setdefault(file_key, []).append(file_infos['file_id'])
+    errors = {}
+    for keys in chunks(list(file_ids_by_key), DELETE_OBJECTS_SIZE):
+        response = s3_client.delete_objects(
+            Bucket=os.environ['USER_FILES_BUCKET'],
+            Delete={
+                'Objects': [{'Key': key} for key in keys],
+                'Quiet': True
+            }
+        )
+        for error in response.get('Errors', []):
+            for file_id in file_ids_by_key[error['Key']]:
+                errors[file_id] = error.get('Message', error.get('Code'))
+    return errors
+
+
+def delete_listed_records(user_id, files):
+    '''Delete the metadata and manifest entries of the files, return the file_ids left over'''
+    failed = manifest.write_all(user_id, [
+        (
+            [{'Delete': {'Key': {'file_id': file_infos['file_id']}}}],
+            [],
+            [] if file_infos.get('file_status') == constants.FILE_STATUS_PENDING
+            else [file_infos['file_id']]
+        )
+        for file_infos in files
+    ])
+    return [operations[0]['Delete']['Key']['file_id'] for operations, _, _ in failed]
+
+
+def delete_records(file_ids):
+    '''Delete the metadata of the files, return the file_ids left over'''
+    table_name = os.environ['FILE_SHARING_TABLE']
+    dynamodb = aws_clients.get_resource('dynamodb')
+    left_over = []
+    for file_ids_chunk in chunks(file_ids, BATCH_WRITE_SIZE):
+        request_items = {
+            table_name: [
+                {'DeleteRequest': {'Key': {'file_id': file_id}}}
+                for file_id in file_ids_chunk
+            ]
+        }
+        for attempt in range(MAX_ATTEMPTS):
+            response = dynamodb.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems')
+            if not request_items:
+                break
+            backoff(attempt)
+        else:
+            left_over.extend(
+                request['DeleteRequest']['Key']['file_id']
+                for request in request_items[table_name]
+            )
+    return left_over
+
+
+def restore_records(user_id, files):
+    '''Put back the records of files whose object could not be deleted'''
+    table = aws_clients.get_table(os.environ['FILE_SHARING_TABLE'])
+    for file_infos in files:
+        # Unless the file was uploaded again meanwhile
+        put = {'Item': file_infos, 'ConditionExpression': 'attribute_not_exists(file_id)'}
+        try:
+            if manifest.is_enabled():
+                is_listed = file_infos.get('file_status') != constants.FILE_STATUS_PENDING
+                manifest.write(
+                    user_id,
+                    [{'Put': put}],
+                    [manifest.build_entry(
+                        file_infos['file_id'],
+                        file_infos['file_name'],
+                        file_infos.get('file_size')
+                    )] if is_listed else []
+                )
+            else:
+                table.put_item(**put)
+        except Exception as error:
+            LOGGER.error('Cannot restore the record of %s: %s', file_infos['file_id'], error)
+
+
+def delete_all(user_id, files):
+    '''Delete the objects and the records of the files side by side
+
+    Return the object errors and the records left over, by file_id. The
+    records of the objects which could not be deleted are put back.
+    '''
+    files = list(files)
+    file_cache.invalidate(file_infos['file_id'] for file_infos in files)
+    with parallel.background(delete_objects, user_id, files) as objects_deleted:
+        if manifest.is_enabled():
+            record_errors = set(delete_listed_records(user_id, files))
+        else:
+            record_errors = set(delete_records([file_infos['file_id'] for file_infos in files]))
+    try:
+        object_errors = objects_deleted.result()
+    except Exception as error:
+        LOGGER.error(error)
+        object_errors = dict((file_infos['file_id'], 'Object not deleted') for file_infos in files)
+    restore_records(user_id, [
+        file_infos for file_infos in files
+        if file_infos['file_id'] in object_errors and file_infos['file_id'] not in record_errors
+    ])
+    return object_errors, record_errors
+
+
+def delete_files(user_id, file_ids=None):
+    '''Delete the given files, or all of them, and report each file'''
+    if file_ids is None:
+        owned_files = get_all_files(user_id)
+        file_ids = list(owned_files)
+    else:
+        file_ids = list(dict.fromkeys(file_ids))
+        owned_files = get_owned_files(user_id, file_ids)
+    object_errors, record_errors = delete_all(user_id, owned_files.values())
+    results = []
+    for file_id in file_ids:
+        result = {'file_id': file_id}
+        if file_id not in owned_files:
+            result['file_status'] = 'NOT_FOUND'
+        else:
+            result['file_name'] = owned_files[file_id]['file_name']
+            if file_id in object_errors:
+                result['file_status'] = 'FAILED'
+                result['error'] = object_errors[file_id]
+            elif file_id in record_errors:
+                result['file_status'] = 'FAILED'
+                result['error'] = 'Metadata not deleted, try again'
+            else:
+                result['file_status'] = 'DELETED'
+        results.append(result)
+    return results
@@ -1,39 +1,35 @@
 #! /usr/bin/env python
 '''Delete the given user file'''
 
-import os
-import sys
-import uuid
 import json
 import collections
-import base64
-from os.path import join, dirname
-import jwt
-import boto3
-import botocore
-from boto3.dynamodb.conditions import Key, Attr
 import constants
 import log
+import core
+import file_cache
+import metrics
+import jwt_verifier
+import batch_delete
 
 
 LOGGER = log.setup_logging()
 
 
+def check_inputs(req_body):
+    '''Validate inputs'''
+    return core.assert_valid_schema(req_body, constants.BATCH_DELETE_JSON_SCHEMA)
+
+
+def is_batch_delete(event):
+    '''Check if the request targets files:batchDelete'''
+    return event['path'].rstrip('/').endswith(':batchDelete')
+
+
 def is_file_owned_by_user(user_id, file_id):
     '''Check if the file is owned by the given user'''
-    client = boto3.client('dynamodb')
-    response = client.query(
-        TableName=os.environ['FILE_SHARING_TABLE'],
-        Select='ALL_ATTRIBUTES',
-        KeyConditionExpression = 'file_id=:file_id',
-        FilterExpression='user_id=:user_id',
-        ExpressionAttributeValues={
-            ':file_id': {'S':file_id},
-            ':user_id': {'S':user_id }
-        }
-    )
-    if len(response['Items']) > 0:
-        return True, response['Items'][0]
+    file_infos = file_cache.get_file(file_id)
+    if file_infos is not None and file_infos['user_id']['S'] == user_id:
+        return True, file_infos
     return False, None
 
 
@@ -49,64 +45,34 @@ def is_user_authorized(user_id, event):
     return True, file_infos
 
 
+def to_record(file_infos):
+    '''Turn a file record of the low level client into plain values'''
+    from boto3.dynamodb.types import TypeDeserializer
+    deserializer = TypeDeserializer()
+    return {name: deserializer.deserialize(value) for name, value in file_infos.items()}
+
+
 def delete_file(user_id, file_infos):
-    '''Delete the given file'''
+    '''Delete the given file, its object and its record side by side'''
     try:
-        s3_client = boto3.client('s3', os.getenv(constants.REGION))
-        s3_client.delete_object(
-            Bucket=os.environ['USER_FILES_BUCKET'],
-            Key=user_id+'/'+file_infos['file_name']['S']
-        )
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table(os.environ['FILE_SHARING_TABLE'])
-        response = table.delete_item(
-          Key={
-            'file_id': file_infos['file_id']['S']
-          },
-        )
+        record = to_record(file_infos)
+        object_errors, record_errors = batch_delete.delete_all(user_id, [record])
     except Exception as error:
         LOGGER.error(error)
         raise Exception('Internal server error')
+    if object_errors or record_errors:
+        # The record is back when the object is still there
+        LOGGER.error(object_errors or 'Record of {} not deleted'.format(record['file_id']))
+        raise Exception('Internal server error')
 
 
-def get_userinfo(claims, conf_values):
-    '''Get user infos'''
-    try:
-        cup_client = boto3.client('cognito-idp', conf_values['REGION'])
-        response = cup_client.admin_get_user(
-            UserPoolId=conf_values['COGNITO_USER_POOL_ID'],
-            Username=claims['cognito:username']
-        )
-        if 'Username' in response:
-            user_id = response['Username']
-        else:
-            user_id = None
-        email = None
-        name = None
-        print(response)
-        for attr in response['UserAttributes']:
-            if attr['Name'] == 'name':
-                name = attr['Value']
-            elif attr['Name'] == 'email':
-                email = attr['Value']
-            else:
-                pass
-        return user_id, name, email
-    except Exception as error:
-        raise Exception('Error: {}'.format(error))
-
-
-def get_claims(jwt_token):
-    '''Extract claims from the JWT token'''
+def delete_files(user_id, req_body):
+    '''Delete the given files, or all the user files'''
     try:
-        decode = jwt.decode(
-            jwt_token.split(' ')[1],
-            algorithms=['RS256'],
-            options={"verify_signature": False}
-        )
+        return batch_delete.delete_files(user_id, req_body.get('file_ids'))
     except Exception as error:
         LOGGER.error(error)
-    return decode
+        raise Exception('Internal server error')
 
 
 def build_api_response(user_id, file_infos):
@@ -119,68 +85,74 @@ def build_api_response(user_id, file_infos):
     return response_body
 
 
-def init_env_vars():
-    '''Get all environment variables'''
-    conf_values = {}
-    conf_values['REGION'] = os.getenv(constants.REGION)
-    conf_values['COGNITO_USER_POOL_ID'] = os.getenv(constants.COGNITO_USER_POOL_ID)
-    return conf_values
+def build_batch_api_response(user_id, results):
+    '''Build the API response of a batch delete'''
+    response_body = collections.OrderedDict()
+    response_body['user_id'] = user_id
+    response_body['deleted'] = sum(1 for result in results if result['file_status'] == 'DELETED')
+    response_body['failed'] = sum(1 for result in results if result['file_status'] == 'FAILED')
+    response_body['files'] = results
+    return response_body
+
+
+def build_http_response(status_code, response_body):
+    '''Wrap a response body for API Gateway'''
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(response_body),
+        'headers': {
+            'Content-Type' : 'application/json',
+            'Access-Control-Allow-Origin' : '*',
+            'Allow' : 'DELETE, POST, OPTIONS',
+            'Access-Control-Allow-Methods' : 'DELETE, POST, OPTIONS',
+            'Access-Control-Allow-Headers' : '*'
+        },
+        'isBase64Encoded': False,
+    }
 
 
+@metrics.instrument_handler('delete-user-file')
 def lambda_handler(event, _):
     '''Lambda entrypoint'''
     try:
-        conf_values = init_env_vars()
-        claims = get_claims(event['headers']['Authorization'])
-        user_id, name, email = get_userinfo(
+        conf_values = core.init_env_vars()
+        claims = core.get_claims(event['headers']['Authorization'], conf_values)
+        user_id, name, email = core.get_userinfo(
             claims,
             conf_values
         )
+        if is_batch_delete(event):
+            if event['path'].split('/')[3] != user_id:
+                return build_http_response(
+                    401,
+                    {'message': 'User not authorized to perform this action'}
+                )
+            req_body = json.loads(event['body'] or '{}')
+            is_payload_data_valid, errors = check_inputs(req_body)
+            if not is_payload_data_valid:
+                return build_http_response(400, {'message':errors[0], 'errors':errors})
+            results = delete_files(user_id, req_body)
+            response_body = build_batch_api_response(
+                user_id,
+                results
+            )
+            return build_http_response(200, response_body)
         is_authorized, file_infos = is_user_authorized(user_id, event)
         if not is_authorized: 
-            return {
-                'statusCode': 401,
-                'body': json.dumps(
-                    {'message': 'User not authorized to perform this action'}
-                ),
-                'headers': {
-                    'Content-Type' : 'application/json',
-                    'Access-Control-Allow-Origin' : '*',
-                    'Allow' : 'DELETE, OPTIONS',
-                    'Access-Control-Allow-Methods' : 'DELETE, OPTIONS',
-                    'Access-Control-Allow-Headers' : '*'
-                }
-            }
+            return build_http_response(
+                401,
+                {'message': 'User not authorized to perform this action'}
+            )
         delete_file(user_id, file_infos)
         response_body = build_api_response(
             user_id,
             file_infos
         )
-        return {
-            'statusCode': 200,
-            'body': json.dumps(response_body),
-            'headers': {
-                'Content-Type' : 'application/json',
-                'Access-Control-Allow-Origin' : '*',
-                'Allow' : 'DELETE, OPTIONS',
-                'Access-Control-Allow-Methods' : 'DELETE, OPTIONS',
-                'Access-Control-Allow-Headers' : '*'
-            },
-            'isBase64Encoded': False,
-        }
+        return build_http_response(200, response_body)
+    except jwt_verifier.InvalidTokenError as error:
+        LOGGER.warning(error)
+        return build_http_response(401, {'message': '{}'.format(error)})
     except Exception as error:
         err_msg = {'error_message': '{}'.format(error)}
         LOGGER.error(err_msg)
-        #TODO: Perform necessary rollback
-        return {
-            'statusCode': 400,
-            'body': json.dumps(err_msg),
-            'headers': {
-                'Content-Type' : 'application/json',
-                'Access-Control-Allow-Origin' : '*',
-                'Allow' : 'DELETE, OPTIONS',
-                'Access-Control-Allow-Methods' : 'DELETE, OPTIONS',
-                'Access-Control-Allow-Headers' : '*'
-            },
-            'isBase64Encoded': False,
-        }
+        return build_http_response(400, err_msg)
@@ -2,140 +2,238 @@
 '''Get user files'''
 
 import os
-import sys
-import uuid
 import json
 import collections
 import base64
-from os.path import join, dirname
-import jwt
-import boto3
-import botocore
-from boto3.dynamodb.conditions import Key, Attr
 import constants
 import log
+import core
+import aws_clients
+import metrics
+import jwt_verifier
+import manifest
 
 
 LOGGER = log.setup_logging()
 
 
-def get_user_files(user_id):
-    '''Get user files'''
+def encode_next_token(last_evaluated_key):
+    '''Turn the DynamoDB LastEvaluatedKey into an opaque cursor'''
+    if last_evaluated_key is None:
+        return None
+    return base64.urlsafe_b64encode(
+        json.dumps(last_evaluated_key, sort_keys=True).encode('utf-8')
+    ).decode('ascii')
+
+
+def decode_next_token(user_id, next_token):
+    '''Turn an opaque cursor back into a DynamoDB ExclusiveStartKey'''
+    try:
+        start_key = json.loads(base64.urlsafe_b64decode(next_token.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid next_token')
+    if not isinstance(start_key, dict) or \
+            set(start_key) != {'file_id', 'user_id', 'file_name'} or \
+            not all(isinstance(value, str) for value in start_key.values()) or \
+            start_key['user_id'] != user_id:
+        raise ValueError('Invalid next_token')
+    return start_key
+
+
+def get_page_params(user_id, event):
+    '''Read the limit and next_token query parameters'''
+    params = event.get('queryStringParameters') or {}
+    try:
+        limit = int(params.get('limit', constants.DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1 or limit > constants.MAX_PAGE_SIZE:
+        raise ValueError('limit must be between 1 and {}'.format(constants.MAX_PAGE_SIZE))
+    start_key = None
+    if params.get('next_token'):
+        start_key = decode_next_token(user_id, params['next_token'])
+    return limit, start_key
+
+
+def get_header(event, name):
+    '''Get a request header, whatever the case the client sent it with'''
+    for header, value in (event.get('headers') or {}).items():
+        if header.lower() == name:
+            return value
+    return None
+
+
+def get_listing_etag(manifest_item):
+    '''The ETag of the listing, which changes with every upload or delete, None without one
+
+    A complete manifest serves the files it was read with. The index is
+    only given one once it shows every change counted by the version.
+    '''
+    if manifest_item is None or 'epoch' not in manifest_item:
+        return None
+    if not manifest_item.get('complete') and not manifest.is_settled(manifest_item):
+        return None
+    return 'W/"{}-{}"'.format(manifest_item['epoch'], manifest_item.get('version', 0))
+
+
+def etag_matches(if_none_match, etag):
+    '''Weak comparison of the If-None-Match header against the current ETag'''
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Every page of a version is the same, a strong tag matches a weak one
+    opaque_tag = etag[2:]
+    return any(
+        candidate.strip()[2:] == opaque_tag if candidate.strip().startswith('W/')
+        else candidate.strip() == opaque_tag
+        for candidate in if_none_match.split(',')
+    )
+
+
+def get_manifest_page(user_id, files, limit, start_key=None):
+    '''Get one page of user files from the manifest entries, sorted as the index'''
+    if start_key is not None:
+        files = [entry for entry in files if entry['file_name'] > start_key['file_name']]
+    page = files[:limit]
+    next_token = None
+    if len(files) > limit:
+        # The same cursor as the index one, either can serve the next page
+        next_token = encode_next_token({
+            'file_id': page[-1]['file_id'],
+            'user_id': user_id,
+            'file_name': page[-1]['file_name']
+        })
+    return (
+        [{'file_id': entry['file_id'], 'file_name': entry['file_name']} for entry in page],
+        next_token
+    )
+
+
+def rebuild_manifest(user_id, manifest_item):
+    '''Try to list the user files in a complete manifest for the next requests'''
     try:
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table(os.environ['FILE_SHARING_TABLE'])
-        response = table.scan(FilterExpression=Attr('user_id').eq(user_id))
-        user_files = []
-        for user_file in response['Items']:
-            user_files.append(
-                {
-                    'file_id': user_file['file_id'],
-                    'file_name': user_file['file_name']
-                }
-            )
-        return user_files
+        if manifest.rebuild(user_id, manifest_item):
+            LOGGER.info('Manifest of %s rebuilt', user_id)
     except Exception as error:
-        LOGGER.error(error)
-        raise Exception('Internal server error')
+        LOGGER.warning('Cannot rebuild the manifest of %s: %s', user_id, error)
 
 
-def get_userinfo(claims, conf_values):
-    '''Get user infos'''
+def get_user_files(user_id, limit, start_key=None, manifest_head=None):
+    '''Get one page of user files, with its ETag when the listing has one'''
+    from boto3.dynamodb.conditions import Key, Attr
     try:
-        cup_client = boto3.client('cognito-idp', conf_values['REGION'])
-        response = cup_client.admin_get_user(
-            UserPoolId=conf_values['COGNITO_USER_POOL_ID'],
-            Username=claims['cognito:username']
+        manifest_item = manifest_head
+        if manifest_head is not None and manifest_head.get('complete'):
+            # The entries are only read once the version is known to differ
+            manifest_item = manifest.read(user_id)
+            files = manifest.list_files(manifest_item)
+            if files is not None:
+                user_files, next_token = get_manifest_page(user_id, files, limit, start_key)
+                return user_files, next_token, get_listing_etag(manifest_item)
+        table = aws_clients.get_table(os.environ['FILE_SHARING_TABLE'])
+        query_args = {
+            'IndexName': os.getenv(constants.USER_FILES_INDEX, constants.DEFAULT_USER_FILES_INDEX),
+            'KeyConditionExpression': Key('user_id').eq(user_id),
+            'FilterExpression': Attr('file_status').not_exists() |
+                                Attr('file_status').ne(constants.FILE_STATUS_PENDING),
+            'ProjectionExpression': 'file_id, file_name',
+            'Limit': limit
+        }
+        if start_key is not None:
+            query_args['ExclusiveStartKey'] = start_key
+        response = table.query(**query_args)
+        if manifest.is_enabled() and start_key is None:
+            rebuild_manifest(user_id, manifest_item)
+        # Read after the version: at worst newer files under an older ETag
+        return (
+            response['Items'],
+            encode_next_token(response.get('LastEvaluatedKey')),
+            get_listing_etag(manifest_item)
         )
-        if 'Username' in response:
-            user_id = response['Username']
-        else:
-            user_id = None
-        email = None
-        name = None
-        print(response)
-        for attr in response['UserAttributes']:
-            if attr['Name'] == 'name':
-                name = attr['Value']
-            elif attr['Name'] == 'email':
-                email = attr['Value']
-            else:
-                pass
-        return user_id, name, email
     except Exception as error:
-        raise Exception('Error: {}'.format(error))
+        LOGGER.error(error)
+        raise Exception('Internal server error')
 
 
-def get_claims(jwt_token):
-    '''Extract claims from the JWT token'''
+def read_manifest_head(user_id):
+    '''Get the version of the user listing, None without a manifest'''
+    if not manifest.is_enabled():
+        return None
     try:
-        decode = jwt.decode(
-            jwt_token.split(' ')[1],
-            algorithms=['RS256'],
-            options={"verify_signature": False}
-        )
+        return manifest.read_head(user_id)
     except Exception as error:
         LOGGER.error(error)
-    return decode
+        raise Exception('Internal server error')
 
 
-def build_api_response(user_id, user_files):
+def build_api_response(user_id, user_files, next_token=None):
     '''Build the API response'''
     response_body = collections.OrderedDict()
     response_body['user_id'] = user_id
-    response_body['user_files'] = []
-    for user_file in user_files:
-        response_body['user_files'].append(user_file)
+    # The page as the query returned it, no copy of the items
+    response_body['user_files'] = user_files
+    if next_token is not None:
+        response_body['next_token'] = next_token
     return response_body
 
 
-def init_env_vars():
-    '''Get all environment variables'''
-    conf_values = {}
-    conf_values['REGION'] = os.getenv(constants.REGION)
-    conf_values['COGNITO_USER_POOL_ID'] = os.getenv(constants.COGNITO_USER_POOL_ID)
-    return conf_values
+def build_http_response(status_code, response_body, etag=None):
+    '''Wrap a response body for API Gateway'''
+    response = {
+        'statusCode': status_code,
+        'body': json.dumps(response_body),
+        'headers': {
+            'Content-Type' : 'application/json',
+            'Access-Control-Allow-Origin' : '*',
+            'Allow' : 'GET, OPTIONS',
+            'Access-Control-Allow-Methods' : 'GET, OPTIONS',
+            'Access-Control-Allow-Headers' : '*'
+        },
+        'isBase64Encoded': False,
+    }
+    if etag is not None:
+        response['headers'].update({
+            'ETag': etag,
+            # Cached by the clients, but checked again on every request
+            'Cache-Control': 'private, no-cache',
+            'Access-Control-Expose-Headers': 'ETag'
+        })
+    if status_code == 304:
+        response['body'] = ''
+    return response
 
 
+@metrics.instrument_handler('get-user-files')
 def lambda_handler(event, _):
     '''Lambda entrypoint'''
     try:
-        conf_values = init_env_vars()
-        claims = get_claims(event['headers']['Authorization'])
-        user_id, name, email = get_userinfo(
+        conf_values = core.init_env_vars()
+        claims = core.get_claims(event['headers']['Authorization'], conf_values)
+        user_id, name, email = core.get_userinfo(
             claims,
             conf_values
         )
-        user_files = get_user_files(user_id)
+        try:
+            limit, start_key = get_page_params(user_id, event)
+        except ValueError as error:
+            return build_http_response(400, {'message': '{}'.format(error)})
+        # A conditional request is answered from the version alone
+        manifest_head = read_manifest_head(user_id)
+        etag = get_listing_etag(manifest_head)
+        if etag is not None and etag_matches(get_header(event, 'if-none-match'), etag):
+            return build_http_response(304, None, etag)
+        user_files, next_token, etag = get_user_files(user_id, limit, start_key, manifest_head)
         response_body = build_api_response(
             user_id,
-            user_files
+            user_files,
+            next_token
         )
-        return {
-            'statusCode': 200,
-            'body': json.dumps(response_body),
-            'headers': {
-                'Content-Type' : 'application/json',
-                'Access-Control-Allow-Origin' : '*',
-                'Allow' : 'GET, OPTIONS',
-                'Access-Control-Allow-Methods' : 'GET, OPTIONS',
-                'Access-Control-Allow-Headers' : '*'
-            },
-            'isBase64Encoded': False,
-        }
+        return build_http_response(200, response_body, etag)
+    except jwt_verifier.InvalidTokenError as error:
+        LOGGER.warning(error)
+        return build_http_response(401, {'message': '{}'.format(error)})
     except Exception as error:
         err_msg = {'error_message': '{}'.format(error)}
         LOGGER.error(err_msg)
-        #TODO: Perform necessary rollback
-        return {
-            'statusCode': 400,
-            'body': json.dumps(err_msg),
-            'headers': {
-                'Content-Type' : 'application/json',
-                'Access-Control-Allow-Origin' : '*',
-                'Allow' : 'GET, OPTIONS',
-                'Access-Control-Allow-Methods' : 'GET, OPTIONS',
-                'Access-Control-Allow-Headers' : '*'
-            },
-            'isBase64Encoded': False,
-        }
+        return build_http_response(400, err_msg)
@@ -0,0 +1,82 @@
+#! /usr/bin/env python
+'''Serve all the file routes from a single function'''
+
+import re
+import json
+import importlib
+import log
+
+
+LOGGER = log.setup_logging()
+
+# The endpoint module serving each method of each route
+ROUTES = [
+    ('/v1/users/{user_id}/files', {'GET': 'get_user_files', 'POST': 'upload_file'}),
+    ('/v1/users/{user_id}/files:batchUpload', {'POST': 'upload_file'}),
+    ('/v1/users/{user_id}/files:batchDelete', {'POST': 'delete_user_file'}),
+    ('/v1/users/{user_id}/files/{file_id}', {'DELETE': 'delete_user_file'}),
+    ('/v1/users/{user_id}/files/{file_id}/finalize', {'POST': 'upload_file'}),
+    ('/v1/users/{user_id}/files/{file_id}/share', {'POST': 'share_file'}),
+    ('/v1/users/{user_id}/uploads', {'POST': 'upload_file'}),
+    ('/v1/users/{user_id}/uploads/{upload_id}', {'GET': 'upload_file', 'DELETE': 'upload_file'}),
+    ('/v1/users/{user_id}/uploads/{upload_id}/complete', {'POST': 'upload_file'}),
+    ('/v1/users/{user_id}/uploads/{upload_id}/parts/{part_number}', {'PUT': 'upload_file'})
+]
+# The S3 notifications committing the direct to S3 uploads
+OBJECT_CREATED_MODULE = 'upload_file'
+
+
+def compile_route(route):
+    '''Turn a route template into a regular expression'''
+    return re.compile('^{}$'.format(re.sub(r'\\{\w+\\}', '[^/:]+', re.escape(route))))
+
+
+_ROUTES = [(compile_route(route), methods) for route, methods in ROUTES]
+
+
+def find_route(path):
+    '''Get the methods of the route matching a path, None if no route matches'''
+    path = path.rstrip('/')
+    for pattern, methods in _ROUTES:
+        if pattern.match(path):
+            return methods
+    return None
+
+
+def get_handler(module_name):
+    '''Import an endpoint on its first request, the others are never loaded'''
+    return importlib.import_module(module_name).lambda_handler
+
+
+def build_http_response(status_code, response_body, allowed_methods):
+    '''Wrap a response body for API Gateway'''
+    allow = ', '.join(sorted(allowed_methods) + ['OPTIONS'])
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(response_body),
+        'headers': {
+            'Content-Type' : 'application/json',
+            'Access-Control-Allow-Origin' : '*',
+            'Allow' : allow,
+            'Access-Control-Allow-Methods' : allow,
+            'Access-Control-Allow-Headers' : '*'
+        },
+        'isBase64Encoded': False,
+    }
+
+
+def lambda_handler(event, context):
+    '''Lambda entrypoint'''
+    if 'Records' in event:
+        return get_handler(OBJECT_CREATED_MODULE)(event, context)
+    methods = find_route(event.get('path') or '')
+    if methods is None:
+        return build_http_response(404, {'message': 'Not found'}, [])
+    method = event.get('httpMethod')
+    if method == 'OPTIONS':
+        return build_http_response(200, {}, methods)
+    if method not in methods:
+        LOGGER.warning('%s not allowed on %s', method, event['path'])
+        return build_http_response(405, {'message': 'Method not allowed'}, methods)
+    # Each endpoint times and reports its own invocation
+    return get_handler(methods[method])(event, context)
@@ -0,0 +1,127 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''File-like reader decoding a base64 string on the fly'''
+
+import io
+import base64
+import hashlib
+import binascii
+import collections
+
+
+_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/='
+# Like base64.b64decode, silently drop the characters outside the alphabet
+_NON_ALPHABET = bytes(set(range(256)) - set(_ALPHABET))
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class Base64Reader(io.RawIOBase):
+    '''Decode a base64 string chunk by chunk while it is being read
+
+    Only one decoded chunk is held at a time, so the decoded file never
+    exists as a whole in memory nor on disk.
+    '''
+
+    def __init__(self, encoded, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        self._encoded = encoded
+        self._position = 0
+        # Encoded chunks must be a multiple of 4 characters to decode alone
+        self._chunk_size = max(4, chunk_size - chunk_size % 4)
+        self._carry = b''
+        self._decoded = memoryview(b'')
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._offset
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        '''Rewind to the start, as botocore does before it retries a request
+
+        seekable() stays False: s3transfer streams the reader instead of
+        seeking to its parts.
+        '''
+        if whence == io.SEEK_CUR and offset == 0:
+            return self._offset
+        if whence != io.SEEK_SET or offset != 0:
+            raise io.UnsupportedOperation('A Base64Reader can only be rewound')
+        self._position = 0
+        self._carry = b''
+        self._decoded = memoryview(b'')
+        self._offset = 0
+        return 0
+
+    def _next_chunk(self):
+        '''Decode the next chunk of the encoded string'''
+        while self._position < len(self._encoded):
+            chunk = self._encoded[self._position:self._position + self._chunk_size]
+            self._position += self._chunk_size
+            if isinstance(chunk, str):
+                chunk = chunk.encode('ascii')
+            chunk = self._carry + chunk.translate(None, _NON_ALPHABET)
+            if self._position >= len(self._encoded):
+                self._carry = b''
+            else:
+                split = len(chunk) - len(chunk) % 4
+                chunk, self._carry = chunk[:split], chunk[split:]
+            if chunk:
+                return binascii.a2b_base64(chunk)
+        return b''
+
+    def readinto(self, buffer):
+        if not self._decoded:
+            self._decoded = memoryview(self._next_chunk())
+            if not self._decoded:
+                return 0
+        size = min(len(buffer), len(self._decoded))
+        buffer[:size] = self._decoded[:size]
+        self._decoded = self._decoded[size:]
+        self._offset += size
+        return size
+
+    def read(self, size=-1):
+        # s3transfer takes a short read for the end of the stream, so keep
+        # decoding chunks until the requested size is reached
+        if size is None or size < 0:
+            return self.readall()
+        data = bytearray()
+        while len(data) < size:
+            chunk = super().read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
+
+def open_data(file_data, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''Read a file given either base64 encoded or as raw bytes'''
+    if isinstance(file_data, (bytes, bytearray)):
+        return io.BytesIO(file_data)
+    return Base64Reader(file_data, chunk_size)
+
+
+Digest = collections.namedtuple('Digest', ['sha256', 'sha256_base64', 'md5_base64', 'size'])
+
+
+def digest(file_data, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''Hash the decoded content of a file, one chunk at a time'''
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    size = 0
+    reader = open_data(file_data, chunk_size)
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            break
+        sha256.update(chunk)
+        md5.update(chunk)
+        size += len(chunk)
+    return Digest(
+        sha256.hexdigest(),
+        base64.b64encode(sha256.digest()).decode('ascii'),
+        base64.b64encode(md5.digest()).decode('ascii'),
+        size
+    )
@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Upload many files of a user at once'''
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import constants
+import b64_stream
+import file_records
+import s3_objects
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def upload_object(user_id, new_file, conf_values, transfer_config):
+    '''Upload one file of the batch, build its record and find the ones it replaces'''
+    try:
+        file_digest = b64_stream.digest(new_file['file_data'], conf_values['DECODE_CHUNK_SIZE'])
+        previous_uploads = file_records.get_previous_uploads(
+            user_id,
+            new_file['remote_file_name']
+        )
+        same_file_id = file_records.find_same_content(previous_uploads, file_digest)
+        if same_file_id is not None:
+            return {
+                'file_id': same_file_id,
+                'file_name': new_file['remote_file_name'],
+                'file_status': constants.FILE_STATUS_UPLOADED,
+                'deduplicated': True
+            }, None, []
+        content_encoding = s3_objects.store_object(
+            user_id+'/'+new_file['remote_file_name'],
+            new_file['file_data'],
+            file_digest,
+            conf_values,
+            transfer_config
+        )
+    except Exception as error:
+        LOGGER.error(error)
+        return {
+            'file_name': new_file['remote_file_name'],
+            'file_status': 'FAILED',
+            'error': 'Upload failed'
+        }, None, []
+    item = {
+        'file_id': file_records.build_file_id(user_id, new_file['remote_file_name']),
+        'file_name': new_file['remote_file_name'],
+        'user_id': user_id,
+        'file_status': constants.FILE_STATUS_UPLOADED,
+        'content_sha256': file_digest.sha256,
+        'file_size': file_digest.size
+    }
+    if content_encoding is not None:
+        item['content_encoding'] = content_encoding
+    return {
+        'file_id': item['file_id'],
+        'file_name': item['file_name'],
+        'file_status': item['file_status']
+    }, item, [previous['file_id'] for previous in previous_uploads]
+
+
+def upload_files(user_id, new_files, conf_values, transfer_config):
+    '''Upload the files concurrently, then write their records in batches'''
+    max_workers = max(1, min(len(new_files), conf_values['BATCH_UPLOAD_MAX_WORKERS']))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        uploads = list(executor.map(
+            lambda new_file: upload_object(user_id, new_file, conf_values, transfer_config),
+            new_files
+        ))
+    not_written = file_records.write_uploads(user_id, [
+        (item, previous_file_ids)
+        for _, item, previous_file_ids in uploads
+        # None when failed, or deduplicated with nothing to write
+        if item is not None
+    ])
+    for _, item, previous_file_ids in uploads:
+        if item is not None and item['file_id'] in not_written and not previous_file_ids:
+            s3_objects.discard_object(user_id+'/'+item['file_name'], conf_values)
+    results = []
+    for result, _, _ in uploads:
+        if result.get('file_id') in not_written:
+            result = {
+                'file_name': result['file_name'],
+                'file_status': 'FAILED',
+                'error': 'Metadata not written, try again'
+            }
+        results.append(result)
+    return results
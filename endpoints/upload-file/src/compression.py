@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Gzip the compressible files before they are stored'''
+
+import io
+import zlib
+import os.path
+import mimetypes
+
+
+CONTENT_ENCODING = 'gzip'
+# Gzip container, see zlib.compressobj
+GZIP_WBITS = 31
+COMPRESSION_LEVEL = 6
+# The trial compression only looks at the beginning of the file
+SAMPLE_SIZE = 64 * 1024
+TRIAL_COMPRESSION_LEVEL = 1
+INCOMPRESSIBLE_EXTENSIONS = frozenset([
+    '.7z', '.aac', '.avi', '.br', '.bz2', '.docx', '.flac', '.gif', '.gz',
+    '.heic', '.jpeg', '.jpg', '.m4a', '.mkv', '.mov', '.mp3', '.mp4', '.ogg',
+    '.png', '.pptx', '.rar', '.tgz', '.webm', '.webp', '.xlsx', '.xz', '.zip',
+    '.zst'
+])
+# Magic numbers of the formats which are already compressed
+COMPRESSED_SIGNATURES = (
+    b'\x1f\x8b',            # gzip
+    b'PK\x03\x04',          # zip, docx, xlsx, jar...
+    b'\x89PNG',             # png
+    b'\xff\xd8\xff',        # jpeg
+    b'GIF8',                # gif
+    b'BZh',                 # bzip2
+    b'\xfd7zXZ\x00',        # xz
+    b'7z\xbc\xaf\x27\x1c',  # 7z
+    b'Rar!',                # rar
+    b'\x28\xb5\x2f\xfd',    # zstd
+    b'OggS',                # ogg
+    b'fLaC'                 # flac
+)
+
+
+def is_compressed_format(sample):
+    '''Check the magic number of the file against the compressed formats'''
+    if sample.startswith(COMPRESSED_SIGNATURES):
+        return True
+    # The ISO media files (mp4, mov, heic...) start with their box size
+    return sample[4:8] == b'ftyp'
+
+
+def should_compress(file_name, sample, min_size, max_ratio):
+    '''Tell if gzip is worth it, from the name and the first bytes of a file'''
+    if len(sample) < min_size:
+        return False
+    if os.path.splitext(file_name)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return False
+    if is_compressed_format(sample):
+        return False
+    compressed = zlib.compress(sample[:SAMPLE_SIZE], TRIAL_COMPRESSION_LEVEL)
+    return len(compressed) <= len(sample[:SAMPLE_SIZE]) * max_ratio
+
+
+def guess_content_type(file_name):
+    '''The type of the decoded content, served along the Content-Encoding'''
+    content_type, _ = mimetypes.guess_type(file_name, strict=False)
+    return content_type or 'application/octet-stream'
+
+
+class GzipReader(io.RawIOBase):
+    '''Gzip a readable stream while it is being read'''
+
+    def __init__(self, source, chunk_size):
+        super().__init__()
+        self._source = source
+        self._chunk_size = chunk_size
+        self._compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+        self._buffer = bytearray()
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _fill(self, size):
+        '''Compress the source until size bytes are ready or it is exhausted'''
+        while len(self._buffer) < size and not self._eof:
+            chunk = self._source.read(self._chunk_size)
+            if chunk:
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self._fill(float('inf'))
+            size = len(self._buffer)
+        else:
+            self._fill(size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
@@ -1,8 +0,0 @@
-#! /usr/bin/env python
-# coding:utf-8
-'''Just a constants values'''
-
-REGION = 'eu-west-1'
-SCHEMAS_FOLDER = 'schemas'
-NEW_FILE_JSON_SCHEMA = 'new_file.json'
-COGNITO_USER_POOL_ID = 'COGNITO_USER_POOL_ID'
@@ -0,0 +1,180 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Helpers around the file records of the DynamoDB table'''
+
+import os
+import time
+import uuid
+import logging
+import constants
+import aws_clients
+import manifest
+import file_cache
+
+
+# Every upload mode stores a file under an id derived from its user and name
+FILE_ID_NAMESPACE = uuid.UUID('6f1c2b8e-3d4a-5e9f-8a7b-0c1d2e3f4a5b')
+BATCH_WRITE_SIZE = 25
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05
+
+LOGGER = logging.getLogger(__name__)
+
+
+def build_file_id(user_id, file_name):
+    '''The file id of a name, the same every time the user uploads it'''
+    return str(uuid.uuid5(FILE_ID_NAMESPACE, '{}/{}'.format(user_id, file_name)))
+
+
+def get_previous_uploads(user_id, file_name):
+    '''Get the uploaded records of a file name'''
+    # The low level client is thread safe, unlike the table resource
+    client = aws_clients.get_client('dynamodb')
+    response = client.query(
+        TableName=os.environ['FILE_SHARING_TABLE'],
+        IndexName=os.getenv(constants.USER_FILES_INDEX, constants.DEFAULT_USER_FILES_INDEX),
+        KeyConditionExpression='user_id = :user_id AND file_name = :file_name',
+        FilterExpression='attribute_not_exists(file_status) OR file_status <> :pending',
+        ProjectionExpression='file_id, content_sha256',
+        ExpressionAttributeValues={
+            ':user_id': {'S': user_id},
+            ':file_name': {'S': file_name},
+            ':pending': {'S': constants.FILE_STATUS_PENDING}
+        }
+    )
+    return [
+        {
+            'file_id': item['file_id']['S'],
+            'content_sha256': item.get('content_sha256', {}).get('S')
+        }
+        for item in response['Items']
+    ]
+
+
+def find_same_content(previous_uploads, file_digest):
+    '''Get the id of a previous upload with the same content, if any'''
+    for previous in previous_uploads:
+        if previous['content_sha256'] == file_digest.sha256:
+            return previous['file_id']
+    return None
+
+
+def build_upload_operations(item, previous_file_ids):
+    '''The transaction items storing an upload in place of the previous ones'''
+    return [{'Put': {'Item': item}}] + [
+        {'Delete': {'Key': {'file_id': previous_file_id}}}
+        for previous_file_id in previous_file_ids
+        # Overwritten in place by the Put
+        if previous_file_id != item['file_id']
+    ]
+
+
+def build_manifest_entry(item):
+    '''The manifest entry of an uploaded file record'''
+    return manifest.build_entry(item['file_id'], item['file_name'], item.get('file_size'), time.time())
+
+
+def write_operations(item, operations, previous_file_ids):
+    '''Write the operations storing an upload, with its manifest entry'''
+    if manifest.is_enabled():
+        manifest.write(
+            item['user_id'],
+            operations,
+            [build_manifest_entry(item)],
+            previous_file_ids
+        )
+        return
+    table_name = os.environ['FILE_SHARING_TABLE']
+    if len(operations) == 1:
+        aws_clients.get_table(table_name).put_item(Item=item)
+        return
+    # The records written before the file ids were stable go along
+    aws_clients.get_client('dynamodb').transact_write_items(TransactItems=[
+        manifest.to_transact_item(operation, table_name) for operation in operations
+    ])
+
+
+def write_upload(item, previous_file_ids):
+    '''Store the record of an upload, replacing the previous ones of its file name'''
+    file_cache.invalidate([item['file_id']] + list(previous_file_ids))
+    write_operations(item, build_upload_operations(item, previous_file_ids), previous_file_ids)
+
+
+def write_uploads(user_id, uploads):
+    '''Store the records of many uploads, return the file ids not written'''
+    file_cache.invalidate(
+        file_id for item, previous_file_ids in uploads for file_id in [item['file_id']] + list(previous_file_ids)
+    )
+    if manifest.is_enabled():
+        failed = manifest.write_all(user_id, [
+            (
+                build_upload_operations(item, previous_file_ids),
+                [build_manifest_entry(item)],
+                previous_file_ids
+            )
+            for item, previous_file_ids in uploads
+        ])
+        return set(operations[0]['Put']['Item']['file_id'] for operations, _, _ in failed)
+    requests = []
+    for item, previous_file_ids in uploads:
+        requests.append({'PutRequest': {'Item': item}})
+        for previous_file_id in previous_file_ids:
+            if previous_file_id != item['file_id']:
+                requests.append({'DeleteRequest': {'Key': {'file_id': previous_file_id}}})
+    return set(
+        request['PutRequest']['Item']['file_id']
+        for request in batch_write(requests) if 'PutRequest' in request
+    )
+
+
+def commit_upload(file_infos, file_size):
+    '''Store a pending file under the file id of its name, return its record, None if it already was'''
+    item = {
+        'file_id': build_file_id(file_infos['user_id'], file_infos['file_name']),
+        'file_name': file_infos['file_name'],
+        'user_id': file_infos['user_id'],
+        'file_status': constants.FILE_STATUS_UPLOADED
+    }
+    if file_size is not None:
+        item['file_size'] = int(file_size)
+    previous_file_ids = [
+        previous['file_id']
+        for previous in get_previous_uploads(file_infos['user_id'], file_infos['file_name'])
+    ]
+    operations = [{'Update': {
+        'Key': {'file_id': file_infos['file_id']},
+        # The pending record leads the late finalize calls and S3 events to the file
+        'UpdateExpression': 'SET committed_file_id = :file_id',
+        'ConditionExpression': 'file_status = :pending AND attribute_not_exists(committed_file_id)',
+        'ExpressionAttributeValues': {
+            ':file_id': item['file_id'],
+            ':pending': constants.FILE_STATUS_PENDING
+        }
+    }}] + build_upload_operations(item, previous_file_ids)
+    file_cache.invalidate([item['file_id']] + previous_file_ids)
+    client = aws_clients.get_client('dynamodb')
+    try:
+        write_operations(item, operations, previous_file_ids)
+    except client.exceptions.TransactionCanceledException as error:
+        if error.response.get('CancellationReasons', [{}])[0].get('Code') != 'ConditionalCheckFailed':
+            raise
+        return None
+    return item
+
+
+def batch_write(requests):
+    '''Write the put and delete requests, return the ones left over'''
+    table_name = os.environ['FILE_SHARING_TABLE']
+    dynamodb = aws_clients.get_resource('dynamodb')
+    left_over = []
+    for index in range(0, len(requests), BATCH_WRITE_SIZE):
+        request_items = {table_name: requests[index:index + BATCH_WRITE_SIZE]}
+        for attempt in range(MAX_ATTEMPTS):
+            response = dynamodb.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems')
+            if not request_items:
+                break
+            time.sleep(RETRY_BASE_DELAY * 2 ** attempt)
+        else:
+            left_over.extend(request_items[table_name])
+    return left_over
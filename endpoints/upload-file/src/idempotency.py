@@ -0,0 +1,119 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Replay the response of an upload to the retries sharing its Idempotency-Key
+
+The first request with a key locks it in the idempotency table, then
+stores its response there once the upload is done. A retry gets that
+response back without storing the file again, a concurrent one is refused
+while the lock is held.
+'''
+
+import os
+import json
+import time
+import hashlib
+import logging
+import constants
+import aws_clients
+
+
+IDEMPOTENCY_KEY_HEADER = 'idempotency-key'
+MAX_KEY_LENGTH = 255
+# The longest a Lambda function runs, a lock is abandoned past it
+LOCK_TIMEOUT = 900
+STATUS_IN_PROGRESS = 'IN_PROGRESS'
+STATUS_COMPLETED = 'COMPLETED'
+
+LOGGER = logging.getLogger(__name__)
+
+
+class IdempotencyError(Exception):
+    '''The request can not run under its Idempotency-Key'''
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_enabled():
+    '''The responses are kept when the idempotency table is configured'''
+    return bool(os.getenv(constants.IDEMPOTENCY_TABLE))
+
+
+def get_idempotency_table():
+    '''The DynamoDB table of the idempotency keys'''
+    return aws_clients.get_table(os.environ[constants.IDEMPOTENCY_TABLE])
+
+
+def fingerprint(*parts):
+    '''Tell a retry from another request reusing its key'''
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def build_record_key(user_id, key):
+    '''The keys of different users never collide'''
+    return '{}/{}'.format(user_id, key)
+
+
+def start(user_id, key, request_hash):
+    '''Lock the key for this request, return the response of a previous one if any'''
+    if len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError('Idempotency-Key must be at most {} characters'.format(MAX_KEY_LENGTH), 400)
+    table = get_idempotency_table()
+    record_key = build_record_key(user_id, key)
+    now = int(time.time())
+    try:
+        table.put_item(
+            Item={
+                'idempotency_key': record_key,
+                'record_status': STATUS_IN_PROGRESS,
+                'request_hash': request_hash,
+                'expires_at': now + LOCK_TIMEOUT
+            },
+            # DynamoDB TTL drops the expired records within days, not at once
+            ConditionExpression='attribute_not_exists(idempotency_key) OR expires_at < :now',
+            ExpressionAttributeValues={':now': now}
+        )
+        return None
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
+    record = table.get_item(Key={'idempotency_key': record_key}, ConsistentRead=True).get('Item')
+    if record is not None and record['request_hash'] != request_hash:
+        raise IdempotencyError('Idempotency-Key already used by another request', 422)
+    if record is None or record['record_status'] != STATUS_COMPLETED:
+        raise IdempotencyError('A request with this Idempotency-Key is in progress', 409)
+    LOGGER.info('Replaying the response of %s', record_key)
+    return int(record['status_code']), json.loads(record['response_body'])
+
+
+def complete(user_id, key, status_code, response_body, ttl):
+    '''Keep the response of the request for its retries'''
+    try:
+        get_idempotency_table().update_item(
+            Key={'idempotency_key': build_record_key(user_id, key)},
+            UpdateExpression='SET record_status = :completed, status_code = :status_code, '
+                             'response_body = :response_body, expires_at = :expires_at',
+            ExpressionAttributeValues={
+                ':completed': STATUS_COMPLETED,
+                ':status_code': status_code,
+                # A string keeps the order of the keys, and no Decimal comes back
+                ':response_body': json.dumps(response_body),
+                ':expires_at': int(time.time()) + ttl
+            }
+        )
+    except Exception as error:
+        # The upload is done, its retries will run it again
+        LOGGER.error(error)
+        release(user_id, key)
+
+
+def release(user_id, key):
+    '''Unlock the key of a request that failed, so that it can be retried'''
+    try:
+        get_idempotency_table().delete_item(Key={'idempotency_key': build_record_key(user_id, key)})
+    except Exception as error:
+        LOGGER.error(error)
@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Read the files sent as a raw binary or a multipart/form-data body'''
+
+import base64
+import email.parser
+import email.policy
+from urllib.parse import unquote
+
+
+OCTET_STREAM = 'application/octet-stream'
+FORM_DATA = 'multipart/form-data'
+FILE_NAME_HEADER = 'x-file-name'
+FILE_NAME_PARAMETER = 'file_name'
+FILE_NAME_FIELD = 'remote_file_name'
+
+
+class InvalidBodyError(Exception):
+    '''The raw or multipart/form-data body can not be read, or not on this route'''
+
+
+def get_header(event, name):
+    '''Get a request header, whatever the case the client sent it with'''
+    for header, value in (event.get('headers') or {}).items():
+        if header.lower() == name:
+            return value
+    return None
+
+
+def get_content_type(event):
+    '''The media type of the request body, without its parameters'''
+    content_type = get_header(event, 'content-type') or ''
+    return content_type.split(';')[0].strip().lower()
+
+
+def is_raw_upload(event):
+    '''Check if the file is the request body rather than a JSON field'''
+    return get_content_type(event) in (OCTET_STREAM, FORM_DATA)
+
+
+def get_file_name(event):
+    '''The file name given in the X-File-Name header or the query string'''
+    file_name = get_header(event, FILE_NAME_HEADER)
+    if file_name:
+        # Headers are ASCII, the non-ASCII names are percent-encoded
+        return unquote(file_name)
+    return (event.get('queryStringParameters') or {}).get(FILE_NAME_PARAMETER)
+
+
+def parse_form_data(content_type, body):
+    '''Get the file and its name out of a multipart/form-data body'''
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body
+    )
+    if not message.is_multipart():
+        raise InvalidBodyError('Invalid multipart/form-data body')
+    file_data = None
+    file_name = None
+    for part in message.iter_parts():
+        field = part.get_param('name', header='content-disposition')
+        if part.get_filename() is not None and file_data is None:
+            file_data = part.get_payload(decode=True) or b''
+            file_name = file_name or part.get_filename()
+        elif field == FILE_NAME_FIELD:
+            file_name = part.get_payload(decode=True).decode('utf-8')
+    if file_data is None:
+        raise InvalidBodyError('No file found in the multipart/form-data body')
+    return file_name, file_data
+
+
+def parse_upload(event):
+    '''Build the upload request out of a raw or multipart/form-data body
+
+    With the binary media types enabled, API Gateway hands the body over
+    base64 encoded: it is then streamed as is, without any copy.
+    '''
+    body = event.get('body') or ''
+    file_name = get_file_name(event)
+    if get_content_type(event) == FORM_DATA:
+        if event.get('isBase64Encoded'):
+            body = base64.b64decode(body)
+        elif isinstance(body, str):
+            body = body.encode('utf-8')
+        form_file_name, file_data = parse_form_data(get_header(event, 'content-type'), body)
+        file_name = file_name or form_file_name
+    elif event.get('isBase64Encoded'):
+        file_data = body
+    else:
+        file_data = body.encode('utf-8')
+    return {
+        'file_data': file_data,
+        'remote_file_name': file_name
+    }
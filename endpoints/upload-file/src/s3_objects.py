@@ -0,0 +1,107 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Store the uploaded files in S3 with integrity checks'''
+
+import os
+import logging
+import constants
+import aws_clients
+import b64_stream
+import compression
+
+
+SHA256_METADATA = 'sha256'
+SIZE_METADATA = 'decoded-size'
+
+LOGGER = logging.getLogger(__name__)
+
+
+def is_compressible(file_key, file_data, conf_values):
+    '''Trial compress the beginning of the file when compression is enabled'''
+    if not conf_values['COMPRESS_UPLOADS']:
+        return False
+    reader = b64_stream.open_data(file_data, conf_values['DECODE_CHUNK_SIZE'])
+    return compression.should_compress(
+        file_key,
+        reader.read(compression.SAMPLE_SIZE),
+        conf_values['COMPRESSION_MIN_SIZE'],
+        conf_values['COMPRESSION_MAX_RATIO']
+    )
+
+
+def store_object(file_key, file_data, file_digest, conf_values, transfer_config):
+    '''Stream a file to S3 and let S3 check its checksums
+
+    Return the Content-Encoding the file is stored with, None if it is
+    stored as is.
+    '''
+    s3_client = aws_clients.get_client('s3', conf_values['REGION'])
+    reader = b64_stream.open_data(file_data, conf_values['DECODE_CHUNK_SIZE'])
+    extra_args = {'Metadata': {SHA256_METADATA: file_digest.sha256}}
+    content_encoding = None
+    if is_compressible(file_key, file_data, conf_values):
+        content_encoding = compression.CONTENT_ENCODING
+        reader = compression.GzipReader(reader, conf_values['DECODE_CHUNK_SIZE'])
+        # Downloads are decoded by the client, they need the real type
+        extra_args['ContentEncoding'] = content_encoding
+        extra_args['ContentType'] = compression.guess_content_type(file_key)
+        extra_args['Metadata'][SIZE_METADATA] = str(file_digest.size)
+    if content_encoding is None and file_digest.size <= conf_values['UPLOAD_PART_SIZE']:
+        # Streamed while it is decoded, with the size and digests of the
+        # first pass, so the decoded file is never held whole. S3 checks both.
+        s3_client.put_object(
+            Bucket=os.environ['USER_FILES_BUCKET'],
+            Key=file_key,
+            Body=reader,
+            ContentLength=file_digest.size,
+            ContentMD5=file_digest.md5_base64,
+            ChecksumSHA256=file_digest.sha256_base64,
+            **extra_args
+        )
+        return content_encoding
+    # The gzipped size is only known once compressed: like the multipart
+    # uploads, these go through s3transfer one part at a time, with a
+    # SHA-256 checksum per part
+    extra_args['ChecksumAlgorithm'] = 'SHA256'
+    s3_client.upload_fileobj(
+        reader,
+        os.environ['USER_FILES_BUCKET'],
+        file_key,
+        ExtraArgs=extra_args,
+        Config=transfer_config
+    )
+    return content_encoding
+
+
+def build_pending_key(user_id, file_id):
+    '''The key a direct upload is staged under, apart from the live object of its file name'''
+    return constants.PENDING_UPLOADS_PREFIX+user_id+'/'+file_id
+
+
+def parse_pending_key(file_key):
+    '''Get the file id of a staged upload, None for the other keys'''
+    if not file_key.startswith(constants.PENDING_UPLOADS_PREFIX):
+        return None
+    return file_key.rsplit('/', 1)[-1]
+
+
+def copy_object(source_key, file_key, region=None):
+    '''Copy a staged upload in place of the live object of its file name'''
+    bucket_name = os.environ['USER_FILES_BUCKET']
+    # Managed copy: past the CopyObject size limit, it is copied part by part
+    aws_clients.get_client('s3', region).copy(
+        {'Bucket': bucket_name, 'Key': source_key},
+        bucket_name,
+        file_key
+    )
+
+
+def discard_object(file_key, conf_values):
+    '''Roll back the upload of an object whose record could not be written'''
+    try:
+        aws_clients.get_client('s3', conf_values['REGION']).delete_object(
+            Bucket=os.environ['USER_FILES_BUCKET'],
+            Key=file_key
+        )
+    except Exception as error:
+        LOGGER.error('Cannot roll back %s: %s', file_key, error)
@@ -2,197 +2,593 @@
 '''Upload a new file'''
 
 import os
-import sys
 import uuid
 import json
 import collections
-import base64
-from os.path import join, dirname
-from jsonschema import validate
-import jsonschema
-import jwt
-import boto3
-import botocore
-from boto3.dynamodb.conditions import Key, Attr
+import time
+from urllib.parse import unquote_plus
 import constants
 import log
+import core
+import aws_clients
+import metrics
+import jwt_verifier
+import b64_stream
+import file_records
+import idempotency
+import batch_upload
+import s3_objects
+import parallel
+import raw_upload
+import upload_sessions
 
 
 LOGGER = log.setup_logging()
 
 
-def _load_json_schema(filename):
-    ''' Loads the given schema file '''
+def is_presigned_upload(req_body):
+    '''Check if the client asked for a direct to S3 upload'''
+    return isinstance(req_body, dict) and 'upload_mode' in req_body
 
-    relative_path = join(constants.SCHEMAS_FOLDER, filename)
-    absolute_path = join(dirname(__file__), relative_path)
 
-    with open(absolute_path) as schema_file:
-        return json.loads(schema_file.read())
+def is_batch_upload(event):
+    '''Check if the request targets files:batchUpload'''
+    return event['path'].rstrip('/').endswith(':batchUpload')
 
 
-def assert_valid_schema(data, schema_file):
-    ''' Checks whether the given data matches the schema '''
-
-    schema = _load_json_schema(schema_file)
-    try:
-        validate(data, schema)
-        return True, None
-    except jsonschema.exceptions.ValidationError as error:
-        return False, error.message
+def check_batch_inputs(req_body):
+    '''Validate the inputs of a batch upload'''
+    is_valid, errors = core.assert_valid_schema(req_body, constants.NEW_FILES_JSON_SCHEMA)
+    if not is_valid:
+        return is_valid, errors
+    file_names = set()
+    for new_file in req_body['files']:
+        if new_file['remote_file_name'] in file_names:
+            return False, ['Duplicate remote_file_name: {}'.format(new_file['remote_file_name'])]
+        file_names.add(new_file['remote_file_name'])
+    return True, None
 
 
 def check_inputs(req_body):
     '''Validate inputs'''
-    return assert_valid_schema(req_body, constants.NEW_FILE_JSON_SCHEMA)
+    if is_presigned_upload(req_body):
+        return core.assert_valid_schema(req_body, constants.NEW_UPLOAD_URL_JSON_SCHEMA)
+    return core.assert_valid_schema(req_body, constants.NEW_FILE_JSON_SCHEMA)
+
+
+def is_upload_session(event):
+    '''Check if the request targets the resumable uploads'''
+    return event['path'].rstrip('/').split('/')[4:5] == ['uploads']
+
+
+def check_raw_inputs(req_body):
+    '''Validate the inputs of a raw or multipart/form-data upload'''
+    if not req_body['remote_file_name']:
+        return False, ['Missing file name: set the X-File-Name header or the {} query parameter'.format(
+            raw_upload.FILE_NAME_PARAMETER
+        )]
+    return True, None
+
+
+def read_upload_request(event):
+    '''Read and validate the body of an upload, return it with its errors'''
+    if raw_upload.is_raw_upload(event):
+        if is_batch_upload(event):
+            raise raw_upload.InvalidBodyError('A batch upload takes a JSON body')
+        req_body = raw_upload.parse_upload(event)
+        return req_body, check_raw_inputs(req_body)[1]
+    req_body = json.loads(event['body'])
+    if is_batch_upload(event):
+        return req_body, check_batch_inputs(req_body)[1]
+    return req_body, check_inputs(req_body)[1]
+
+
+def build_transfer_config(conf_values, max_concurrency=None):
+    '''Keep the upload memory bounded to a few parts'''
+    if max_concurrency is None:
+        max_concurrency = conf_values['UPLOAD_MAX_CONCURRENCY']
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=conf_values['UPLOAD_PART_SIZE'],
+        multipart_chunksize=conf_values['UPLOAD_PART_SIZE'],
+        max_concurrency=max_concurrency,
+        use_threads=max_concurrency > 1
+    )
 
 
 def upload_file(user_id, req_body, conf_values):
     '''Upload a new file'''
     try:
-        bucket_name = os.environ['USER_FILES_BUCKET']
-        decoded_file = base64.b64decode(req_body['file_data'])
-        with open('/tmp/temp_file', 'wb') as f:
-            f.write(decoded_file)
-        s3_client = boto3.client('s3', conf_values['REGION'])
-        s3_client.upload_file(
-            '/tmp/temp_file',
-            bucket_name,
-            user_id+'/'+req_body['remote_file_name']
+        # A duplicate skips the S3 upload, it is looked up while the file is hashed
+        with parallel.background(
+                file_records.get_previous_uploads,
+                user_id,
+                req_body['remote_file_name']) as lookup:
+            file_digest = b64_stream.digest(req_body['file_data'], conf_values['DECODE_CHUNK_SIZE'])
+        previous_uploads = lookup.result()
+        same_file_id = file_records.find_same_content(previous_uploads, file_digest)
+        if same_file_id is not None:
+            # Same name, same content: nothing to store again
+            return same_file_id, True
+        file_key = user_id+'/'+req_body['remote_file_name']
+        content_encoding = s3_objects.store_object(
+            file_key,
+            req_body['file_data'],
+            file_digest,
+            conf_values,
+            build_transfer_config(conf_values)
+        )
+        # Stable across overwrites, concurrent uploads of a name write one record
+        file_id = file_records.build_file_id(user_id, req_body['remote_file_name'])
+        item = {
+            'file_id': file_id,
+            'file_name': req_body['remote_file_name'],
+            'user_id': user_id,
+            'file_status': constants.FILE_STATUS_UPLOADED,
+            'content_sha256': file_digest.sha256,
+            'file_size': file_digest.size
+        }
+        if content_encoding is not None:
+            item['content_encoding'] = content_encoding
+        try:
+            file_records.write_upload(item, [previous['file_id'] for previous in previous_uploads])
+        except Exception:
+            if not previous_uploads:
+                # No record points to the new object, do not leave it behind
+                s3_objects.discard_object(file_key, conf_values)
+            raise
+        return file_id, False
+    except Exception as error:
+        LOGGER.error(error)
+        raise Exception('Internal server error')
+
+
+def upload_files(user_id, req_body, conf_values):
+    '''Upload a batch of new files'''
+    try:
+        # The files are uploaded in parallel, each one in a single thread
+        return batch_upload.upload_files(
+            user_id,
+            req_body['files'],
+            conf_values,
+            build_transfer_config(conf_values, max_concurrency=1)
         )
+    except Exception as error:
+        LOGGER.error(error)
+        raise Exception('Internal server error')
+
+
+def create_upload_url(user_id, req_body, conf_values):
+    '''Register a pending file and presign a direct to S3 upload'''
+    try:
+        bucket_name = os.environ['USER_FILES_BUCKET']
         file_id = str(uuid.uuid4())
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table(os.environ['FILE_SHARING_TABLE'])
-        response = table.scan(FilterExpression=Attr('file_name').eq(req_body['remote_file_name']))
-        if len(response['Items']) > 0:
-            print('File already uploaded, will remove the file_id and updated it with a new one!')
-            response = table.delete_item(
-              Key={
-                'file_id': response['Items'][0]['file_id']
-              },
+        # The live object of the name is only replaced once the upload is committed
+        file_key = s3_objects.build_pending_key(user_id, file_id)
+        s3_client = aws_clients.get_client(
+            's3',
+            conf_values['REGION'],
+            signature_version='s3v4'
+        )
+        if req_body['upload_mode'] == 'presigned_post':
+            upload = s3_client.generate_presigned_post(
+                bucket_name,
+                file_key,
+                Fields={
+                    'x-amz-meta-'+constants.FILE_ID_METADATA: file_id
+                },
+                Conditions=[
+                    {'x-amz-meta-'+constants.FILE_ID_METADATA: file_id},
+                    ['content-length-range', 0, conf_values['MAX_UPLOAD_SIZE']]
+                ],
+                ExpiresIn=conf_values['UPLOAD_URL_EXPIRATION']
             )
-        response = table.put_item(
+            upload['method'] = 'POST'
+        else:
+            upload = {
+                'url': s3_client.generate_presigned_url(
+                    'put_object',
+                    Params={
+                        'Bucket': bucket_name,
+                        'Key': file_key,
+                        'Metadata': {
+                            constants.FILE_ID_METADATA: file_id
+                        }
+                    },
+                    ExpiresIn=conf_values['UPLOAD_URL_EXPIRATION']
+                ),
+                'method': 'PUT',
+                'headers': {
+                    'x-amz-meta-'+constants.FILE_ID_METADATA: file_id
+                }
+            }
+        table = aws_clients.get_table(os.environ['FILE_SHARING_TABLE'])
+        table.put_item(
             Item={
                 'file_id': file_id,
                 'file_name': req_body['remote_file_name'],
-                'user_id': user_id
+                'user_id': user_id,
+                'file_status': constants.FILE_STATUS_PENDING,
+                # Lets DynamoDB TTL drop uploads that are never finalized
+                'expires_at': int(time.time()) + 2 * conf_values['UPLOAD_URL_EXPIRATION']
             }
         )
-        return file_id
+        return file_id, upload
     except Exception as error:
         LOGGER.error(error)
         raise Exception('Internal server error')
 
 
-def get_userinfo(claims, conf_values):
-    '''Get user infos'''
+def get_committed_file(table, file_infos):
+    '''The record of the file a pending upload was committed as, the pending record until then'''
+    if file_infos is None or 'committed_file_id' not in file_infos:
+        return file_infos
+    response = table.get_item(Key={'file_id': file_infos['committed_file_id']}, ConsistentRead=True)
+    return response.get('Item')
+
+
+def commit_pending_file(file_id, file_key=None, user_id=None):
+    '''Store a pending file under the file id of its name once its object is in S3'''
+    table = aws_clients.get_table(os.environ['FILE_SHARING_TABLE'])
+    response = table.get_item(Key={'file_id': file_id}, ConsistentRead=True)
+    file_infos = response.get('Item')
+    if file_infos is None:
+        return None
+    if user_id is not None and file_infos['user_id'] != user_id:
+        return None
+    pending_key = s3_objects.build_pending_key(file_infos['user_id'], file_id)
+    if file_key is not None and file_key != pending_key:
+        return None
+    if file_infos.get('file_status') != constants.FILE_STATUS_PENDING or \
+            'committed_file_id' in file_infos:
+        return get_committed_file(table, file_infos)
+    region = os.getenv(constants.REGION)
+    s3_client = aws_clients.get_client('s3', region)
     try:
-        cup_client = boto3.client('cognito-idp', conf_values['REGION'])
-        response = cup_client.admin_get_user(
-            UserPoolId=conf_values['COGNITO_USER_POOL_ID'],
-            Username=claims['cognito:username']
+        head = s3_client.head_object(
+            Bucket=os.environ['USER_FILES_BUCKET'],
+            Key=pending_key
         )
-        if 'Username' in response:
-            user_id = response['Username']
-        else:
-            user_id = None
-        email = None
-        name = None
-        print(response)
-        for attr in response['UserAttributes']:
-            if attr['Name'] == 'name':
-                name = attr['Value']
-            elif attr['Name'] == 'email':
-                email = attr['Value']
-            else:
-                pass
-        return user_id, name, email
+        # The staged upload replaces the live object of the name, then its record
+        s3_objects.copy_object(
+            pending_key,
+            file_infos['user_id']+'/'+file_infos['file_name'],
+            region
+        )
+    except aws_clients.client_error() as error:
+        if error.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+        # Not uploaded yet, or moved meanwhile by the finalize call or the S3 event
+        response = table.get_item(Key={'file_id': file_id}, ConsistentRead=True)
+        return get_committed_file(table, response.get('Item'))
+    committed_infos = file_records.commit_upload(file_infos, head.get('ContentLength'))
+    try:
+        s3_client.delete_object(Bucket=os.environ['USER_FILES_BUCKET'], Key=pending_key)
     except Exception as error:
-        raise Exception('Error: {}'.format(error))
+        # Left to the expiration rule of the pending prefix
+        LOGGER.error('Cannot delete the staged upload %s: %s', pending_key, error)
+    if committed_infos is None:
+        # Already committed by the finalize call or the S3 event
+        response = table.get_item(Key={'file_id': file_id}, ConsistentRead=True)
+        return get_committed_file(table, response.get('Item'))
+    return committed_infos
 
 
-def get_claims(jwt_token):
-    '''Extract claims from the JWT token'''
+def finalize_upload(user_id, event):
+    '''Commit a direct to S3 upload on the client request'''
+    url_user_id = event['path'].split('/')[3]
+    file_id = event['path'].split('/')[5]
+    if url_user_id != user_id:
+        return None
     try:
-        decode = jwt.decode(
-            jwt_token.split(' ')[1],
-            algorithms=['RS256'],
-            options={"verify_signature": False}
-        )
+        return commit_pending_file(file_id, user_id=user_id)
+    except Exception as error:
+        LOGGER.error(error)
+        raise Exception('Internal server error')
+
+
+def run_idempotent(event, user_id, conf_values, handle):
+    '''Run an upload once per Idempotency-Key, its retries get the same response'''
+    key = raw_upload.get_header(event, idempotency.IDEMPOTENCY_KEY_HEADER)
+    if not key or not idempotency.is_enabled():
+        return handle()
+    request_hash = idempotency.fingerprint(
+        event['httpMethod'],
+        event['path'],
+        json.dumps(event.get('queryStringParameters') or {}, sort_keys=True),
+        raw_upload.get_header(event, raw_upload.FILE_NAME_HEADER),
+        event.get('body')
+    )
+    try:
+        stored_response = idempotency.start(user_id, key, request_hash)
+    except idempotency.IdempotencyError:
+        raise
+    except Exception as error:
+        LOGGER.error(error)
+        raise Exception('Internal server error')
+    if stored_response is not None:
+        return stored_response
+    try:
+        status_code, response_body = handle()
+    except Exception:
+        idempotency.release(user_id, key)
+        raise
+    idempotency.complete(user_id, key, status_code, response_body, conf_values['IDEMPOTENCY_TTL'])
+    return status_code, response_body
+
+
+def handle_upload(user_id, req_body, conf_values):
+    '''Upload one file, return the status code and body of the response'''
+    file_id, deduplicated = upload_file(user_id, req_body, conf_values)
+    return 201, build_api_response(file_id, deduplicated=deduplicated)
+
+
+def handle_object_created(event):
+    '''Commit direct to S3 uploads from the bucket notifications'''
+    for record in event['Records']:
+        if not record.get('eventName', '').startswith('ObjectCreated:'):
+            continue
+        file_key = unquote_plus(record['s3']['object']['key'])
+        # The live objects, copies of the staged uploads included, are not pending
+        file_id = s3_objects.parse_pending_key(file_key)
+        if file_id is None:
+            continue
+        file_infos = commit_pending_file(file_id, file_key=file_key)
+        LOGGER.info('%s committed from %s: %s', file_id, file_key, file_infos is not None)
+
+
+def handle_upload_session(user_id, event, conf_values):
+    '''Create, feed, inspect, complete or abort a resumable upload'''
+    path = event['path'].rstrip('/').split('/')
+    method = event['httpMethod']
+    if path[3] != user_id:
+        return 401, {'message': 'User not authorized to perform this action'}
+    try:
+        if len(path) == 5 and method == 'POST':
+            req_body = json.loads(event['body'])
+            is_payload_data_valid, errors = core.assert_valid_schema(
+                req_body,
+                constants.NEW_UPLOAD_SESSION_JSON_SCHEMA
+            )
+            if not is_payload_data_valid:
+                return 400, {'message':errors[0], 'errors':errors}
+            session = upload_sessions.create_session(
+                user_id,
+                req_body['remote_file_name'],
+                conf_values
+            )
+            return 201, build_session_api_response(session, conf_values)
+        session = None
+        if len(path) > 5:
+            session = upload_sessions.get_session(user_id, path[5])
+        if session is None:
+            return 404, {'message': 'Upload session not found'}
+        if len(path) == 8 and path[6] == 'parts' and method == 'PUT':
+            part = upload_sessions.upload_part(
+                session,
+                upload_sessions.parse_part_number(path[7]),
+                raw_upload.parse_upload(event)['file_data'],
+                conf_values
+            )
+            return 200, part
+        if len(path) == 7 and path[6] == 'complete' and method == 'POST':
+            upload_sessions.complete_session(session, conf_values)
+            file_infos = commit_pending_file(session['file_id'], user_id=user_id)
+            if file_infos is None:
+                raise Exception('Pending file {} not found'.format(session['file_id']))
+            return 200, build_api_response(file_infos['file_id'], file_infos['file_status'])
+        if len(path) == 6 and method == 'GET':
+            parts = upload_sessions.list_parts(session, conf_values)
+            return 200, build_session_api_response(session, conf_values, parts)
+        if len(path) == 6 and method == 'DELETE':
+            upload_sessions.abort_session(session, conf_values)
+            return 200, build_session_api_response(session, conf_values, status='ABORTED')
+        return 404, {'message': 'Upload session not found'}
+    except upload_sessions.SessionError:
+        raise
     except Exception as error:
         LOGGER.error(error)
-    return decode
+        raise Exception('Internal server error')
 
 
-def build_api_response(file_id):
+def build_api_response(file_id, status=constants.FILE_STATUS_UPLOADED, upload=None,
+                       deduplicated=False):
     '''Build the API response'''
     response_body = collections.OrderedDict()
     response_body['file_id'] = file_id
-    response_body['status'] = 'UPLOADED'
+    response_body['status'] = status
+    if upload is not None:
+        response_body['upload'] = upload
+    if deduplicated:
+        response_body['deduplicated'] = True
+
+    return response_body
 
+
+def build_session_api_response(session, conf_values, parts=None, status='IN_PROGRESS'):
+    '''Build the API response of a resumable upload'''
+    response_body = collections.OrderedDict()
+    response_body['upload_id'] = session['upload_id']
+    response_body['file_id'] = session['file_id']
+    response_body['file_name'] = session['file_name']
+    response_body['status'] = status
+    response_body['expires_at'] = int(session['expires_at'])
+    response_body['part_size'] = conf_values['UPLOAD_PART_SIZE']
+    response_body['min_part_size'] = upload_sessions.MIN_PART_SIZE
+    if parts is not None:
+        response_body['parts'] = [
+            {
+                'part_number': part['PartNumber'],
+                'size': part['Size'],
+                'etag': part['ETag']
+            }
+            for part in parts
+        ]
+    return response_body
+
+
+def build_batch_api_response(user_id, results):
+    '''Build the API response of a batch upload'''
+    response_body = collections.OrderedDict()
+    response_body['user_id'] = user_id
+    response_body['uploaded'] = sum(
+        1 for result in results if result['file_status'] == constants.FILE_STATUS_UPLOADED
+    )
+    response_body['failed'] = len(results) - response_body['uploaded']
+    response_body['files'] = results
     return response_body
 
 
+def build_http_response(status_code, response_body):
+    '''Wrap a response body for API Gateway'''
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(response_body),
+        'headers': {
+            'Content-Type' : 'application/json',
+            'Access-Control-Allow-Origin' : '*',
+            'Allow' : 'GET, POST, PUT, DELETE, OPTIONS',
+            'Access-Control-Allow-Methods' : 'GET, POST, PUT, DELETE, OPTIONS',
+            'Access-Control-Allow-Headers' : '*'
+        },
+        'isBase64Encoded': False,
+    }
+
+
 def init_env_vars():
     '''Get all environment variables'''
-    conf_values = {}
-    conf_values['REGION'] = os.getenv(constants.REGION)
-    conf_values['COGNITO_USER_POOL_ID'] = os.getenv(constants.COGNITO_USER_POOL_ID)
+    conf_values = core.init_env_vars()
+    conf_values['UPLOAD_URL_EXPIRATION'] = int(os.getenv(
+        constants.UPLOAD_URL_EXPIRATION,
+        constants.DEFAULT_UPLOAD_URL_EXPIRATION
+    ))
+    conf_values['MAX_UPLOAD_SIZE'] = int(os.getenv(
+        constants.MAX_UPLOAD_SIZE,
+        constants.DEFAULT_MAX_UPLOAD_SIZE
+    ))
+    conf_values['DECODE_CHUNK_SIZE'] = int(os.getenv(
+        constants.DECODE_CHUNK_SIZE,
+        constants.DEFAULT_DECODE_CHUNK_SIZE
+    ))
+    conf_values['UPLOAD_PART_SIZE'] = int(os.getenv(
+        constants.UPLOAD_PART_SIZE,
+        constants.DEFAULT_UPLOAD_PART_SIZE
+    ))
+    conf_values['UPLOAD_MAX_CONCURRENCY'] = int(os.getenv(
+        constants.UPLOAD_MAX_CONCURRENCY,
+        constants.DEFAULT_UPLOAD_MAX_CONCURRENCY
+    ))
+    conf_values['BATCH_UPLOAD_MAX_WORKERS'] = int(os.getenv(
+        constants.BATCH_UPLOAD_MAX_WORKERS,
+        constants.DEFAULT_BATCH_UPLOAD_MAX_WORKERS
+    ))
+    conf_values['COMPRESS_UPLOADS'] = os.getenv(
+        constants.COMPRESS_UPLOADS, ''
+    ).lower() in ('1', 'true', 'yes')
+    conf_values['COMPRESSION_MIN_SIZE'] = int(os.getenv(
+        constants.COMPRESSION_MIN_SIZE,
+        constants.DEFAULT_COMPRESSION_MIN_SIZE
+    ))
+    conf_values['COMPRESSION_MAX_RATIO'] = float(os.getenv(
+        constants.COMPRESSION_MAX_RATIO,
+        constants.DEFAULT_COMPRESSION_MAX_RATIO
+    ))
+    conf_values['UPLOAD_SESSION_TTL'] = int(os.getenv(
+        constants.UPLOAD_SESSION_TTL,
+        constants.DEFAULT_UPLOAD_SESSION_TTL
+    ))
+    conf_values['IDEMPOTENCY_TTL'] = int(os.getenv(
+        constants.IDEMPOTENCY_TTL,
+        constants.DEFAULT_IDEMPOTENCY_TTL
+    ))
     return conf_values
 
 
+@metrics.instrument_handler('upload-file')
 def lambda_handler(event, _):
     '''Lambda entrypoint'''
+    if 'Records' in event:
+        handle_object_created(event)
+        return {'statusCode': 200}
     try:
-        req_body = json.loads(event['body'])
-        is_payload_data_valid, error_msg = check_inputs(req_body)
-        if not is_payload_data_valid:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'message':error_msg}),
-                'headers': {
-                    'Content-Type' : 'application/json',
-                    'Access-Control-Allow-Origin' : '*',
-                    'Allow' : 'POST, OPTIONS',
-                    'Access-Control-Allow-Methods' : 'POST, OPTIONS',
-                    'Access-Control-Allow-Headers' : '*'
-                }
-            }
         conf_values = init_env_vars()
-        claims = get_claims(event['headers']['Authorization'])
-        user_id, name, email = get_userinfo(
-            claims,
-            conf_values
-        )
-        file_id = upload_file(user_id, req_body, conf_values)
-        response_body = build_api_response(
-            file_id
+        if is_upload_session(event):
+            claims = core.get_claims(event['headers']['Authorization'], conf_values)
+            user_id, name, email = core.get_userinfo(
+                claims,
+                conf_values
+            )
+            status_code, response_body = handle_upload_session(user_id, event, conf_values)
+            return build_http_response(status_code, response_body)
+        if event['path'].endswith('/finalize'):
+            claims = core.get_claims(event['headers']['Authorization'], conf_values)
+            user_id, name, email = core.get_userinfo(
+                claims,
+                conf_values
+            )
+            file_infos = finalize_upload(user_id, event)
+            if file_infos is None:
+                return build_http_response(
+                    401,
+                    {'message': 'User not authorized to perform this action'}
+                )
+            response_body = build_api_response(
+                file_infos['file_id'],
+                file_infos['file_status']
+            )
+            return build_http_response(200, response_body)
+        # The token is checked while the body is read and validated
+        with parallel.background(core.authenticate, event, conf_values) as identity:
+            body_error = None
+            try:
+                req_body, errors = read_upload_request(event)
+            except Exception as error:
+                body_error = error
+        # A caller without a valid token learns nothing about its body
+        user_id, name, email = identity.result()
+        if body_error is not None:
+            raise body_error
+        if errors:
+            return build_http_response(400, {'message':errors[0], 'errors':errors})
+        if is_batch_upload(event):
+            status_code, response_body = run_idempotent(
+                event,
+                user_id,
+                conf_values,
+                lambda: (201, build_batch_api_response(
+                    user_id,
+                    upload_files(user_id, req_body, conf_values)
+                ))
+            )
+            return build_http_response(status_code, response_body)
+        if is_presigned_upload(req_body):
+            file_id, upload = create_upload_url(user_id, req_body, conf_values)
+            response_body = build_api_response(
+                file_id,
+                constants.FILE_STATUS_PENDING,
+                upload
+            )
+            return build_http_response(201, response_body)
+        status_code, response_body = run_idempotent(
+            event,
+            user_id,
+            conf_values,
+            lambda: handle_upload(user_id, req_body, conf_values)
         )
-        return {
-            'statusCode': 201,
-            'body': json.dumps(response_body),
-            'headers': {
-                'Content-Type' : 'application/json',
-                'Access-Control-Allow-Origin' : '*',
-                'Allow' : 'POST, OPTIONS',
-                'Access-Control-Allow-Methods' : 'POST, OPTIONS',
-                'Access-Control-Allow-Headers' : '*'
-            },
-            'isBase64Encoded': False,
-        }
+        return build_http_response(status_code, response_body)
+    except jwt_verifier.InvalidTokenError as error:
+        LOGGER.warning(error)
+        return build_http_response(401, {'message': '{}'.format(error)})
+    except upload_sessions.SessionError as error:
+        LOGGER.warning(error)
+        return build_http_response(400, {'message': '{}'.format(error)})
+    except raw_upload.InvalidBodyError as error:
+        LOGGER.warning(error)
+        return build_http_response(400, {'message': '{}'.format(error)})
+    except idempotency.IdempotencyError as error:
+        LOGGER.warning(error)
+        return build_http_response(error.status_code, {'message': '{}'.format(error)})
     except Exception as error:
         err_msg = {'error_message': '{}'.format(error)}
         LOGGER.error(err_msg)
-        #TODO: Perform necessary rollback
-        return {
-            'statusCode': 400,
-            'body': json.dumps(err_msg),
-            'headers': {
-                'Content-Type' : 'application/json',
-                'Access-Control-Allow-Origin' : '*',
-                'Allow' : 'POST, OPTIONS',
-                'Access-Control-Allow-Methods' : 'POST, OPTIONS',
-                'Access-Control-Allow-Headers' : '*'
-            },
-            'isBase64Encoded': False,
-        }
+        return build_http_response(400, err_msg)
@@ -0,0 +1,178 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Resumable uploads, backed by S3 multipart uploads'''
+
+import os
+import time
+import uuid
+import base64
+import hashlib
+import constants
+import aws_clients
+import b64_stream
+import s3_objects
+
+
+MIN_PART_NUMBER = 1
+MAX_PART_NUMBER = 10000
+# S3 refuses smaller parts, but the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class SessionError(Exception):
+    '''The upload session request can not be fulfilled'''
+
+
+def get_sessions_table():
+    '''The DynamoDB table of the upload sessions'''
+    return aws_clients.get_table(os.environ[constants.UPLOAD_SESSIONS_TABLE])
+
+
+def create_session(user_id, file_name, conf_values):
+    '''Start a multipart upload and register its session and pending file'''
+    bucket_name = os.environ['USER_FILES_BUCKET']
+    file_id = str(uuid.uuid4())
+    # Assembled apart from the live object of the name, moved there on commit
+    file_key = s3_objects.build_pending_key(user_id, file_id)
+    s3_client = aws_clients.get_client('s3', conf_values['REGION'])
+    response = s3_client.create_multipart_upload(
+        Bucket=bucket_name,
+        Key=file_key,
+        ChecksumAlgorithm='SHA256',
+        Metadata={constants.FILE_ID_METADATA: file_id}
+    )
+    session = {
+        'upload_id': str(uuid.uuid4()),
+        's3_upload_id': response['UploadId'],
+        'file_id': file_id,
+        'file_name': file_name,
+        'user_id': user_id,
+        'created_at': int(time.time()),
+        # Lets DynamoDB TTL drop the sessions which are never completed
+        'expires_at': int(time.time()) + conf_values['UPLOAD_SESSION_TTL']
+    }
+    aws_clients.get_table(os.environ['FILE_SHARING_TABLE']).put_item(
+        Item={
+            'file_id': file_id,
+            'file_name': file_name,
+            'user_id': user_id,
+            'file_status': constants.FILE_STATUS_PENDING,
+            'expires_at': session['expires_at']
+        }
+    )
+    get_sessions_table().put_item(Item=session)
+    return session
+
+
+def get_session(user_id, upload_id):
+    '''Get a live upload session of the user, None if there is none'''
+    response = get_sessions_table().get_item(Key={'upload_id': upload_id}, ConsistentRead=True)
+    session = response.get('Item')
+    if session is None or session['user_id'] != user_id:
+        return None
+    # The TTL deletion lags behind the expiration
+    if session['expires_at'] <= time.time():
+        return None
+    return session
+
+
+def parse_part_number(part_number):
+    '''Check the part number of the request path'''
+    if not part_number.isdigit() or \
+            not MIN_PART_NUMBER <= int(part_number) <= MAX_PART_NUMBER:
+        raise SessionError('The part number must be between {} and {}'.format(
+            MIN_PART_NUMBER,
+            MAX_PART_NUMBER
+        ))
+    return int(part_number)
+
+
+def upload_part(session, part_number, part_data, conf_values):
+    '''Store one part of the upload, parts can be sent again or in parallel'''
+    body = b64_stream.open_data(part_data, conf_values['DECODE_CHUNK_SIZE']).read()
+    if not body:
+        raise SessionError('Empty part')
+    s3_client = aws_clients.get_client('s3', conf_values['REGION'])
+    response = s3_client.upload_part(
+        Bucket=os.environ['USER_FILES_BUCKET'],
+        Key=s3_objects.build_pending_key(session['user_id'], session['file_id']),
+        UploadId=session['s3_upload_id'],
+        PartNumber=part_number,
+        Body=body,
+        ContentMD5=base64.b64encode(hashlib.md5(body).digest()).decode('ascii'),
+        ChecksumSHA256=base64.b64encode(hashlib.sha256(body).digest()).decode('ascii')
+    )
+    return {
+        'part_number': part_number,
+        'size': len(body),
+        'etag': response['ETag']
+    }
+
+
+def list_parts(session, conf_values):
+    '''Get the parts S3 already has, in order'''
+    s3_client = aws_clients.get_client('s3', conf_values['REGION'])
+    list_args = {
+        'Bucket': os.environ['USER_FILES_BUCKET'],
+        'Key': s3_objects.build_pending_key(session['user_id'], session['file_id']),
+        'UploadId': session['s3_upload_id']
+    }
+    parts = []
+    while True:
+        response = s3_client.list_parts(**list_args)
+        parts.extend(response.get('Parts', []))
+        if not response.get('IsTruncated'):
+            return parts
+        list_args['PartNumberMarker'] = response['NextPartNumberMarker']
+
+
+def complete_session(session, conf_values):
+    '''Assemble the parts into the final object and close the session'''
+    parts = list_parts(session, conf_values)
+    if not parts:
+        raise SessionError('No part has been uploaded')
+    completed_parts = []
+    for part in parts:
+        completed_part = {'PartNumber': part['PartNumber'], 'ETag': part['ETag']}
+        if 'ChecksumSHA256' in part:
+            completed_part['ChecksumSHA256'] = part['ChecksumSHA256']
+        completed_parts.append(completed_part)
+    s3_client = aws_clients.get_client('s3', conf_values['REGION'])
+    try:
+        s3_client.complete_multipart_upload(
+            Bucket=os.environ['USER_FILES_BUCKET'],
+            Key=s3_objects.build_pending_key(session['user_id'], session['file_id']),
+            UploadId=session['s3_upload_id'],
+            MultipartUpload={'Parts': completed_parts}
+        )
+    except aws_clients.client_error() as error:
+        if error.response['Error']['Code'] == 'EntityTooSmall':
+            raise SessionError('Every part but the last one must be at least {} bytes'.format(
+                MIN_PART_SIZE
+            ))
+        raise
+    get_sessions_table().delete_item(Key={'upload_id': session['upload_id']})
+
+
+def abort_session(session, conf_values):
+    '''Drop the uploaded parts, the session and its pending file'''
+    s3_client = aws_clients.get_client('s3', conf_values['REGION'])
+    try:
+        s3_client.abort_multipart_upload(
+            Bucket=os.environ['USER_FILES_BUCKET'],
+            Key=s3_objects.build_pending_key(session['user_id'], session['file_id']),
+            UploadId=session['s3_upload_id']
+        )
+    except aws_clients.client_error() as error:
+        if error.response['Error']['Code'] != 'NoSuchUpload':
+            raise
+    get_sessions_table().delete_item(Key={'upload_id': session['upload_id']})
+    try:
+        aws_clients.get_table(os.environ['FILE_SHARING_TABLE']).delete_item(
+            Key={'file_id': session['file_id']},
+            ConditionExpression='file_status = :pending',
+            ExpressionAttributeValues={':pending': constants.FILE_STATUS_PENDING}
+        )
+    except aws_clients.client_error() as error:
+        if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
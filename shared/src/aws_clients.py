@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''AWS clients kept warm across the invocations of a container'''
+
+import os
+import threading
+import metrics
+
+
+CONNECT_TIMEOUT = 'CLIENT_CONNECT_TIMEOUT'
+DEFAULT_CONNECT_TIMEOUT = 2
+READ_TIMEOUT = 'CLIENT_READ_TIMEOUT'
+DEFAULT_READ_TIMEOUT = 10
+MAX_POOL_CONNECTIONS = 'CLIENT_MAX_POOL_CONNECTIONS'
+DEFAULT_MAX_POOL_CONNECTIONS = 25
+MAX_ATTEMPTS = 'CLIENT_MAX_ATTEMPTS'
+DEFAULT_MAX_ATTEMPTS = 3
+COLD_START_MODE = 'COLD_START_MODE'
+DEFAULT_COLD_START_MODE = 'lazy'
+
+_SESSION = None
+_CLIENTS = {}
+_RESOURCES = {}
+_TABLES = {}
+# Sessions are not thread safe, clients are built one at a time
+_LOCK = threading.Lock()
+
+
+def is_lazy():
+    '''boto3 loads on the first AWS call unless COLD_START_MODE is eager'''
+    return os.getenv(COLD_START_MODE, DEFAULT_COLD_START_MODE).lower() != 'eager'
+
+
+def build_config(**overrides):
+    '''Build the botocore configuration shared by all the clients'''
+    from botocore.config import Config
+    config = Config(
+        connect_timeout=float(os.getenv(CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT)),
+        read_timeout=float(os.getenv(READ_TIMEOUT, DEFAULT_READ_TIMEOUT)),
+        max_pool_connections=int(os.getenv(MAX_POOL_CONNECTIONS, DEFAULT_MAX_POOL_CONNECTIONS)),
+        tcp_keepalive=True,
+        retries={
+            'max_attempts': int(os.getenv(MAX_ATTEMPTS, DEFAULT_MAX_ATTEMPTS)),
+            'mode': 'standard'
+        }
+    )
+    if overrides:
+        config = config.merge(Config(**overrides))
+    return config
+
+
+def _get_session():
+    global _SESSION
+    if _SESSION is None:
+        # boto3 is the costliest import of the package, a cold start which
+        # fails before any AWS call does not pay for it
+        import boto3.session
+        _SESSION = boto3.session.Session()
+        metrics.instrument_session(_SESSION)
+    return _SESSION
+
+
+def get_client(service, region=None, **config):
+    '''Get the cached client of a service, building it on first use'''
+    key = (service, region, tuple(sorted(config.items())))
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                client = _get_session().client(
+                    service,
+                    region_name=region,
+                    config=build_config(**config)
+                )
+                _CLIENTS[key] = client
+    return client
+
+
+def get_resource(service, region=None):
+    '''Get the cached resource of a service, building it on first use'''
+    key = (service, region)
+    resource = _RESOURCES.get(key)
+    if resource is None:
+        with _LOCK:
+            resource = _RESOURCES.get(key)
+            if resource is None:
+                resource = _get_session().resource(
+                    service,
+                    region_name=region,
+                    config=build_config()
+                )
+                _RESOURCES[key] = resource
+    return resource
+
+
+def get_table(table_name, region=None):
+    '''Get the cached DynamoDB table resource'''
+    key = (table_name, region)
+    table = _TABLES.get(key)
+    if table is None:
+        table = get_resource('dynamodb', region).Table(table_name)
+        _TABLES[key] = table
+    return table
+
+
+def client_error():
+    '''The error class of the failed AWS calls, loaded along with boto3 by the clients'''
+    import botocore.exceptions
+    return botocore.exceptions.ClientError
+
+
+if not is_lazy():
+    # Provisioned concurrency initializes ahead of the requests
+    _get_session()
@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+# coding:utf-8
+'''Just a constants values'''
+
+REGION = 'eu-west-1'
+SCHEMAS_FOLDER = 'schemas'
+NEW_FILE_JSON_SCHEMA = 'new_file.json'
+COGNITO_USER_POOL_ID = 'COGNITO_USER_POOL_ID'
+NEW_UPLOAD_URL_JSON_SCHEMA = 'new_upload_url.json'
+UPLOAD_URL_EXPIRATION = 'UPLOAD_URL_EXPIRATION'
+DEFAULT_UPLOAD_URL_EXPIRATION = 3600
+MAX_UPLOAD_SIZE = 'MAX_UPLOAD_SIZE'
+DEFAULT_MAX_UPLOAD_SIZE = 5 * 1024 * 1024 * 1024
+FILE_ID_METADATA = 'file-id'
+FILE_STATUS_PENDING = 'PENDING'
+FILE_STATUS_UPLOADED = 'UPLOADED'
+PENDING_UPLOADS_PREFIX = 'pending/'
+DECODE_CHUNK_SIZE = 'DECODE_CHUNK_SIZE'
+DEFAULT_DECODE_CHUNK_SIZE = 1024 * 1024
+UPLOAD_PART_SIZE = 'UPLOAD_PART_SIZE'
+DEFAULT_UPLOAD_PART_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_CONCURRENCY = 'UPLOAD_MAX_CONCURRENCY'
+DEFAULT_UPLOAD_MAX_CONCURRENCY = 1
+USER_FILES_INDEX = 'USER_FILES_INDEX'
+DEFAULT_USER_FILES_INDEX = 'user_id-file_name-index'
+COGNITO_APP_CLIENT_ID = 'COGNITO_APP_CLIENT_ID'
+NEW_FILES_JSON_SCHEMA = 'new_files.json'
+BATCH_UPLOAD_MAX_WORKERS = 'BATCH_UPLOAD_MAX_WORKERS'
+DEFAULT_BATCH_UPLOAD_MAX_WORKERS = 8
+COMPRESS_UPLOADS = 'COMPRESS_UPLOADS'
+COMPRESSION_MIN_SIZE = 'COMPRESSION_MIN_SIZE'
+DEFAULT_COMPRESSION_MIN_SIZE = 4 * 1024
+COMPRESSION_MAX_RATIO = 'COMPRESSION_MAX_RATIO'
+DEFAULT_COMPRESSION_MAX_RATIO = 0.8
+UPLOAD_SESSIONS_TABLE = 'UPLOAD_SESSIONS_TABLE'
+NEW_UPLOAD_SESSION_JSON_SCHEMA = 'new_upload_session.json'
+UPLOAD_SESSION_TTL = 'UPLOAD_SESSION_TTL'
+DEFAULT_UPLOAD_SESSION_TTL = 24 * 3600
+BATCH_DELETE_JSON_SCHEMA = 'batch_delete.json'
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+SHARE_FILE_JSON_SCHEMA = 'share_file.json'
+SES_TEMPLATE_NAME = 'SES_TEMPLATE_NAME'
+SES_MAX_SEND_RATE = 'SES_MAX_SEND_RATE'
+DEFAULT_SES_MAX_SEND_RATE = 14
+SES_MAX_WORKERS = 'SES_MAX_WORKERS'
+DEFAULT_SES_MAX_WORKERS = 4
+SHARE_QUEUE_URL = 'SHARE_QUEUE_URL'
+SHARE_STATUS_TABLE = 'SHARE_STATUS_TABLE'
+SHARE_MAX_ATTEMPTS = 'SHARE_MAX_ATTEMPTS'
+DEFAULT_SHARE_MAX_ATTEMPTS = 4
+SHARE_RETRY_BASE_DELAY = 0.5
+SHARE_STATUS_RETENTION = 7 * 24 * 3600
+FILE_LINK_EXPIRATION = 3600
+FILE_MANIFEST_TABLE = 'FILE_MANIFEST_TABLE'
+MANIFEST_MAX_FILES = 'MANIFEST_MAX_FILES'
+DEFAULT_MANIFEST_MAX_FILES = 1000
+IDEMPOTENCY_TABLE = 'IDEMPOTENCY_TABLE'
+IDEMPOTENCY_TTL = 'IDEMPOTENCY_TTL'
+DEFAULT_IDEMPOTENCY_TTL = 24 * 3600
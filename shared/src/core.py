@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''The request steps shared by all the endpoints'''
+
+import os
+import sys
+import json
+import constants
+import aws_clients
+import metrics
+import jwt_verifier
+import user_cache
+
+
+def init_env_vars():
+    '''Get the environment variables used by every endpoint'''
+    conf_values = {}
+    conf_values['REGION'] = os.getenv(constants.REGION)
+    conf_values['COGNITO_USER_POOL_ID'] = os.getenv(constants.COGNITO_USER_POOL_ID)
+    conf_values['COGNITO_APP_CLIENT_ID'] = os.getenv(constants.COGNITO_APP_CLIENT_ID)
+    return conf_values
+
+
+@metrics.timed('userinfo')
+def get_userinfo(claims, conf_values):
+    '''Get user infos'''
+    user_id, name, email = jwt_verifier.identity_from_claims(claims)
+    if user_id is not None and name is not None and email is not None:
+        return user_id, name, email
+    try:
+        profile = user_cache.get_user_profile(
+            conf_values['COGNITO_USER_POOL_ID'],
+            user_id,
+            conf_values['REGION']
+        )
+        return profile['user_id'], name or profile['name'], email or profile['email']
+    except Exception as error:
+        raise Exception('Error: {}'.format(error))
+
+
+def authenticate(event, conf_values):
+    '''Verify the token of the request, then get the identity of its user'''
+    claims = get_claims(event['headers']['Authorization'], conf_values)
+    return get_userinfo(claims, conf_values)
+
+
+@metrics.timed('jwt')
+def get_claims(jwt_token, conf_values):
+    '''Verify the JWT token and extract its claims'''
+    return jwt_verifier.verify_token(
+        jwt_verifier.extract_bearer_token(jwt_token),
+        conf_values['COGNITO_USER_POOL_ID'],
+        conf_values['COGNITO_APP_CLIENT_ID']
+    )
+
+
+def _find_schemas_folders():
+    '''The schemas folders of the function, next to its handler on sys.path'''
+    # This module is shared: the schemas belong to the endpoint importing it
+    folders = [os.path.join(os.path.abspath(path), constants.SCHEMAS_FOLDER) for path in sys.path]
+    return [folder for folder in folders if os.path.isdir(folder)]
+
+
+def _load_json_schema(filename):
+    '''Load the given schema file'''
+    for folder in _find_schemas_folders():
+        path = os.path.join(folder, filename)
+        if os.path.isfile(path):
+            with open(path) as schema_file:
+                return json.load(schema_file)
+    raise IOError('Schema {} not found'.format(filename))
+
+
+# Schemas are read and checked once per container, not once per request
+VALIDATORS = {}
+
+
+def get_validator(schema_file):
+    '''Compile a schema on its first use'''
+    validator = VALIDATORS.get(schema_file)
+    if validator is None:
+        # jsonschema takes a large share of the import time, only the
+        # requests with a body to validate load it
+        import jsonschema
+        schema = _load_json_schema(schema_file)
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        validator = validator_class(schema)
+        VALIDATORS[schema_file] = validator
+    return validator
+
+
+def preload_validators():
+    '''Compile every schema of the schemas folder, if the endpoint has one'''
+    for schemas_folder in _find_schemas_folders():
+        for filename in sorted(os.listdir(schemas_folder)):
+            if filename.endswith('.json'):
+                get_validator(filename)
+
+
+@metrics.timed('schema')
+def assert_valid_schema(data, schema_file):
+    '''Check whether the given data matches the schema, return the errors'''
+    validator = get_validator(schema_file)
+    if validator.is_valid(data):
+        return True, None
+    return False, [error.message for error in validator.iter_errors(data)]
+
+
+if not aws_clients.is_lazy():
+    preload_validators()
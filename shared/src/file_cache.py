@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''File records cached across the invocations of a container
+
+The delete and share endpoints read the record of a file to check that the
+user owns it. The records are kept for a short time and dropped when this
+container deletes or overwrites the file, a change made by another
+container shows after FILE_CACHE_TTL seconds at most.
+'''
+
+import os
+import constants
+import aws_clients
+import ttl_cache
+
+
+FILE_CACHE_SIZE = 'FILE_CACHE_SIZE'
+DEFAULT_FILE_CACHE_SIZE = 1024
+FILE_CACHE_TTL = 'FILE_CACHE_TTL'
+DEFAULT_FILE_CACHE_TTL = 30
+# Every attribute of a file record, a failed delete puts the record back
+RECORD_ATTRIBUTES = [
+    'file_id',
+    'user_id',
+    'file_name',
+    'file_status',
+    'file_size',
+    'content_sha256',
+    'content_encoding',
+    'expires_at'
+]
+
+_CACHE = ttl_cache.TTLCache(
+    int(os.getenv(FILE_CACHE_SIZE, DEFAULT_FILE_CACHE_SIZE)),
+    int(os.getenv(FILE_CACHE_TTL, DEFAULT_FILE_CACHE_TTL))
+)
+
+
+def read_record(file_id):
+    '''Get the record of a file from the table, None if there is none'''
+    names = dict(('#a{}'.format(index), name) for index, name in enumerate(RECORD_ATTRIBUTES))
+    response = aws_clients.get_client('dynamodb').get_item(
+        TableName=os.environ['FILE_SHARING_TABLE'],
+        Key={'file_id': {'S': file_id}},
+        ProjectionExpression=', '.join(names),
+        ExpressionAttributeNames=names
+    )
+    return response.get('Item')
+
+
+def get_file(file_id):
+    '''Get the record of a file, from the cache when it is there'''
+    file_infos = _CACHE.get(file_id)
+    if file_infos is ttl_cache.MISSING:
+        file_infos = read_record(file_id)
+        # Pending files change on commit and unknown ones on upload, any time
+        if file_infos is not None and \
+                file_infos.get('file_status', {}).get('S') != constants.FILE_STATUS_PENDING:
+            _CACHE.set(file_id, file_infos)
+    return file_infos
+
+
+def invalidate(file_ids):
+    '''Drop the records of files this container deletes or overwrites'''
+    for file_id in file_ids:
+        _CACHE.invalidate(file_id)
@@ -0,0 +1,136 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Verify the Cognito JWT tokens against the user pool JWKS'''
+
+import os
+import json
+import time
+import threading
+import urllib.request
+import jwt
+
+
+JWKS_FILE = 'JWKS_FILE'
+JWKS_TTL = 'JWKS_TTL'
+DEFAULT_JWKS_TTL = 3600
+# An unknown kid triggers a refresh, but not more often than this
+MIN_REFRESH_INTERVAL = 30
+JWKS_FETCH_TIMEOUT = 3
+COGNITO_ISSUER = 'https://cognito-idp.{}.amazonaws.com/{}'
+TOKEN_USES = ('id', 'access')
+
+_CACHES = {}
+_LOCK = threading.Lock()
+
+
+class InvalidTokenError(Exception):
+    '''The token is malformed, expired or not signed by the user pool'''
+
+
+class JwksCache():
+    '''The signing keys of a user pool, cached by kid with a TTL'''
+
+    def __init__(self, jwks_url, jwks_file=None, ttl=DEFAULT_JWKS_TTL):
+        self.jwks_url = jwks_url
+        self.jwks_file = jwks_file
+        self.ttl = ttl
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        '''Read the JWKS from the local file or from the user pool'''
+        if self.jwks_file:
+            with open(self.jwks_file) as jwks_file:
+                return json.load(jwks_file)
+        with urllib.request.urlopen(self.jwks_url, timeout=JWKS_FETCH_TIMEOUT) as response:
+            return json.loads(response.read())
+
+    def refresh(self):
+        '''Reload all the keys of the user pool'''
+        jwks = self._fetch()
+        keys = {}
+        for jwk in jwks.get('keys', []):
+            if jwk.get('kty') == 'RSA' and 'kid' in jwk:
+                keys[jwk['kid']] = jwt.PyJWK(jwk, algorithm='RS256').key
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    def get_key(self, kid):
+        '''Get the public key of the given kid'''
+        with self._lock:
+            age = None
+            if self._fetched_at is not None:
+                age = time.monotonic() - self._fetched_at
+            if age is None or age > self.ttl or \
+                    (kid not in self._keys and age > MIN_REFRESH_INTERVAL):
+                try:
+                    self.refresh()
+                except Exception:
+                    if not self._keys:
+                        raise
+                    # Keep serving the known keys and retry a bit later
+                    self._fetched_at = time.monotonic() - self.ttl + MIN_REFRESH_INTERVAL
+            return self._keys.get(kid)
+
+
+def get_jwks_cache(user_pool_id):
+    '''Get the JWKS cache of a user pool, kept for the container life'''
+    cache = _CACHES.get(user_pool_id)
+    if cache is None:
+        with _LOCK:
+            cache = _CACHES.get(user_pool_id)
+            if cache is None:
+                cache = JwksCache(
+                    get_issuer(user_pool_id)+'/.well-known/jwks.json',
+                    os.getenv(JWKS_FILE),
+                    int(os.getenv(JWKS_TTL, DEFAULT_JWKS_TTL))
+                )
+                _CACHES[user_pool_id] = cache
+    return cache
+
+
+def get_issuer(user_pool_id):
+    '''The issuer of the user pool tokens, its region prefixes the pool id'''
+    return COGNITO_ISSUER.format(user_pool_id.split('_')[0], user_pool_id)
+
+
+def extract_bearer_token(authorization):
+    '''Get the token out of the Authorization header'''
+    parts = authorization.split(' ')
+    if len(parts) != 2 or parts[0].lower() != 'bearer' or not parts[1]:
+        raise InvalidTokenError('Invalid Authorization header')
+    return parts[1]
+
+
+def verify_token(token, user_pool_id, app_client_id=None):
+    '''Check the token signature and claims, then return the claims'''
+    try:
+        kid = jwt.get_unverified_header(token).get('kid')
+        key = get_jwks_cache(user_pool_id).get_key(kid)
+        if key is None:
+            raise InvalidTokenError('Unknown signing key')
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=['RS256'],
+            issuer=get_issuer(user_pool_id),
+            options={'verify_aud': False, 'require': ['exp', 'iss']}
+        )
+    except jwt.PyJWTError as error:
+        raise InvalidTokenError('Invalid token: {}'.format(error))
+    if claims.get('token_use') not in TOKEN_USES:
+        raise InvalidTokenError('Invalid token use')
+    # Templated environments leave an unset client id empty rather than absent
+    if app_client_id:
+        # ID tokens carry the client in aud, access tokens in client_id
+        client_id = claims.get('aud') if claims['token_use'] == 'id' else claims.get('client_id')
+        if client_id != app_client_id:
+            raise InvalidTokenError('Token issued for another client')
+    return claims
+
+
+def identity_from_claims(claims):
+    '''Get the user id, name and email carried by verified claims'''
+    user_id = claims.get('cognito:username', claims.get('username'))
+    return user_id, claims.get('name'), claims.get('email')
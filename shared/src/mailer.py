@@ -0,0 +1,215 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Send the shared file links through SES'''
+
+import json
+import time
+import mimetypes
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+import aws_clients
+
+
+# SES accepts up to 50 destinations per bulk call
+MAX_BULK_DESTINATIONS = 50
+SUBJECT = 'A new Cador file'
+# Throttling and transient statuses of send_email and send_bulk_templated_email
+RETRYABLE_ERRORS = (
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailable',
+    'AccountThrottled',
+    'TransientFailure',
+    'EndpointConnectionError',
+    'ConnectTimeoutError',
+    'ReadTimeoutError'
+)
+BODY = '''
+                 Hi dear Cador,<br>
+                 A new file has been shared with you by {}<br />
+
+                 If you want to download it, please click the link below (valid for one hour):<br />
+
+                 {}<br />
+
+                 Sincerely,
+
+                 TheCadors team
+
+         '''
+
+
+class RateLimiter():
+    '''Token bucket keeping the sends under the SES maximum send rate'''
+
+    def __init__(self, max_rate):
+        self.max_rate = max_rate
+        self._tokens = max_rate
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count=1):
+        '''Wait until count emails can be sent'''
+        if not self.max_rate:
+            return
+        # A bulk call larger than the bucket waits for a full bucket and
+        # leaves it in debt, so the next calls wait for the extra emails
+        needed = min(count, self.max_rate)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.max_rate,
+                    self._tokens + (now - self._updated_at) * self.max_rate
+                )
+                self._updated_at = now
+                if self._tokens >= needed:
+                    self._tokens -= count
+                    return
+                wait = (needed - self._tokens) / self.max_rate
+            time.sleep(wait)
+
+
+_LIMITERS = {}
+_LOCK = threading.Lock()
+
+
+def get_rate_limiter(max_rate):
+    '''Get the rate limiter shared by the invocations of the container'''
+    with _LOCK:
+        if max_rate not in _LIMITERS:
+            _LIMITERS[max_rate] = RateLimiter(max_rate)
+        return _LIMITERS[max_rate]
+
+
+def get_error_code(error):
+    '''Get the SES error code of a failed call'''
+    if hasattr(error, 'response'):
+        return error.response.get('Error', {}).get('Code')
+    return type(error).__name__
+
+
+def is_retryable(result):
+    '''Check if a failed send may succeed later'''
+    return result['status'] == 'FAILED' and result.get('error_code') in RETRYABLE_ERRORS
+
+
+def chunks(items, size):
+    '''Split a list in lists of at most size items'''
+    return [items[index:index + size] for index in range(0, len(items), size)]
+
+
+def get_download_params(bucket_name, file_path, content_encoding=None):
+    '''The GetObject parameters of the download link'''
+    params = {
+        'Bucket': bucket_name,
+        'Key': file_path
+    }
+    if content_encoding:
+        # Stored compressed: the client decodes it and saves the original file
+        file_name = file_path.split('/')[-1]
+        content_type, _ = mimetypes.guess_type(file_name, strict=False)
+        params['ResponseContentEncoding'] = content_encoding
+        params['ResponseContentType'] = content_type or 'application/octet-stream'
+        params['ResponseContentDisposition'] = "attachment; filename*=UTF-8''{}".format(
+            urllib.parse.quote(file_name)
+        )
+    return params
+
+
+def send_file_link(file_owner, email, file_presigned_url, conf_values):
+    '''Send an email with the download link'''
+    message = {
+        'Subject': {
+            'Data': SUBJECT
+        },
+        'Body': {
+            'Html': {
+                'Data': BODY.format(file_owner, file_presigned_url)
+            }
+        }
+    }
+    ses_client = aws_clients.get_client('ses', conf_values['REGION'])
+    try:
+        response = ses_client.send_email(
+            Source=conf_values['SENDER_EMAIL'],
+            Destination={
+                'ToAddresses': [email]
+            },
+            Message=message,
+            SourceArn=conf_values['SENDER_SES_ARN'],
+        )
+        return [{'email': email, 'status': 'SENT', 'message_id': response['MessageId']}]
+    except Exception as error:
+        return [{
+            'email': email,
+            'status': 'FAILED',
+            'error': '{}'.format(error),
+            'error_code': get_error_code(error)
+        }]
+
+
+def send_bulk_file_links(file_owner, emails, file_presigned_url, conf_values):
+    '''Send the download link to up to 50 recipients in one call'''
+    ses_client = aws_clients.get_client('ses', conf_values['REGION'])
+    try:
+        response = ses_client.send_bulk_templated_email(
+            Source=conf_values['SENDER_EMAIL'],
+            SourceArn=conf_values['SENDER_SES_ARN'],
+            Template=conf_values['SES_TEMPLATE_NAME'],
+            DefaultTemplateData=json.dumps({
+                'file_owner': file_owner,
+                'file_url': file_presigned_url
+            }),
+            Destinations=[
+                {'Destination': {'ToAddresses': [email]}} for email in emails
+            ]
+        )
+    except Exception as error:
+        return [
+            {
+                'email': email,
+                'status': 'FAILED',
+                'error': '{}'.format(error),
+                'error_code': get_error_code(error)
+            }
+            for email in emails
+        ]
+    results = []
+    for email, status in zip(emails, response['Status']):
+        if 'MessageId' in status and status.get('Status', 'Success') == 'Success':
+            results.append({'email': email, 'status': 'SENT', 'message_id': status['MessageId']})
+        else:
+            results.append({
+                'email': email,
+                'status': 'FAILED',
+                'error': status.get('Error', status.get('Status')),
+                'error_code': status.get('Status')
+            })
+    return results
+
+
+def send_file_links(file_owner, emails, file_presigned_url, conf_values):
+    '''Send the download link to every recipient, return their statuses'''
+    emails = list(dict.fromkeys(emails))
+    limiter = get_rate_limiter(conf_values['SES_MAX_SEND_RATE'])
+    if conf_values['SES_TEMPLATE_NAME']:
+        batches = chunks(emails, MAX_BULK_DESTINATIONS)
+    else:
+        batches = chunks(emails, 1)
+
+    def send_batch(batch):
+        limiter.acquire(len(batch))
+        if conf_values['SES_TEMPLATE_NAME']:
+            return send_bulk_file_links(file_owner, batch, file_presigned_url, conf_values)
+        return send_file_link(file_owner, batch[0], file_presigned_url, conf_values)
+
+    if len(batches) <= 1:
+        return [result for batch in batches for result in send_batch(batch)]
+    results = []
+    with ThreadPoolExecutor(max_workers=conf_values['SES_MAX_WORKERS']) as executor:
+        for batch_results in executor.map(send_batch, batches):
+            results.extend(batch_results)
+    return results
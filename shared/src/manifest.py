@@ -0,0 +1,306 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''The per-user manifest of the uploaded files, listed with a single GetItem
+
+The manifest item of a user holds one attribute per uploaded file, along
+with a version bumped by every change to the files of the user. It is
+updated in the same transaction as the file records, but only while it is
+complete: once it misses files, the changes only bump its version until
+the listing rebuilds it from the index.
+'''
+
+import os
+import time
+import uuid
+import logging
+import constants
+import aws_clients
+
+
+# Entries are top level attributes, SET creates them without a parent map
+ENTRY_PREFIX = 'f_'
+# TransactWriteItems limit, the manifest update included
+MAX_TRANSACT_ITEMS = 100
+# Seconds the index is given to show the latest writes before a rebuild
+SETTLE_DELAY = 10
+# The attributes telling the version of the listing, without the entries
+HEAD_ATTRIBUTES = ('epoch', 'version', 'complete', 'overflow', 'updated_at')
+
+LOGGER = logging.getLogger(__name__)
+
+
+def is_enabled():
+    '''The manifests are maintained when their table is configured'''
+    return bool(os.getenv(constants.FILE_MANIFEST_TABLE))
+
+
+def get_max_files():
+    '''The most files a manifest lists, far below the 400KB item limit'''
+    return int(os.getenv(constants.MANIFEST_MAX_FILES, constants.DEFAULT_MANIFEST_MAX_FILES))
+
+
+def get_manifest_table():
+    '''The DynamoDB table of the manifests'''
+    return aws_clients.get_table(os.environ[constants.FILE_MANIFEST_TABLE])
+
+
+def build_entry(file_id, file_name, file_size=None, uploaded_at=None):
+    '''The manifest entry of an uploaded file'''
+    entry = {'file_id': file_id, 'file_name': file_name}
+    if file_size is not None:
+        entry['file_size'] = int(file_size)
+    if uploaded_at is not None:
+        entry['uploaded_at'] = int(uploaded_at)
+    return entry
+
+
+def _serialize(values):
+    from boto3.dynamodb.types import TypeSerializer
+    serializer = TypeSerializer()
+    return {name: serializer.serialize(value) for name, value in values.items()}
+
+
+def to_transact_item(operation, table_name):
+    '''Turn a Put, Update, Delete or ConditionCheck of plain values into a transaction item'''
+    (kind, params), = operation.items()
+    params = dict(params, TableName=table_name)
+    for name in ('Item', 'Key', 'ExpressionAttributeValues'):
+        if name in params:
+            params[name] = _serialize(params[name])
+    return {kind: params}
+
+
+def new_epoch():
+    '''The epoch of a new manifest, a version reused after a deletion never matches an old one'''
+    return uuid.uuid4().hex[:16]
+
+
+def build_update(user_id, added, removed, listed=True, overflow=False):
+    '''The manifest update of a change, which keeps the entries when listed'''
+    names = {}
+    values = {':one': 1, ':now': int(time.time()), ':epoch': new_epoch()}
+    sets = ['updated_at = :now', 'epoch = if_not_exists(epoch, :epoch)']
+    removes = []
+    added_ids = set(entry['file_id'] for entry in added)
+    for index, file_id in enumerate(removed):
+        # An entry added again is overwritten by its SET, only counted
+        if listed and file_id in added_ids:
+            continue
+        names['#r{}'.format(index)] = ENTRY_PREFIX + file_id
+        removes.append('#r{}'.format(index))
+    if listed:
+        for index, entry in enumerate(added):
+            names['#a{}'.format(index)] = ENTRY_PREFIX + entry['file_id']
+            values[':a{}'.format(index)] = entry
+            sets.append('#a{0} = :a{0}'.format(index))
+        values[':count'] = len(added) - len(removed)
+        values[':true'] = True
+        increments = 'version :one, file_count :count'
+        condition = 'complete = :true'
+        # A file deleted twice would be counted twice, the manifest is rebuilt instead
+        for name in removes:
+            condition += ' AND attribute_exists({})'.format(name)
+        if added:
+            values[':room'] = get_max_files() - len(added) + len(removed)
+            condition += ' AND file_count <= :room'
+    else:
+        # Missing files or too many of them: the listing uses the index
+        values[':false'] = False
+        sets.append('complete = :false')
+        if overflow:
+            values[':true'] = True
+            sets.append('overflow = :true')
+        elif not added:
+            # Fewer files than before, a rebuild may fit again
+            removes.append('overflow')
+        increments = 'version :one'
+        condition = None
+    expression = 'SET {}'.format(', '.join(sets))
+    if removes:
+        expression += ' REMOVE {}'.format(', '.join(removes))
+    expression += ' ADD {}'.format(increments)
+    update = {
+        'Key': {'user_id': user_id},
+        'UpdateExpression': expression,
+        'ExpressionAttributeValues': values
+    }
+    if names:
+        update['ExpressionAttributeNames'] = names
+    if condition is not None:
+        update['ConditionExpression'] = condition
+        # Tells a full manifest from an incomplete one
+        update['ReturnValuesOnConditionCheckFailure'] = 'ALL_OLD'
+    return {'Update': update}
+
+
+def write(user_id, operations, added=(), removed=()):
+    '''Write file records and update the manifest of their user, atomically
+
+    The operations are TransactWriteItems items of the files table, with
+    plain values. A TransactionCanceledException is raised when one of
+    them fails.
+    '''
+    client = aws_clients.get_client('dynamodb')
+    files_table = os.environ['FILE_SHARING_TABLE']
+    items = []
+    for operation in operations:
+        item = to_transact_item(operation, files_table)
+        # A transaction touches an item once, replaced uploads may repeat
+        if item not in items:
+            items.append(item)
+    removed = list(dict.fromkeys(removed))
+    manifest_table = os.environ[constants.FILE_MANIFEST_TABLE]
+    try:
+        client.transact_write_items(TransactItems=items + [to_transact_item(
+            build_update(user_id, added, removed),
+            manifest_table
+        )])
+        return
+    except client.exceptions.TransactionCanceledException as error:
+        reasons = error.response.get('CancellationReasons', [])
+        codes = [reason.get('Code') for reason in reasons]
+        # Only the manifest failed: incomplete, full, or past the item size
+        if codes[:-1] != ['None'] * len(items) or \
+                codes[-1:] not in (['ConditionalCheckFailed'], ['ValidationError']):
+            raise
+        manifest_item = reasons[-1].get('Item') or {}
+        # A complete manifest fails on its size, or on an entry already removed
+        overflow = codes[-1] == 'ValidationError' or (
+            manifest_item.get('complete', {}).get('BOOL', False) and bool(added) and
+            int(manifest_item.get('file_count', {}).get('N', 0)) + len(added) - len(removed) > get_max_files()
+        )
+    LOGGER.info('The manifest of %s does not list its files', user_id)
+    client.transact_write_items(TransactItems=items + [to_transact_item(
+        build_update(user_id, added, removed, listed=False, overflow=overflow),
+        manifest_table
+    )])
+
+
+def write_all(user_id, changes):
+    '''Write the changes of many files in as few transactions as possible
+
+    A change is a list of operations with the entries it adds and the
+    file ids it removes. Return the changes which were not written.
+    '''
+    failed = []
+    group = []
+    group_size = 0
+    for change in changes + [None]:
+        if group and (change is None or group_size + len(change[0]) + 1 > MAX_TRANSACT_ITEMS):
+            try:
+                write(
+                    user_id,
+                    [operation for operations, _, _ in group for operation in operations],
+                    [entry for _, added, _ in group for entry in added],
+                    [file_id for _, _, removed in group for file_id in removed]
+                )
+            except Exception as error:
+                LOGGER.error(error)
+                failed.extend(group)
+            group = []
+            group_size = 0
+        if change is not None:
+            group.append(change)
+            group_size += len(change[0])
+    return failed
+
+
+def read(user_id):
+    '''Get the manifest item of a user, None if there is none'''
+    # The files and the version of the listing come from this read, an
+    # eventually consistent one could pair a new version with old files
+    return get_manifest_table().get_item(Key={'user_id': user_id}, ConsistentRead=True).get('Item')
+
+
+def read_head(user_id):
+    '''Get the version of the manifest of a user, without its entries, None if there is none'''
+    return get_manifest_table().get_item(
+        Key={'user_id': user_id},
+        ConsistentRead=True,
+        ProjectionExpression=', '.join(HEAD_ATTRIBUTES)
+    ).get('Item')
+
+
+def is_settled(manifest_item):
+    '''The index shows every change counted by the version of the manifest'''
+    return time.time() - int(manifest_item.get('updated_at', 0)) >= SETTLE_DELAY
+
+
+def list_files(manifest_item):
+    '''The entries of a complete manifest, by file name, None when it is incomplete'''
+    if manifest_item is None or not manifest_item.get('complete'):
+        return None
+    return sorted(
+        (value for name, value in manifest_item.items() if name.startswith(ENTRY_PREFIX)),
+        key=lambda entry: entry['file_name']
+    )
+
+
+def get_index_files(user_id, max_files):
+    '''All the uploaded files of a user from the index, None past max_files'''
+    from boto3.dynamodb.conditions import Key, Attr
+    table = aws_clients.get_table(os.environ['FILE_SHARING_TABLE'])
+    query_args = {
+        'IndexName': os.getenv(constants.USER_FILES_INDEX, constants.DEFAULT_USER_FILES_INDEX),
+        'KeyConditionExpression': Key('user_id').eq(user_id),
+        'FilterExpression': Attr('file_status').not_exists() |
+                            Attr('file_status').ne(constants.FILE_STATUS_PENDING),
+        'ProjectionExpression': 'file_id, file_name, file_size'
+    }
+    files = []
+    while True:
+        response = table.query(**query_args)
+        files.extend(
+            build_entry(item['file_id'], item['file_name'], item.get('file_size'))
+            for item in response['Items']
+        )
+        if len(files) > max_files:
+            return None
+        if 'LastEvaluatedKey' not in response:
+            return files
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def rebuild(user_id, manifest_item):
+    '''List the files of the user in a new manifest, return whether it was stored'''
+    if manifest_item is not None and (
+            manifest_item.get('overflow') or not is_settled(manifest_item)):
+        # Too many files, or writes the index may not show yet
+        return False
+    table = get_manifest_table()
+    if manifest_item is None:
+        condition = {'ConditionExpression': 'attribute_not_exists(user_id)'}
+    else:
+        # The files did not change since the manifest was read
+        condition = {
+            'ConditionExpression': 'version = :version',
+            'ExpressionAttributeValues': {':version': manifest_item.get('version', 0)}
+        }
+    files = get_index_files(user_id, get_max_files())
+    try:
+        if files is None:
+            table.update_item(
+                Key={'user_id': user_id},
+                # The epoch lets the listing tag the index pages once settled
+                UpdateExpression='SET overflow = :true, epoch = if_not_exists(epoch, :epoch)',
+                ExpressionAttributeValues=dict(
+                    condition.get('ExpressionAttributeValues', {}),
+                    **{':true': True, ':epoch': new_epoch()}
+                ),
+                ConditionExpression=condition['ConditionExpression']
+            )
+            return False
+        item = {
+            'user_id': user_id,
+            'complete': True,
+            'file_count': len(files),
+            'version': manifest_item.get('version', 0) if manifest_item else 0,
+            'epoch': manifest_item.get('epoch', new_epoch()) if manifest_item else new_epoch(),
+            'updated_at': int(time.time())
+        }
+        for entry in files:
+            item[ENTRY_PREFIX + entry['file_id']] = entry
+        table.put_item(Item=item, **condition)
+        return True
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
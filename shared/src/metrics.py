@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Time the stages of an invocation and report them to CloudWatch'''
+
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+import contextlib
+
+
+METRICS_ENABLED = 'METRICS_ENABLED'
+METRICS_NAMESPACE = 'METRICS_NAMESPACE'
+DEFAULT_METRICS_NAMESPACE = 'SmallFileSharing'
+# Short stage names of the AWS services, the others keep their own
+SERVICE_STAGES = {
+    'cognito-idp': 'cognito',
+    'sesv2': 'ses'
+}
+
+LOGGER = logging.getLogger(__name__)
+_LOCK = threading.Lock()
+_COLD_START = True
+_CURRENT = None
+
+
+class Invocation():
+    '''The stage timings of one invocation'''
+
+    def __init__(self, function_name, request_id=None):
+        global _COLD_START
+        self.function_name = function_name
+        self.request_id = request_id
+        self.cold_start = _COLD_START
+        _COLD_START = False
+        self.started_at = time.perf_counter()
+        self.stages = {}
+
+    def record(self, stage, elapsed):
+        '''Add the duration, in seconds, of one run of a stage'''
+        # Batch uploads and shares run stages from several threads
+        with _LOCK:
+            count, total = self.stages.get(stage, (0, 0.0))
+            self.stages[stage] = (count + 1, total + elapsed)
+
+    def summary(self, status_code=None):
+        '''The timings of the invocation, in milliseconds'''
+        return {
+            'function': self.function_name,
+            'request_id': self.request_id,
+            'cold_start': self.cold_start,
+            'status_code': status_code,
+            'duration_ms': round((time.perf_counter() - self.started_at) * 1000, 3),
+            'stages': {
+                stage: {'count': count, 'duration_ms': round(total * 1000, 3)}
+                for stage, (count, total) in sorted(self.stages.items())
+            }
+        }
+
+
+def is_enabled():
+    '''Metrics are emitted unless METRICS_ENABLED is false'''
+    return os.getenv(METRICS_ENABLED, 'true').lower() not in ('0', 'false', 'no')
+
+
+def record(stage, elapsed):
+    '''Add the duration of a stage to the running invocation'''
+    invocation = _CURRENT
+    if invocation is not None:
+        invocation.record(stage, elapsed)
+
+
+@contextlib.contextmanager
+def stage(name):
+    '''Time the enclosed block as a stage of the running invocation'''
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started_at)
+
+
+def timed(name):
+    '''Time every call of the decorated function as a stage'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _before_call(model, context, **_):
+    context['metrics_started_at'] = time.perf_counter()
+
+
+def _after_call(model, context, **_):
+    started_at = context.pop('metrics_started_at', None)
+    if started_at is not None:
+        service = model.service_model.service_name
+        record(SERVICE_STAGES.get(service, service), time.perf_counter() - started_at)
+
+
+def instrument_session(session):
+    '''Time every AWS call of the clients built by a boto3 session'''
+    session.events.register('before-call', _before_call, unique_id='metrics-before-call')
+    session.events.register('after-call', _after_call, unique_id='metrics-after-call')
+
+
+def build_emf_record(summary, namespace):
+    '''Build the CloudWatch Embedded Metric Format record of a summary'''
+    metric_names = ['duration'] + ['{}.duration'.format(name) for name in summary['stages']]
+    emf_record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [['Function', 'ColdStart']],
+                'Metrics': [
+                    {'Name': name, 'Unit': 'Milliseconds'} for name in metric_names
+                ]
+            }]
+        },
+        'Function': summary['function'],
+        'ColdStart': str(summary['cold_start']).lower(),
+        'RequestId': summary['request_id'],
+        'StatusCode': summary['status_code'],
+        'duration': summary['duration_ms']
+    }
+    for name, timings in summary['stages'].items():
+        emf_record['{}.duration'.format(name)] = timings['duration_ms']
+        emf_record['{}.count'.format(name)] = timings['count']
+    return emf_record
+
+
+def emit(summary):
+    '''Write the EMF record, then the summary line of an invocation'''
+    emf_record = build_emf_record(
+        summary,
+        os.getenv(METRICS_NAMESPACE, DEFAULT_METRICS_NAMESPACE)
+    )
+    # CloudWatch only extracts the metrics of the log lines which are bare JSON
+    sys.stdout.write(json.dumps(emf_record)+'\n')
+    sys.stdout.flush()
+    LOGGER.info(json.dumps(summary))
+
+
+def instrument_handler(function_name):
+    '''Time the decorated Lambda handler and emit its metrics'''
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _CURRENT
+            invocation = Invocation(function_name, getattr(context, 'aws_request_id', None))
+            _CURRENT = invocation
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _CURRENT = None
+                if is_enabled():
+                    status_code = response.get('statusCode') if isinstance(response, dict) else None
+                    emit(invocation.summary(status_code))
+        return wrapper
+    return decorator
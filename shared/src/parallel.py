@@ -0,0 +1,46 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Run the independent calls of a request side by side
+
+The calls run on a thread pool kept by the container. The AWS clients are
+thread safe and release the GIL while waiting on the network, so a request
+waits for its slowest call rather than for their sum. A call running on
+the pool never submits another one, which could wait for a free thread
+forever.
+'''
+
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+# A request overlaps a few calls at most
+MAX_WORKERS = 4
+
+_LOCK = threading.Lock()
+_EXECUTOR = None
+
+
+def get_executor():
+    '''Get the thread pool of the container, started on first use'''
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    return _EXECUTOR
+
+
+@contextlib.contextmanager
+def background(function, *args, **kwargs):
+    '''Run a call while the block runs, its future raises what the call raised
+
+    The block waits for the call on its way out, even when it returns or
+    raises early: a call left running would be frozen with the container
+    and resumed in the middle of the next request.
+    '''
+    future = get_executor().submit(function, *args, **kwargs)
+    try:
+        yield future
+    finally:
+        wait([future])
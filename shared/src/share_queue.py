@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Queue of the share jobs sent by share-file to the share-mailer worker'''
+
+import os
+import json
+import uuid
+import fcntl
+import aws_clients
+
+
+LOCAL_QUEUE_PREFIX = 'local://'
+
+
+class SqsQueue():
+    '''The share jobs queue in SQS'''
+
+    def __init__(self, queue_url, region=None):
+        self.queue_url = queue_url
+        self.region = region
+
+    def send(self, job):
+        '''Queue a share job'''
+        sqs_client = aws_clients.get_client('sqs', self.region)
+        sqs_client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(job)
+        )
+
+
+class LocalQueue():
+    '''A JSON lines file standing in for SQS when running locally'''
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, job):
+        '''Queue a share job'''
+        with open(self.path, 'a') as queue_file:
+            fcntl.flock(queue_file, fcntl.LOCK_EX)
+            queue_file.write(json.dumps(job)+'\n')
+
+    def receive_event(self, max_records=10):
+        '''Pop up to max_records jobs as an SQS event for the worker'''
+        if not os.path.exists(self.path):
+            return {'Records': []}
+        with open(self.path, 'r+') as queue_file:
+            fcntl.flock(queue_file, fcntl.LOCK_EX)
+            lines = queue_file.readlines()
+            queue_file.seek(0)
+            queue_file.writelines(lines[max_records:])
+            queue_file.truncate()
+        return {
+            'Records': [
+                {
+                    'messageId': str(uuid.uuid4()),
+                    'eventSource': 'aws:sqs',
+                    'body': line.strip()
+                }
+                for line in lines[:max_records]
+            ]
+        }
+
+
+def get_queue(queue_url, region=None):
+    '''Get the queue behind a SHARE_QUEUE_URL'''
+    if queue_url.startswith(LOCAL_QUEUE_PREFIX):
+        return LocalQueue(queue_url[len(LOCAL_QUEUE_PREFIX):])
+    return SqsQueue(queue_url, region)
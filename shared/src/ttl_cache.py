@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Bounded LRU cache with per entry expiration'''
+
+import time
+import threading
+import collections
+
+
+MISSING = object()
+
+
+class TTLCache():
+    '''Least recently used cache whose entries expire after a TTL
+
+    Shared by the invocations of a warm container, hence thread safe.
+    '''
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''Get the cached value or MISSING'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value, ttl=None):
+        '''Cache a value, evicting the least recently used one when full'''
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        '''Drop a cached value'''
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        '''Drop every cached value'''
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        '''Get the hit and miss counters'''
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,138 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Cognito user profiles cached across the invocations of a container'''
+
+import os
+import time
+import logging
+import aws_clients
+import ttl_cache
+
+
+USER_CACHE_SIZE = 'USER_CACHE_SIZE'
+DEFAULT_USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 'USER_CACHE_TTL'
+DEFAULT_USER_CACHE_TTL = 300
+USER_CACHE_NEGATIVE_TTL = 'USER_CACHE_NEGATIVE_TTL'
+DEFAULT_USER_CACHE_NEGATIVE_TTL = 60
+USER_CACHE_TABLE = 'USER_CACHE_TABLE'
+
+LOGGER = logging.getLogger(__name__)
+# Unknown users are cached too, so they do not hit Cognito on every call
+_UNKNOWN_USER = None
+
+_CACHE = ttl_cache.TTLCache(
+    int(os.getenv(USER_CACHE_SIZE, DEFAULT_USER_CACHE_SIZE)),
+    int(os.getenv(USER_CACHE_TTL, DEFAULT_USER_CACHE_TTL))
+)
+_BACKEND = None
+
+
+class UserNotFoundError(Exception):
+    '''The user does not exist in the user pool'''
+
+
+class DynamoDBProfileBackend():
+    '''Second cache tier shared by all the containers, in a DynamoDB table
+
+    The table is keyed by username and its expires_at attribute should be
+    the table TTL attribute.
+    '''
+
+    def __init__(self, table_name, region=None):
+        self.table_name = table_name
+        self.region = region
+
+    def get(self, username):
+        '''Get a cached profile or None'''
+        table = aws_clients.get_table(self.table_name, self.region)
+        item = table.get_item(Key={'username': username}).get('Item')
+        # DynamoDB TTL deletes expired items lazily, ignore them meanwhile
+        if item is None or item['expires_at'] < time.time():
+            return None
+        return item['profile']
+
+    def put(self, username, profile, ttl):
+        '''Cache a profile'''
+        table = aws_clients.get_table(self.table_name, self.region)
+        table.put_item(
+            Item={
+                'username': username,
+                'profile': profile,
+                'expires_at': int(time.time()) + ttl
+            }
+        )
+
+
+def set_backend(backend):
+    '''Plug a second cache tier with get(username) and put(username, profile, ttl)'''
+    global _BACKEND
+    _BACKEND = backend
+
+
+def get_backend():
+    '''Get the second cache tier, the USER_CACHE_TABLE one by default'''
+    global _BACKEND
+    if _BACKEND is None and os.getenv(USER_CACHE_TABLE):
+        _BACKEND = DynamoDBProfileBackend(os.environ[USER_CACHE_TABLE])
+    return _BACKEND
+
+
+def fetch_user_profile(user_pool_id, username, region=None):
+    '''Read a user profile from Cognito'''
+    cup_client = aws_clients.get_client('cognito-idp', region)
+    try:
+        response = cup_client.admin_get_user(
+            UserPoolId=user_pool_id,
+            Username=username
+        )
+    except aws_clients.client_error() as error:
+        if error.response['Error']['Code'] == 'UserNotFoundException':
+            return _UNKNOWN_USER
+        raise
+    profile = {
+        'user_id': response.get('Username'),
+        'name': None,
+        'email': None
+    }
+    for attr in response['UserAttributes']:
+        if attr['Name'] in ('name', 'email'):
+            profile[attr['Name']] = attr['Value']
+    return profile
+
+
+def get_user_profile(user_pool_id, username, region=None):
+    '''Get a user profile, from Cognito only once per TTL window'''
+    profile = _CACHE.get(username)
+    if profile is ttl_cache.MISSING:
+        backend = get_backend()
+        profile = None
+        if backend is not None:
+            try:
+                profile = backend.get(username)
+            except Exception as error:
+                LOGGER.warning('User cache backend unavailable: %s', error)
+        if profile is None:
+            profile = fetch_user_profile(user_pool_id, username, region)
+            if profile is not _UNKNOWN_USER and backend is not None:
+                try:
+                    backend.put(username, profile, _CACHE.ttl)
+                except Exception as error:
+                    LOGGER.warning('User cache backend unavailable: %s', error)
+        if profile is _UNKNOWN_USER:
+            _CACHE.set(
+                username,
+                profile,
+                int(os.getenv(USER_CACHE_NEGATIVE_TTL, DEFAULT_USER_CACHE_NEGATIVE_TTL))
+            )
+        else:
+            _CACHE.set(username, profile)
+    LOGGER.debug('User cache stats: %s', _CACHE.stats())
+    if profile is _UNKNOWN_USER:
+        raise UserNotFoundError('User {} not found'.format(username))
+    return profile
+
+
+def cache_stats():
+    '''Get the hit and miss counters of the container cache'''
+    return _CACHE.stats()
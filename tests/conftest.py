@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+'''Fixtures of the tests, run against moto stand-ins of the AWS services'''
+
+import io
+import os
+import sys
+import importlib
+import contextlib
+import collections
+import boto3
+import pytest
+from moto import mock_aws
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import harness  # pylint: disable=wrong-import-position
+
+
+@pytest.fixture
+def load_module():
+    '''Import a module of a function afresh, along with its sibling modules
+
+    The functions import the shared modules (constants, aws_clients...),
+    which keep caches at module level, so every test gets modules of its own.
+    '''
+    loaded = []
+
+    def load(function_folder, module_name):
+        src = os.path.join(ROOT, function_folder, 'src')
+        names = set(
+            name[:-3] for folder in (src, harness.SHARED_SRC)
+            for name in os.listdir(folder) if name.endswith('.py')
+        )
+        for name in names:
+            sys.modules.pop(name, None)
+        sys.path[0:0] = [src, harness.SHARED_SRC]
+        loaded.append((src, names))
+        return importlib.import_module(module_name)
+
+    yield load
+    for src, names in loaded:
+        sys.path.remove(src)
+        sys.path.remove(harness.SHARED_SRC)
+        for name in names:
+            sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def aws(tmp_path):
+    '''The moto resources, the user and the token of the benchmarks'''
+    environ = dict(os.environ)
+    try:
+        with mock_aws():
+            env = harness.Environment(str(tmp_path / 'jwks.json'))
+            env.setup()
+            yield env
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+@pytest.fixture
+def create_table(aws):  # pylint: disable=unused-argument
+    '''Create a table with one of the create commands of manage_table.py'''
+    table_args = collections.namedtuple('TableArgs', ['table', 'index'])
+
+    def create(command, table):
+        with contextlib.redirect_stdout(io.StringIO()):
+            getattr(harness.manage_table, command)(boto3.client('dynamodb'), table_args(table, None))
+
+    return create
@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+'''Tests of the base64 reader of upload-file'''
+
+import io
+import os
+import base64
+import hashlib
+import binascii
+import pytest
+
+
+@pytest.fixture
+def b64_stream(load_module):
+    return load_module('endpoints/upload-file', 'b64_stream')
+
+
+@pytest.mark.parametrize('size', [0, 1, 2, 3, 4, 5, 6, 1023, 1024, 1025])
+@pytest.mark.parametrize('chunk_size', [4, 5, 8, 1024])
+def test_decodes_every_padding_and_chunk_size(b64_stream, size, chunk_size):
+    data = os.urandom(size)
+    reader = b64_stream.Base64Reader(base64.b64encode(data).decode('ascii'), chunk_size)
+    assert reader.read() == data
+
+
+def test_short_reads_cross_the_chunk_boundaries(b64_stream):
+    data = os.urandom(1000)
+    reader = b64_stream.Base64Reader(base64.b64encode(data).decode('ascii'), 8)
+    assert b''.join(iter(lambda: reader.read(7), b'')) == data
+
+
+def test_read_fills_the_requested_size_until_the_end(b64_stream):
+    data = os.urandom(100)
+    reader = b64_stream.Base64Reader(base64.b64encode(data).decode('ascii'), 4)
+    assert len(reader.read(64)) == 64
+    assert reader.read(64) == data[64:]
+    assert reader.read(64) == b''
+
+
+@pytest.mark.parametrize('chunk_size', [4, 10, 77, 1024])
+def test_drops_line_breaks_like_b64decode(b64_stream, chunk_size):
+    encoded = base64.encodebytes(os.urandom(500)).decode('ascii')
+    reader = b64_stream.Base64Reader(encoded, chunk_size)
+    assert reader.read() == base64.b64decode(encoded)
+
+
+def test_rejects_a_truncated_string(b64_stream):
+    with pytest.raises(binascii.Error):
+        b64_stream.Base64Reader('QUJ').read()
+
+
+def test_rewinds_for_the_retries(b64_stream):
+    data = os.urandom(300)
+    reader = b64_stream.Base64Reader(base64.b64encode(data).decode('ascii'), 8)
+    reader.read(100)
+    assert reader.tell() == 100
+    assert reader.seek(0) == 0
+    assert reader.read() == data
+    assert not reader.seekable()
+    with pytest.raises(io.UnsupportedOperation):
+        reader.seek(10)
+
+
+def test_open_data_reads_raw_bytes_as_is(b64_stream):
+    assert b64_stream.open_data(b'raw body').read() == b'raw body'
+
+
+def test_digest_hashes_the_decoded_content(b64_stream):
+    data = os.urandom(5000)
+    digest = b64_stream.digest(base64.b64encode(data).decode('ascii'), 64)
+    assert digest.sha256 == hashlib.sha256(data).hexdigest()
+    assert digest.md5_base64 == base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+    assert digest.size == len(data)
+    assert b64_stream.digest(data) == digest
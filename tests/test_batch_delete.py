@@ -0,0 +1,194 @@
+#! /usr/bin/env python
+'''Tests of the single and batch deletes, and of the records they put back'''
+
+import os
+import json
+import types
+import boto3
+import pytest
+import harness
+import scenarios
+
+
+MANIFESTS_TABLE = 'tests-manifests'
+FILES_PATH = '/v1/users/{}/files'.format(harness.USER_ID)
+
+
+@pytest.fixture(params=[False, True], ids=['index', 'manifest'])
+def delete_user_file(request, aws, create_table, load_module, monkeypatch):  # pylint: disable=unused-argument
+    if request.param:
+        create_table('create_manifests_table', MANIFESTS_TABLE)
+        monkeypatch.setenv('FILE_MANIFEST_TABLE', MANIFESTS_TABLE)
+    return load_module('endpoints/delete-user-file', 'delete_user_file')
+
+
+def batch_delete(aws, delete_user_file, body):
+    response = delete_user_file.lambda_handler(
+        harness.build_event('POST', FILES_PATH + ':batchDelete', aws.token(), body),
+        None
+    )
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])
+
+
+def delete_one(aws, delete_user_file, file_id):
+    return delete_user_file.lambda_handler(
+        harness.build_event('DELETE', '{}/{}'.format(FILES_PATH, file_id), aws.token()),
+        None
+    )
+
+
+def read_record(file_id):
+    return boto3.resource('dynamodb').Table(harness.FILES_TABLE).get_item(
+        Key={'file_id': file_id}
+    ).get('Item')
+
+
+def list_keys():
+    response = boto3.client('s3').list_objects_v2(Bucket=harness.FILES_BUCKET)
+    return sorted(entry['Key'] for entry in response.get('Contents', []))
+
+
+def get_s3_client(delete_user_file):
+    '''The client the deletes go through, to plant failures on'''
+    batch = delete_user_file.batch_delete
+    return batch.aws_clients.get_client('s3', os.getenv(batch.constants.REGION))
+
+
+def fail_delete_objects(delete_user_file):
+    '''Make every DeleteObjects call fail'''
+    def fail(**_):
+        raise delete_user_file.aws_clients.client_error()(
+            {'Error': {'Code': 'ServiceUnavailable', 'Message': 'Try again'}},
+            'DeleteObjects'
+        )
+    get_s3_client(delete_user_file).meta.events.register('provide-client-params.s3.DeleteObjects', fail)
+
+
+def refuse_keys(delete_user_file, refused_keys):
+    '''Answer DeleteObjects with an error for some keys, without deleting anything'''
+    def answer(params, **_):
+        errors = [
+            {'Key': key, 'Code': 'AccessDenied', 'Message': 'Access Denied'}
+            for key in refused_keys
+        ]
+        return types.SimpleNamespace(status_code=200, headers={}), {'Errors': errors, 'ResponseMetadata': {}}
+    get_s3_client(delete_user_file).meta.events.register('before-call.s3.DeleteObjects', answer)
+
+
+def test_unknown_and_foreign_files_are_not_found(aws, delete_user_file):
+    (file_id, file_name), = scenarios.write_files(harness.USER_ID, 1, upload_objects=True)
+    (foreign_id, foreign_name), = scenarios.write_files('other-user', 1, upload_objects=True)
+    response_body = batch_delete(aws, delete_user_file, {'file_ids': [file_id, 'unknown', foreign_id, file_id]})
+    assert (response_body['deleted'], response_body['failed']) == (1, 0)
+    assert response_body['files'] == [
+        {'file_id': file_id, 'file_name': file_name, 'file_status': 'DELETED'},
+        {'file_id': 'unknown', 'file_status': 'NOT_FOUND'},
+        {'file_id': foreign_id, 'file_status': 'NOT_FOUND'}
+    ]
+    assert read_record(file_id) is None
+    assert read_record(foreign_id) is not None
+    assert list_keys() == ['other-user/' + foreign_name]
+
+
+def test_all_files_deletes_every_file_of_the_user(aws, delete_user_file):
+    files = scenarios.write_files(harness.USER_ID, 30, upload_objects=True)
+    (foreign_id, foreign_name), = scenarios.write_files('other-user', 1, upload_objects=True)
+    response_body = batch_delete(aws, delete_user_file, {'all_files': True})
+    assert response_body['deleted'] == 30
+    assert sorted(result['file_id'] for result in response_body['files']) == sorted(file_id for file_id, _ in files)
+    assert all(read_record(file_id) is None for file_id, _ in files)
+    assert read_record(foreign_id) is not None
+    assert list_keys() == ['other-user/' + foreign_name]
+
+
+def test_a_refused_object_keeps_its_record(aws, delete_user_file):
+    (kept_id, kept_name), (deleted_id, _) = scenarios.write_files(harness.USER_ID, 2, upload_objects=True)
+    refuse_keys(delete_user_file, [harness.USER_ID + '/' + kept_name])
+    response_body = batch_delete(aws, delete_user_file, {'file_ids': [kept_id, deleted_id]})
+    assert (response_body['deleted'], response_body['failed']) == (1, 1)
+    assert response_body['files'][0] == {
+        'file_id': kept_id,
+        'file_name': kept_name,
+        'file_status': 'FAILED',
+        'error': 'Access Denied'
+    }
+    assert read_record(kept_id)['file_name'] == kept_name
+    assert read_record(deleted_id) is None
+
+
+def test_a_failed_object_delete_restores_the_records(aws, delete_user_file):
+    files = scenarios.write_files(harness.USER_ID, 3, upload_objects=True)
+    fail_delete_objects(delete_user_file)
+    response_body = batch_delete(aws, delete_user_file, {'all_files': True})
+    assert (response_body['deleted'], response_body['failed']) == (0, 3)
+    for file_id, file_name in files:
+        record = read_record(file_id)
+        assert (record['file_name'], record['file_status']) == (file_name, 'UPLOADED')
+    assert len(list_keys()) == 3
+
+
+def write_pending_file(file_name):
+    '''Stage a direct upload over the name of an uploaded file'''
+    file_id = 'pending-id'
+    boto3.resource('dynamodb').Table(harness.FILES_TABLE).put_item(Item={
+        'file_id': file_id,
+        'file_name': file_name,
+        'user_id': harness.USER_ID,
+        'file_status': 'PENDING'
+    })
+    boto3.client('s3').put_object(
+        Bucket=harness.FILES_BUCKET,
+        Key='pending/{}/{}'.format(harness.USER_ID, file_id),
+        Body=b'staged data\n'
+    )
+    return file_id
+
+
+def test_a_pending_file_deletes_its_staged_object_only(aws, delete_user_file):
+    (file_id, file_name), = scenarios.write_files(harness.USER_ID, 1, upload_objects=True)
+    pending_id = write_pending_file(file_name)
+    response_body = batch_delete(aws, delete_user_file, {'file_ids': [pending_id]})
+    assert response_body['files'][0]['file_status'] == 'DELETED'
+    assert read_record(pending_id) is None
+    assert read_record(file_id) is not None
+    assert list_keys() == [harness.USER_ID + '/' + file_name]
+
+
+def test_a_failed_pending_delete_restores_its_record(aws, delete_user_file):
+    (_, file_name), = scenarios.write_files(harness.USER_ID, 1, upload_objects=True)
+    pending_id = write_pending_file(file_name)
+    fail_delete_objects(delete_user_file)
+    response_body = batch_delete(aws, delete_user_file, {'file_ids': [pending_id]})
+    assert response_body['files'][0]['file_status'] == 'FAILED'
+    assert read_record(pending_id)['file_status'] == 'PENDING'
+
+
+def test_a_single_delete_removes_the_object_and_the_record(aws, delete_user_file):
+    (file_id, file_name), (other_id, other_name) = scenarios.write_files(harness.USER_ID, 2, upload_objects=True)
+    response = delete_one(aws, delete_user_file, file_id)
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == {
+        'user_id': harness.USER_ID,
+        'file_id': file_id,
+        'file_name': file_name,
+        'file_status': 'DELETED'
+    }
+    assert read_record(file_id) is None
+    assert read_record(other_id) is not None
+    assert list_keys() == [harness.USER_ID + '/' + other_name]
+    assert delete_one(aws, delete_user_file, file_id)['statusCode'] == 401
+
+
+def test_a_single_delete_of_a_foreign_file_is_refused(aws, delete_user_file):
+    (foreign_id, _), = scenarios.write_files('other-user', 1, upload_objects=True)
+    assert delete_one(aws, delete_user_file, foreign_id)['statusCode'] == 401
+    assert read_record(foreign_id) is not None
+
+
+def test_a_failed_single_delete_restores_the_record(aws, delete_user_file):
+    (file_id, file_name), = scenarios.write_files(harness.USER_ID, 1, upload_objects=True)
+    fail_delete_objects(delete_user_file)
+    assert delete_one(aws, delete_user_file, file_id)['statusCode'] == 400
+    assert read_record(file_id)['file_name'] == file_name
+    assert list_keys() == [harness.USER_ID + '/' + file_name]
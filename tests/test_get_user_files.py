@@ -0,0 +1,162 @@
+#! /usr/bin/env python
+'''Tests of the listing ETag, derived from the version of the manifest'''
+
+import json
+import base64
+import boto3
+import pytest
+import harness
+import scenarios
+
+
+MANIFESTS_TABLE = 'tests-manifests'
+FILES_PATH = '/v1/users/{}/files'.format(harness.USER_ID)
+
+
+@pytest.fixture
+def endpoints(aws, create_table, load_module, monkeypatch):
+    '''The listing, upload and delete handlers, sharing a manifests table'''
+    create_table('create_manifests_table', MANIFESTS_TABLE)
+    monkeypatch.setenv('FILE_MANIFEST_TABLE', MANIFESTS_TABLE)
+    handlers = {}
+    for name, (endpoint, module_name) in harness.ENDPOINTS.items():
+        if name != 'share':
+            handlers[name] = load_module('endpoints/' + endpoint, module_name)
+    return handlers
+
+
+def list_files(aws, endpoints, if_none_match=None, **query):
+    event = harness.build_event('GET', FILES_PATH, aws.token(), queryStringParameters=query or None)
+    if if_none_match is not None:
+        event['headers']['If-None-Match'] = if_none_match
+    return endpoints['list'].lambda_handler(event, None)
+
+
+def upload(aws, endpoints, file_name):
+    response = endpoints['upload'].lambda_handler(harness.build_event('POST', FILES_PATH, aws.token(), {
+        'file_data': base64.b64encode(b'tests data\n').decode('ascii'),
+        'remote_file_name': file_name
+    }), None)
+    assert response['statusCode'] == 201
+    return json.loads(response['body'])['file_id']
+
+
+def file_names(response):
+    return [entry['file_name'] for entry in json.loads(response['body'])['user_files']]
+
+
+def test_index_pages_carry_no_etag(aws, endpoints):
+    scenarios.write_files(harness.USER_ID, 2)
+    response = list_files(aws, endpoints, if_none_match='*')
+    assert response['statusCode'] == 200
+    assert 'ETag' not in response['headers']
+    assert file_names(response) == ['file-00000000.txt', 'file-00000001.txt']
+
+
+def test_manifest_pages_carry_an_etag(aws, endpoints):
+    scenarios.write_files(harness.USER_ID, 3)
+    list_files(aws, endpoints)
+    response = list_files(aws, endpoints, limit='2')
+    etag = response['headers']['ETag']
+    assert etag.startswith('W/"')
+    assert response['headers']['Cache-Control'] == 'private, no-cache'
+    assert 'ETag' in response['headers']['Access-Control-Expose-Headers']
+    next_token = json.loads(response['body'])['next_token']
+    next_page = list_files(aws, endpoints, limit='2', next_token=next_token)
+    assert file_names(next_page) == ['file-00000002.txt']
+    assert next_page['headers']['ETag'] == etag
+
+
+def record_reads(endpoints):
+    '''The projections of the GetItem calls of the listing'''
+    reads = []
+    table = endpoints['list'].aws_clients.get_table(MANIFESTS_TABLE)
+    table.meta.client.meta.events.register(
+        'provide-client-params.dynamodb',
+        lambda params, model, **_: reads.append((model.name, params.get('ProjectionExpression')))
+    )
+    return reads
+
+
+def test_a_matching_etag_answers_304_from_the_version_alone(aws, endpoints):
+    scenarios.write_files(harness.USER_ID, 2)
+    list_files(aws, endpoints)
+    etag = list_files(aws, endpoints)['headers']['ETag']
+    reads = record_reads(endpoints)
+    response = list_files(aws, endpoints, if_none_match=etag)
+    assert response['statusCode'] == 304
+    assert response['body'] == ''
+    assert response['headers']['ETag'] == etag
+    assert reads == [('GetItem', 'epoch, version, complete, overflow, updated_at')]
+    # A strong tag of the same version matches as well
+    assert list_files(aws, endpoints, if_none_match='"other", ' + etag[2:])['statusCode'] == 304
+
+
+def test_an_outdated_etag_reads_the_entries(aws, endpoints):
+    list_files(aws, endpoints)
+    etag = list_files(aws, endpoints)['headers']['ETag']
+    upload(aws, endpoints, 'uploaded.txt')
+    reads = record_reads(endpoints)
+    response = list_files(aws, endpoints, if_none_match=etag)
+    assert response['statusCode'] == 200
+    assert file_names(response) == ['uploaded.txt']
+    assert [name for name, _ in reads] == ['GetItem', 'GetItem']
+    assert reads[1][1] is None
+
+
+def test_an_overflowed_listing_is_tagged_once_the_index_settled(aws, endpoints, monkeypatch):
+    monkeypatch.setenv('MANIFEST_MAX_FILES', '2')
+    scenarios.write_files(harness.USER_ID, 3)
+    list_files(aws, endpoints)
+    etag = list_files(aws, endpoints)['headers']['ETag']
+    assert list_files(aws, endpoints, if_none_match=etag)['statusCode'] == 304
+    upload(aws, endpoints, 'uploaded.txt')
+    response = list_files(aws, endpoints, if_none_match=etag)
+    assert response['statusCode'] == 200
+    assert 'ETag' not in response['headers']
+    monkeypatch.setattr(endpoints['list'].manifest, 'SETTLE_DELAY', -1)
+    response = list_files(aws, endpoints, if_none_match=etag)
+    assert response['statusCode'] == 200
+    assert len(file_names(response)) == 4
+    assert response['headers']['ETag'] != etag
+
+
+def test_the_etag_changes_with_uploads_and_deletes(aws, endpoints):
+    list_files(aws, endpoints)
+    empty_etag = list_files(aws, endpoints)['headers']['ETag']
+    file_id = upload(aws, endpoints, 'uploaded.txt')
+    response = list_files(aws, endpoints, if_none_match=empty_etag)
+    assert response['statusCode'] == 200
+    assert file_names(response) == ['uploaded.txt']
+    uploaded_etag = response['headers']['ETag']
+    assert uploaded_etag != empty_etag
+    delete_event = harness.build_event('DELETE', FILES_PATH + '/' + file_id, aws.token())
+    assert endpoints['delete'].lambda_handler(delete_event, None)['statusCode'] == 200
+    response = list_files(aws, endpoints, if_none_match=uploaded_etag)
+    assert response['statusCode'] == 200
+    assert file_names(response) == []
+    assert response['headers']['ETag'] not in (empty_etag, uploaded_etag)
+
+
+def test_a_rebuilt_manifest_does_not_match_the_old_etags(aws, endpoints):
+    list_files(aws, endpoints)
+    etag = list_files(aws, endpoints)['headers']['ETag']
+    boto3.resource('dynamodb').Table(MANIFESTS_TABLE).delete_item(Key={'user_id': harness.USER_ID})
+    assert 'ETag' not in list_files(aws, endpoints, if_none_match=etag)['headers']
+    response = list_files(aws, endpoints, if_none_match=etag)
+    assert response['statusCode'] == 200
+    assert response['headers']['ETag'] != etag
+
+
+@pytest.mark.parametrize('if_none_match, matches', [
+    (None, False),
+    ('', False),
+    ('*', True),
+    ('W/"abc-1"', True),
+    ('"abc-1"', True),
+    ('W/"abc-2", W/"abc-1"', True),
+    ('W/"abc-2"', False),
+    ('"abc-10"', False)
+])
+def test_etag_matches_compares_weakly(endpoints, if_none_match, matches):
+    assert endpoints['list'].etag_matches(if_none_match, 'W/"abc-1"') is matches
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+'''Tests of the Idempotency-Key lock and of the upload replays'''
+
+import json
+import base64
+import boto3
+import pytest
+import harness
+
+
+IDEMPOTENCY_TABLE = 'tests-idempotency'
+FILES_PATH = '/v1/users/{}/files'.format(harness.USER_ID)
+
+
+@pytest.fixture
+def upload_file(aws, create_table, load_module, monkeypatch):  # pylint: disable=unused-argument
+    create_table('create_idempotency_table', IDEMPOTENCY_TABLE)
+    monkeypatch.setenv('IDEMPOTENCY_TABLE', IDEMPOTENCY_TABLE)
+    return load_module('endpoints/upload-file', 'upload_file')
+
+
+@pytest.fixture
+def idempotency(upload_file):
+    return upload_file.idempotency
+
+
+def read_record(key):
+    record_key = '{}/{}'.format(harness.USER_ID, key)
+    table = boto3.resource('dynamodb').Table(IDEMPOTENCY_TABLE)
+    return table.get_item(Key={'idempotency_key': record_key}).get('Item')
+
+
+def test_a_key_in_progress_is_refused(idempotency):
+    assert idempotency.start(harness.USER_ID, 'key', 'hash') is None
+    assert read_record('key')['record_status'] == 'IN_PROGRESS'
+    with pytest.raises(idempotency.IdempotencyError) as error:
+        idempotency.start(harness.USER_ID, 'key', 'hash')
+    assert error.value.status_code == 409
+
+
+def test_a_key_reused_by_another_request_is_refused(idempotency):
+    idempotency.start(harness.USER_ID, 'key', 'hash')
+    idempotency.complete(harness.USER_ID, 'key', 201, {'file_id': 'id'}, 3600)
+    with pytest.raises(idempotency.IdempotencyError) as error:
+        idempotency.start(harness.USER_ID, 'key', 'other hash')
+    assert error.value.status_code == 422
+
+
+def test_a_completed_key_replays_its_response(idempotency):
+    idempotency.start(harness.USER_ID, 'key', 'hash')
+    idempotency.complete(harness.USER_ID, 'key', 201, {'file_id': 'id', 'file_status': 'UPLOADED'}, 3600)
+    status_code, response_body = idempotency.start(harness.USER_ID, 'key', 'hash')
+    assert status_code == 201
+    assert list(response_body.items()) == [('file_id', 'id'), ('file_status', 'UPLOADED')]
+
+
+def test_an_abandoned_lock_is_taken_over(idempotency, monkeypatch):
+    monkeypatch.setattr(idempotency, 'LOCK_TIMEOUT', -1)
+    assert idempotency.start(harness.USER_ID, 'key', 'hash') is None
+    assert idempotency.start(harness.USER_ID, 'key', 'other hash') is None
+    assert read_record('key')['request_hash'] == 'other hash'
+
+
+def test_a_released_key_runs_again(idempotency):
+    idempotency.start(harness.USER_ID, 'key', 'hash')
+    idempotency.release(harness.USER_ID, 'key')
+    assert read_record('key') is None
+    assert idempotency.start(harness.USER_ID, 'key', 'hash') is None
+
+
+def test_the_keys_of_users_do_not_collide(idempotency):
+    idempotency.start(harness.USER_ID, 'key', 'hash')
+    assert idempotency.start('other-user', 'key', 'hash') is None
+
+
+def test_a_long_key_is_refused(idempotency):
+    with pytest.raises(idempotency.IdempotencyError) as error:
+        idempotency.start(harness.USER_ID, 'k' * 256, 'hash')
+    assert error.value.status_code == 400
+
+
+def upload_event(aws, key, file_data=b'tests data\n'):
+    event = harness.build_event('POST', FILES_PATH, aws.token(), {
+        'file_data': base64.b64encode(file_data).decode('ascii'),
+        'remote_file_name': 'idempotent.txt'
+    })
+    event['headers']['Idempotency-Key'] = key
+    return event
+
+
+def test_a_retried_upload_is_stored_once(aws, upload_file):
+    first = upload_file.lambda_handler(upload_event(aws, 'upload-1'), None)
+    assert first['statusCode'] == 201
+    counter = harness.CallCounter()
+    upload_file.aws_clients.get_client('s3').meta.events.register('before-call', counter)
+    retry = upload_file.lambda_handler(upload_event(aws, 'upload-1'), None)
+    assert retry['statusCode'] == 201
+    assert json.loads(retry['body']) == json.loads(first['body'])
+    assert counter.calls['s3'] == 0
+    other = upload_file.lambda_handler(upload_event(aws, 'upload-1', b'other data\n'), None)
+    assert other['statusCode'] == 422
+
+
+def test_a_failed_upload_releases_its_key(aws, upload_file):
+    event = upload_event(aws, 'upload-1')
+
+    def fail():
+        raise Exception('Internal server error')
+
+    with pytest.raises(Exception, match='Internal server error'):
+        upload_file.run_idempotent(event, harness.USER_ID, upload_file.init_env_vars(), fail)
+    assert read_record('upload-1') is None
+    assert upload_file.lambda_handler(event, None)['statusCode'] == 201
+    assert read_record('upload-1')['record_status'] == 'COMPLETED'
@@ -0,0 +1,127 @@
+#! /usr/bin/env python
+'''Tests of the token verification against a local JWKS file'''
+
+import json
+import time
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+USER_POOL_ID = 'eu-west-1_tests'
+ISSUER = 'https://cognito-idp.eu-west-1.amazonaws.com/eu-west-1_tests'
+CLIENT_ID = 'tests-client'
+
+
+def new_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def write_jwks(path, keys):
+    jwks = []
+    for kid, key in keys.items():
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+        jwk.update({'kid': kid, 'alg': 'RS256', 'use': 'sig'})
+        jwks.append(jwk)
+    with open(path, 'w') as jwks_file:
+        json.dump({'keys': jwks}, jwks_file)
+
+
+def sign(key, kid='key-1', **claims):
+    payload = {
+        'cognito:username': 'tests-user',
+        'token_use': 'id',
+        'aud': CLIENT_ID,
+        'iss': ISSUER,
+        'exp': int(time.time()) + 3600
+    }
+    payload.update(claims)
+    return jwt.encode(payload, key, algorithm='RS256', headers={'kid': kid})
+
+
+@pytest.fixture
+def key():
+    return new_key()
+
+
+@pytest.fixture
+def jwks_file(tmp_path, key):
+    path = str(tmp_path / 'jwks.json')
+    write_jwks(path, {'key-1': key})
+    return path
+
+
+@pytest.fixture
+def jwt_verifier(load_module, monkeypatch, jwks_file):
+    monkeypatch.setenv('JWKS_FILE', jwks_file)
+    return load_module('endpoints/get-user-files', 'jwt_verifier')
+
+
+def test_returns_the_claims_of_a_valid_token(jwt_verifier, key):
+    claims = jwt_verifier.verify_token(sign(key), USER_POOL_ID, CLIENT_ID)
+    assert jwt_verifier.identity_from_claims(claims) == ('tests-user', None, None)
+
+
+def test_rejects_a_bad_signature(jwt_verifier):
+    with pytest.raises(jwt_verifier.InvalidTokenError):
+        jwt_verifier.verify_token(sign(new_key()), USER_POOL_ID, CLIENT_ID)
+
+
+def test_rejects_an_expired_token(jwt_verifier, key):
+    with pytest.raises(jwt_verifier.InvalidTokenError):
+        jwt_verifier.verify_token(sign(key, exp=int(time.time()) - 60), USER_POOL_ID)
+
+
+def test_rejects_another_issuer(jwt_verifier, key):
+    token = sign(key, iss='https://cognito-idp.eu-west-1.amazonaws.com/eu-west-1_other')
+    with pytest.raises(jwt_verifier.InvalidTokenError):
+        jwt_verifier.verify_token(token, USER_POOL_ID)
+
+
+def test_rejects_a_refresh_token_use(jwt_verifier, key):
+    with pytest.raises(jwt_verifier.InvalidTokenError, match='token use'):
+        jwt_verifier.verify_token(sign(key, token_use='refresh'), USER_POOL_ID)
+
+
+def test_checks_the_client_of_id_and_access_tokens(jwt_verifier, key):
+    with pytest.raises(jwt_verifier.InvalidTokenError, match='another client'):
+        jwt_verifier.verify_token(sign(key, aud='other-client'), USER_POOL_ID, CLIENT_ID)
+    access_token = sign(key, token_use='access', aud=None, client_id=CLIENT_ID)
+    assert jwt_verifier.verify_token(access_token, USER_POOL_ID, CLIENT_ID)['client_id'] == CLIENT_ID
+    with pytest.raises(jwt_verifier.InvalidTokenError, match='another client'):
+        jwt_verifier.verify_token(access_token, USER_POOL_ID, 'other-client')
+
+
+def test_skips_the_client_check_without_a_client_id(jwt_verifier, key):
+    token = sign(key, aud='other-client')
+    assert jwt_verifier.verify_token(token, USER_POOL_ID, None)['aud'] == 'other-client'
+    assert jwt_verifier.verify_token(token, USER_POOL_ID, '')['aud'] == 'other-client'
+
+
+def test_refreshes_on_an_unknown_kid_at_most_every_interval(jwt_verifier, key, jwks_file, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jwt_verifier.time, 'monotonic', lambda: now[0])
+    jwt_verifier.verify_token(sign(key), USER_POOL_ID)
+    rotated_key = new_key()
+    write_jwks(jwks_file, {'key-1': key, 'key-2': rotated_key})
+    token = sign(rotated_key, kid='key-2')
+    with pytest.raises(jwt_verifier.InvalidTokenError, match='Unknown signing key'):
+        jwt_verifier.verify_token(token, USER_POOL_ID)
+    now[0] += jwt_verifier.MIN_REFRESH_INTERVAL + 1
+    assert jwt_verifier.verify_token(token, USER_POOL_ID)['token_use'] == 'id'
+
+
+def test_keeps_the_known_keys_when_a_refresh_fails(jwt_verifier, key, jwks_file, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jwt_verifier.time, 'monotonic', lambda: now[0])
+    jwt_verifier.verify_token(sign(key), USER_POOL_ID)
+    with open(jwks_file, 'w') as broken_file:
+        broken_file.write('not json')
+    now[0] += jwt_verifier.DEFAULT_JWKS_TTL + 1
+    assert jwt_verifier.verify_token(sign(key), USER_POOL_ID)['token_use'] == 'id'
+
+
+@pytest.mark.parametrize('authorization', ['', 'Bearer', 'Basic abc', 'Bearer a b'])
+def test_rejects_a_malformed_authorization_header(jwt_verifier, authorization):
+    with pytest.raises(jwt_verifier.InvalidTokenError):
+        jwt_verifier.extract_bearer_token(authorization)
@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+'''Tests of the per-user manifests written along with the file records'''
+
+import uuid
+import boto3
+import pytest
+import harness
+
+
+MANIFESTS_TABLE = 'tests-manifests'
+
+
+@pytest.fixture
+def manifest(aws, create_table, load_module, monkeypatch):  # pylint: disable=unused-argument
+    create_table('create_manifests_table', MANIFESTS_TABLE)
+    monkeypatch.setenv('FILE_MANIFEST_TABLE', MANIFESTS_TABLE)
+    monkeypatch.setenv('MANIFEST_MAX_FILES', '3')
+    module = load_module('endpoints/upload-file', 'manifest')
+    # The index shows the writes at once in moto
+    monkeypatch.setattr(module, 'SETTLE_DELAY', -1)
+    return module
+
+
+def upload(manifest, count=1, user_id=harness.USER_ID):
+    '''Write new file records with their manifest update, return their entries'''
+    entries = [
+        manifest.build_entry(str(uuid.uuid4()), 'file-{}.txt'.format(index), 16)
+        for index in range(count)
+    ]
+    manifest.write(
+        user_id,
+        [{'Put': {'Item': dict(entry, user_id=user_id)}} for entry in entries],
+        added=entries
+    )
+    return entries
+
+
+def delete(manifest, file_ids, user_id=harness.USER_ID):
+    manifest.write(
+        user_id,
+        [{'Delete': {'Key': {'file_id': file_id}}} for file_id in file_ids],
+        removed=file_ids
+    )
+
+
+def read_item(user_id=harness.USER_ID):
+    return boto3.resource('dynamodb').Table(MANIFESTS_TABLE).get_item(Key={'user_id': user_id}).get('Item')
+
+
+def test_listed_update_keeps_the_entries(manifest):
+    entry = manifest.build_entry('added', 'added.txt')
+    update = manifest.build_update('user', [entry], ['removed'])['Update']
+    assert update['ExpressionAttributeNames'] == {'#r0': 'f_removed', '#a0': 'f_added'}
+    assert update['ExpressionAttributeValues'][':a0'] == entry
+    assert update['ExpressionAttributeValues'][':count'] == 0
+    assert update['ExpressionAttributeValues'][':room'] == 3
+    assert update['ConditionExpression'] == \
+        'complete = :true AND attribute_exists(#r0) AND file_count <= :room'
+    assert 'REMOVE #r0' in update['UpdateExpression']
+
+
+def test_listed_update_overwrites_an_entry_added_again(manifest):
+    entry = manifest.build_entry('same', 'same.txt')
+    update = manifest.build_update('user', [entry], ['same'])['Update']
+    assert 'REMOVE' not in update['UpdateExpression']
+    assert update['ExpressionAttributeValues'][':count'] == 0
+
+
+def test_unlisted_update_only_bumps_the_version(manifest):
+    update = manifest.build_update('user', [], ['removed'], listed=False)['Update']
+    assert 'ConditionExpression' not in update
+    assert 'complete = :false' in update['UpdateExpression']
+    assert update['UpdateExpression'].endswith('REMOVE #r0, overflow ADD version :one')
+    update = manifest.build_update('user', [manifest.build_entry('a', 'a.txt')], [], listed=False, overflow=True)['Update']
+    assert 'overflow = :true' in update['UpdateExpression']
+    assert 'ExpressionAttributeNames' not in update
+
+
+def test_write_without_a_manifest_falls_back_to_unlisted(manifest):
+    entry, = upload(manifest)
+    item = read_item()
+    assert item['complete'] is False
+    assert item['version'] == 1
+    assert item['epoch']
+    assert 'f_' + entry['file_id'] not in item
+    assert manifest.list_files(manifest.read(harness.USER_ID)) is None
+    record = boto3.resource('dynamodb').Table(harness.FILES_TABLE).get_item(Key={'file_id': entry['file_id']})
+    assert record['Item']['file_name'] == entry['file_name']
+
+
+def test_rebuild_lists_the_index_then_writes_keep_it_listed(manifest):
+    first, = upload(manifest)
+    assert manifest.rebuild(harness.USER_ID, manifest.read(harness.USER_ID))
+    rebuilt = manifest.read(harness.USER_ID)
+    assert [entry['file_id'] for entry in manifest.list_files(rebuilt)] == [first['file_id']]
+    second, = upload(manifest)
+    delete(manifest, [first['file_id']])
+    item = manifest.read(harness.USER_ID)
+    assert manifest.list_files(item) == [second]
+    assert item['file_count'] == 1
+    assert item['version'] == rebuilt['version'] + 2
+    assert item['epoch'] == rebuilt['epoch']
+
+
+def test_rebuild_fails_when_the_files_changed_since_the_read(manifest):
+    upload(manifest)
+    stale = manifest.read(harness.USER_ID)
+    upload(manifest)
+    assert not manifest.rebuild(harness.USER_ID, stale)
+    assert manifest.rebuild(harness.USER_ID, manifest.read(harness.USER_ID))
+    assert len(manifest.list_files(manifest.read(harness.USER_ID))) == 2
+
+
+def test_a_full_manifest_overflows_until_files_are_removed(manifest):
+    assert manifest.rebuild(harness.USER_ID, None)
+    entries = upload(manifest, 2)
+    upload(manifest, 2)
+    item = manifest.read(harness.USER_ID)
+    assert item['complete'] is False
+    assert item['overflow'] is True
+    assert not manifest.rebuild(harness.USER_ID, item)
+    delete(manifest, [entries[0]['file_id']])
+    item = manifest.read(harness.USER_ID)
+    assert 'overflow' not in item
+    assert manifest.rebuild(harness.USER_ID, item)
+    assert len(manifest.list_files(manifest.read(harness.USER_ID))) == 3
+
+
+def test_a_rebuild_past_the_limit_marks_the_overflow(manifest):
+    upload(manifest, 4)
+    assert not manifest.rebuild(harness.USER_ID, manifest.read(harness.USER_ID))
+    assert manifest.read(harness.USER_ID)['overflow'] is True
+
+
+def test_removing_an_unlisted_entry_makes_the_manifest_incomplete(manifest):
+    assert manifest.rebuild(harness.USER_ID, None)
+    delete(manifest, ['unknown-file'])
+    item = manifest.read(harness.USER_ID)
+    assert item['complete'] is False
+    assert 'overflow' not in item
+    assert item['file_count'] == 0
+
+
+def test_a_failed_file_operation_is_raised(manifest):
+    entry, = upload(manifest)
+    with pytest.raises(manifest.aws_clients.client_error(), match='TransactionCanceled'):
+        manifest.write(harness.USER_ID, [{'Put': {
+            'Item': dict(entry, user_id=harness.USER_ID),
+            'ConditionExpression': 'attribute_not_exists(file_id)'
+        }}], added=[entry])
+    assert read_item()['version'] == 1
+
+
+def test_write_all_groups_the_changes_by_transaction(manifest, monkeypatch):
+    monkeypatch.setenv('MANIFEST_MAX_FILES', '1000')
+    assert manifest.rebuild(harness.USER_ID, None)
+    calls = []
+    manifest.aws_clients.get_client('dynamodb').meta.events.register(
+        'provide-client-params.dynamodb.TransactWriteItems',
+        lambda params, **_: calls.append(len(params['TransactItems']))
+    )
+    changes = []
+    for index in range(150):
+        entry = manifest.build_entry(str(uuid.uuid4()), 'file-{}.txt'.format(index))
+        changes.append(([{'Put': {'Item': dict(entry, user_id=harness.USER_ID)}}], [entry], []))
+    assert manifest.write_all(harness.USER_ID, changes) == []
+    assert calls == [100, 52]
+    item = manifest.read(harness.USER_ID)
+    assert item['file_count'] == 150
+    assert len(manifest.list_files(item)) == 150
@@ -0,0 +1,27 @@
+#! /usr/bin/env python
+'''Tests of the module layout the deployment zips are built from'''
+
+import os
+import pytest
+import harness
+import package
+from import_profile import HANDLERS, SERVED_FUNCTIONS
+
+
+@pytest.mark.parametrize('name', sorted(HANDLERS))
+def test_every_function_reaches_its_modules_and_the_shared_ones(name):
+    local_modules = package.find_local_modules(package.source_folders(name))
+    handlers = [
+        os.path.splitext(os.path.basename(HANDLERS[function]))[0]
+        for function in [name] + SERVED_FUNCTIONS.get(name, [])
+    ]
+    modules, _ = package.collect_modules(local_modules, handlers)
+    assert set(handlers) <= modules
+    assert 'aws_clients' in modules
+    assert os.path.dirname(local_modules['aws_clients']) == harness.SHARED_SRC
+
+
+def test_a_module_shadowing_a_shared_one_is_refused(tmp_path):
+    (tmp_path / 'constants.py').write_text('REGION = None\n')
+    with pytest.raises(RuntimeError):
+        package.find_local_modules([str(tmp_path), harness.SHARED_SRC])
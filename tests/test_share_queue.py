@@ -0,0 +1,68 @@
+#! /usr/bin/env python
+'''Tests of the local share queue and of the worker draining it'''
+
+import json
+import boto3
+import pytest
+import harness
+import scenarios
+
+
+def test_local_queue_pops_the_jobs_in_order(load_module, tmp_path):
+    share_queue = load_module('endpoints/share-file', 'share_queue')
+    queue = share_queue.get_queue('local://' + str(tmp_path / 'queue.jsonl'))
+    assert queue.receive_event()['Records'] == []
+    for index in range(5):
+        queue.send({'share_id': str(index)})
+    first = queue.receive_event(3)['Records']
+    assert [json.loads(record['body'])['share_id'] for record in first] == ['0', '1', '2']
+    assert all(record['eventSource'] == 'aws:sqs' for record in first)
+    rest = queue.receive_event(3)['Records']
+    assert [json.loads(record['body'])['share_id'] for record in rest] == ['3', '4']
+    assert queue.receive_event(3)['Records'] == []
+
+
+@pytest.fixture
+def shared_file(aws, create_table, load_module, tmp_path, monkeypatch):
+    '''Queue the share of a file with two recipients in a local queue'''
+    create_table('create_shares_table', 'tests-shares')
+    monkeypatch.setenv('SHARE_STATUS_TABLE', 'tests-shares')
+    monkeypatch.setenv('SHARE_QUEUE_URL', 'local://' + str(tmp_path / 'queue.jsonl'))
+    (file_id, _), = scenarios.write_files(harness.USER_ID, 1, upload_objects=True)
+    share_file = load_module('endpoints/share-file', 'share_file')
+    response = share_file.lambda_handler(harness.build_event(
+        'POST',
+        '/v1/users/{}/files/{}/share'.format(harness.USER_ID, file_id),
+        aws.token(),
+        {'share_with': ['one@example.com', 'two@example.com']}
+    ), None)
+    assert response['statusCode'] == 202
+    return file_id, json.loads(response['body'])['share_id']
+
+
+def test_worker_drains_the_local_queue(shared_file, load_module):
+    file_id, share_id = shared_file
+    share_mailer = load_module('workers/share-mailer', 'share_mailer')
+    assert share_mailer.drain_local_queue(share_mailer.os.environ['SHARE_QUEUE_URL']) == []
+    assert boto3.client('ses').get_send_quota()['SentLast24Hours'] == 2
+    status = boto3.resource('dynamodb').Table('tests-shares').get_item(Key={'share_id': share_id})['Item']
+    assert status['share_status'] == 'SHARED'
+    assert status['file_id'] == file_id
+    assert set(status['recipients']) == {'one@example.com', 'two@example.com'}
+    share_queue = load_module('workers/share-mailer', 'share_queue')
+    assert share_queue.get_queue(share_mailer.os.environ['SHARE_QUEUE_URL']).receive_event()['Records'] == []
+
+
+def test_worker_command_refuses_an_sqs_queue(load_module):
+    share_mailer = load_module('workers/share-mailer', 'share_mailer')
+    with pytest.raises(SystemExit):
+        share_mailer.main(['https://sqs.eu-west-1.amazonaws.com/123456789012/shares'])
+
+
+def test_compressed_files_are_downloaded_as_their_original(load_module):
+    mailer = load_module('workers/share-mailer', 'mailer')
+    assert mailer.get_download_params('bucket', 'user/report.csv') == {'Bucket': 'bucket', 'Key': 'user/report.csv'}
+    params = mailer.get_download_params('bucket', 'user/my report.csv', 'gzip')
+    assert params['ResponseContentEncoding'] == 'gzip'
+    assert params['ResponseContentType'] == 'text/csv'
+    assert params['ResponseContentDisposition'] == "attachment; filename*=UTF-8''my%20report.csv"
@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+'''Tests of the upload sessions and of the commits of the direct uploads'''
+
+import os
+import json
+import base64
+import boto3
+import pytest
+from botocore.config import Config
+import harness
+
+
+FILES_PATH = '/v1/users/{}/files'.format(harness.USER_ID)
+UPLOADS_PATH = '/v1/users/{}/uploads'.format(harness.USER_ID)
+
+
+@pytest.fixture
+def upload_file(aws, load_module):  # pylint: disable=unused-argument
+    return load_module('endpoints/upload-file', 'upload_file')
+
+
+def call(aws, upload_file, method, path, body=None, **extra):
+    response = upload_file.lambda_handler(harness.build_event(method, path, aws.token(), body, **extra), None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def create_session(aws, upload_file, file_name='session.bin'):
+    status_code, response_body = call(aws, upload_file, 'POST', UPLOADS_PATH, {'remote_file_name': file_name})
+    assert status_code == 201
+    return response_body
+
+
+def send_part(aws, upload_file, upload_id, part_number, data):
+    return call(
+        aws, upload_file, 'PUT', '{}/{}/parts/{}'.format(UPLOADS_PATH, upload_id, part_number),
+        body=base64.b64encode(data).decode('ascii'),
+        isBase64Encoded=True
+    )
+
+
+def read_record(file_id):
+    return boto3.resource('dynamodb').Table(harness.FILES_TABLE).get_item(
+        Key={'file_id': file_id}
+    ).get('Item')
+
+
+def read_object(file_key):
+    # moto answers the composite checksum of a multipart object as a whole object one
+    s3_client = boto3.client('s3', config=Config(response_checksum_validation='when_required'))
+    return s3_client.get_object(Bucket=harness.FILES_BUCKET, Key=file_key)['Body'].read()
+
+
+def list_keys():
+    response = boto3.client('s3').list_objects_v2(Bucket=harness.FILES_BUCKET)
+    return sorted(entry['Key'] for entry in response.get('Contents', []))
+
+
+def test_a_session_assembles_its_parts_under_the_file_id_of_its_name(aws, upload_file):
+    session = create_session(aws, upload_file)
+    assert session['status'] == 'IN_PROGRESS'
+    assert read_record(session['file_id'])['file_status'] == 'PENDING'
+    first, last = os.urandom(upload_file.upload_sessions.MIN_PART_SIZE), b'last part\n'
+    # Parts can be sent in any order, and sent again
+    assert send_part(aws, upload_file, session['upload_id'], 2, last)[0] == 200
+    status_code, part = send_part(aws, upload_file, session['upload_id'], 1, first)
+    assert (status_code, part['part_number'], part['size']) == (200, 1, len(first))
+    assert send_part(aws, upload_file, session['upload_id'], 2, last)[0] == 200
+    status_code, listed = call(aws, upload_file, 'GET', '{}/{}'.format(UPLOADS_PATH, session['upload_id']))
+    assert status_code == 200
+    assert [(part['part_number'], part['size']) for part in listed['parts']] == [(1, len(first)), (2, len(last))]
+    status_code, response_body = call(aws, upload_file, 'POST', '{}/{}/complete'.format(UPLOADS_PATH, session['upload_id']))
+    file_id = upload_file.file_records.build_file_id(harness.USER_ID, 'session.bin')
+    assert (status_code, response_body) == (200, {'file_id': file_id, 'status': 'UPLOADED'})
+    assert read_record(file_id)['file_size'] == len(first) + len(last)
+    assert read_record(session['file_id'])['committed_file_id'] == file_id
+    assert read_object(harness.USER_ID + '/session.bin') == first + last
+    assert list_keys() == [harness.USER_ID + '/session.bin']
+    # The session is closed
+    assert call(aws, upload_file, 'GET', '{}/{}'.format(UPLOADS_PATH, session['upload_id']))[0] == 404
+
+
+def test_small_parts_are_refused_on_completion(aws, upload_file):
+    session = create_session(aws, upload_file)
+    send_part(aws, upload_file, session['upload_id'], 1, b'too small\n')
+    send_part(aws, upload_file, session['upload_id'], 2, b'last part\n')
+    status_code, response_body = call(aws, upload_file, 'POST', '{}/{}/complete'.format(UPLOADS_PATH, session['upload_id']))
+    assert status_code == 400
+    assert 'at least' in response_body['message']
+    # Still open, the parts can be sent again
+    assert call(aws, upload_file, 'GET', '{}/{}'.format(UPLOADS_PATH, session['upload_id']))[0] == 200
+
+
+def test_a_session_without_parts_cannot_complete(aws, upload_file):
+    session = create_session(aws, upload_file)
+    status_code, _ = call(aws, upload_file, 'POST', '{}/{}/complete'.format(UPLOADS_PATH, session['upload_id']))
+    assert status_code == 400
+
+
+def test_an_aborted_session_drops_its_parts_and_pending_file(aws, upload_file):
+    session = create_session(aws, upload_file)
+    send_part(aws, upload_file, session['upload_id'], 1, b'part\n')
+    status_code, response_body = call(aws, upload_file, 'DELETE', '{}/{}'.format(UPLOADS_PATH, session['upload_id']))
+    assert (status_code, response_body['status']) == (200, 'ABORTED')
+    assert read_record(session['file_id']) is None
+    uploads = boto3.client('s3').list_multipart_uploads(Bucket=harness.FILES_BUCKET)
+    assert uploads.get('Uploads', []) == []
+    assert call(aws, upload_file, 'DELETE', '{}/{}'.format(UPLOADS_PATH, session['upload_id']))[0] == 404
+
+
+def test_an_expired_session_is_not_found(aws, upload_file, monkeypatch):
+    monkeypatch.setenv('UPLOAD_SESSION_TTL', '0')
+    session = create_session(aws, upload_file)
+    assert send_part(aws, upload_file, session['upload_id'], 1, b'part\n')[0] == 404
+    assert call(aws, upload_file, 'POST', '{}/{}/complete'.format(UPLOADS_PATH, session['upload_id']))[0] == 404
+
+
+@pytest.mark.parametrize('part_number', ['0', '10001', 'one'])
+def test_a_part_number_out_of_range_is_refused(aws, upload_file, part_number):
+    session = create_session(aws, upload_file)
+    assert send_part(aws, upload_file, session['upload_id'], part_number, b'part\n')[0] == 400
+
+
+def test_the_sessions_of_another_user_are_refused(aws, upload_file):
+    session = create_session(aws, upload_file)
+    other_path = '/v1/users/other-user/uploads/{}'.format(session['upload_id'])
+    assert call(aws, upload_file, 'GET', other_path)[0] == 401
+
+
+def create_upload_url(aws, upload_file, file_name='direct.txt'):
+    status_code, response_body = call(aws, upload_file, 'POST', FILES_PATH, {
+        'remote_file_name': file_name,
+        'upload_mode': 'presigned_put'
+    })
+    assert (status_code, response_body['status']) == (201, 'PENDING')
+    return response_body['file_id']
+
+
+def put_staged_object(user_id, file_id, data=b'direct data\n'):
+    boto3.client('s3').put_object(
+        Bucket=harness.FILES_BUCKET,
+        Key='pending/{}/{}'.format(user_id, file_id),
+        Body=data,
+        Metadata={'file-id': file_id}
+    )
+
+
+def object_created_event(file_key):
+    return {'Records': [{'eventName': 'ObjectCreated:Put', 's3': {'object': {'key': file_key}}}]}
+
+
+def finalize(aws, upload_file, file_id, user_id=harness.USER_ID):
+    return call(aws, upload_file, 'POST', '/v1/users/{}/files/{}/finalize'.format(user_id, file_id))
+
+
+def test_finalize_moves_the_staged_object_over_the_live_one(aws, upload_file):
+    status_code, response_body = call(aws, upload_file, 'POST', FILES_PATH, {
+        'file_data': base64.b64encode(b'old\n').decode('ascii'),
+        'remote_file_name': 'direct.txt'
+    })
+    assert status_code == 201
+    file_id = response_body['file_id']
+    pending_id = create_upload_url(aws, upload_file)
+    # Not uploaded yet: still pending, the live object is untouched
+    assert finalize(aws, upload_file, pending_id) == (200, {'file_id': pending_id, 'status': 'PENDING'})
+    assert read_object(harness.USER_ID + '/direct.txt') == b'old\n'
+    put_staged_object(harness.USER_ID, pending_id)
+    assert finalize(aws, upload_file, pending_id) == (200, {'file_id': file_id, 'status': 'UPLOADED'})
+    record = read_record(file_id)
+    assert (record['file_name'], record['file_status'], record['file_size']) == ('direct.txt', 'UPLOADED', 12)
+    assert read_object(harness.USER_ID + '/direct.txt') == b'direct data\n'
+    assert list_keys() == [harness.USER_ID + '/direct.txt']
+    # The retries and the late S3 event get the committed file
+    assert finalize(aws, upload_file, pending_id) == (200, {'file_id': file_id, 'status': 'UPLOADED'})
+    upload_file.lambda_handler(object_created_event('pending/{}/{}'.format(harness.USER_ID, pending_id)), None)
+    assert list_keys() == [harness.USER_ID + '/direct.txt']
+
+
+def test_the_object_created_event_commits_the_staged_uploads_only(aws, upload_file):
+    pending_id = create_upload_url(aws, upload_file)
+    put_staged_object(harness.USER_ID, pending_id)
+    upload_file.lambda_handler(object_created_event(harness.USER_ID + '/direct.txt'), None)
+    assert read_record(pending_id)['file_status'] == 'PENDING'
+    upload_file.lambda_handler(object_created_event('pending/{}/{}'.format(harness.USER_ID, pending_id)), None)
+    file_id = upload_file.file_records.build_file_id(harness.USER_ID, 'direct.txt')
+    assert read_record(file_id)['file_status'] == 'UPLOADED'
+    assert read_object(harness.USER_ID + '/direct.txt') == b'direct data\n'
+
+
+def test_a_staged_object_outside_the_owner_prefix_is_not_committed(aws, upload_file):
+    pending_id = create_upload_url(aws, upload_file)
+    put_staged_object('other-user', pending_id)
+    upload_file.lambda_handler(object_created_event('pending/other-user/{}'.format(pending_id)), None)
+    assert read_record(pending_id)['file_status'] == 'PENDING'
+    assert list_keys() == ['pending/other-user/' + pending_id]
+
+
+def test_the_files_of_another_user_cannot_be_finalized(aws, upload_file):
+    pending_id = create_upload_url(aws, upload_file)
+    put_staged_object(harness.USER_ID, pending_id)
+    assert finalize(aws, upload_file, pending_id, user_id='other-user')[0] == 401
+    boto3.resource('dynamodb').Table(harness.FILES_TABLE).update_item(
+        Key={'file_id': pending_id},
+        UpdateExpression='SET user_id = :user_id',
+        ExpressionAttributeValues={':user_id': 'other-user'}
+    )
+    assert finalize(aws, upload_file, pending_id)[0] == 401
+    assert read_record(pending_id)['file_status'] == 'PENDING'
+    assert list_keys() == ['pending/{}/{}'.format(harness.USER_ID, pending_id)]
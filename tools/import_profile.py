@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+'''Report the import cost of the Lambda handlers, module by module'''
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLERS = {
+    'upload-file': 'endpoints/upload-file/src/upload_file.py',
+    'get-user-files': 'endpoints/get-user-files/src/get_user_files.py',
+    'delete-user-file': 'endpoints/delete-user-file/src/delete_user_file.py',
+    'share-file': 'endpoints/share-file/src/share_file.py',
+    'share-mailer': 'workers/share-mailer/src/share_mailer.py',
+    'router': 'endpoints/router/src/router.py'
+}
+# The functions which also run the modules of other functions
+SERVED_FUNCTIONS = {
+    'router': ['upload-file', 'get-user-files', 'delete-user-file', 'share-file']
+}
+# The modules used by several functions, packaged with each of them
+SHARED_FOLDER = 'shared/src'
+
+
+def source_folders(name):
+    '''The folders holding the modules of a function, its own first'''
+    return [
+        os.path.dirname(os.path.join(ROOT, HANDLERS[function]))
+        for function in [name] + SERVED_FUNCTIONS.get(name, [])
+    ] + [os.path.join(ROOT, SHARED_FOLDER)]
+
+
+def profile_imports(name, python):
+    '''Import a handler in a fresh interpreter and parse -X importtime'''
+    folders = source_folders(name)
+    module = os.path.splitext(os.path.basename(HANDLERS[name]))[0]
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        cwd=folders[0],
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(folders), PYTHONDONTWRITEBYTECODE='1'),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError('Cannot import {}:\n{}'.format(module, result.stderr))
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        imports.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip())) // 2,
+            'self_ms': int(self_us) / 1000.0,
+            'cumulative_ms': int(cumulative_us) / 1000.0
+        })
+    return module, imports
+
+
+def top_level_costs(imports):
+    '''Aggregate the cumulative cost by top level package'''
+    packages = {}
+    for entry in imports:
+        package = entry['module'].split('.')[0]
+        packages[package] = packages.get(package, 0.0) + entry['self_ms']
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def report(name, module, imports, top):
+    '''Print the total, the costliest packages and the costliest modules'''
+    handler = next((entry for entry in imports if entry['module'] == module), None)
+    total = handler['cumulative_ms'] if handler else sum(entry['self_ms'] for entry in imports)
+    print('{}: {:.1f}ms to import {}'.format(name, total, module))
+    print('  by package (self time):')
+    for package, cost in top_level_costs(imports)[:top]:
+        print('    {:<40} {:>9.1f}ms'.format(package, cost))
+    print('  by module (cumulative time):')
+    for entry in sorted(imports, key=lambda item: item['cumulative_ms'], reverse=True)[:top]:
+        print('    {:<40} {:>9.1f}ms'.format(entry['module'], entry['cumulative_ms']))
+
+
+def parse_args(argv):
+    '''Parse the command line'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'handlers',
+        nargs='*',
+        metavar='function',
+        help='The functions to profile among {}, all of them by default'.format(
+            ', '.join(sorted(HANDLERS))
+        )
+    )
+    parser.add_argument('--top', type=int, default=15, help='Lines per section')
+    parser.add_argument('--python', default=sys.executable, help='The interpreter to profile with')
+    parser.add_argument('--json', help='Also save the raw timings to this file')
+    args = parser.parse_args(argv)
+    for name in args.handlers:
+        if name not in HANDLERS:
+            parser.error('Unknown function {}'.format(name))
+    args.handlers = args.handlers or sorted(HANDLERS)
+    return args
+
+
+def main(argv):
+    '''Command line entrypoint'''
+    args = parse_args(argv)
+    results = {}
+    for name in args.handlers:
+        module, imports = profile_imports(name, args.python)
+        report(name, module, imports, args.top)
+        results[name] = imports
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,226 @@
+#! /usr/bin/env python
+'''Create or migrate the file sharing DynamoDB tables'''
+
+import sys
+import time
+import argparse
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+
+USER_FILES_INDEX = 'user_id-file_name-index'
+TTL_ATTRIBUTE = 'expires_at'
+FILE_STATUS_UPLOADED = 'UPLOADED'
+
+
+def user_files_index(index_name):
+    '''The user_id / file_name global secondary index definition'''
+    return {
+        'IndexName': index_name,
+        'KeySchema': [
+            {'AttributeName': 'user_id', 'KeyType': 'HASH'},
+            {'AttributeName': 'file_name', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {'ProjectionType': 'ALL'}
+    }
+
+
+def index_attribute_definitions():
+    '''The attributes used by the table and index keys'''
+    return [
+        {'AttributeName': 'file_id', 'AttributeType': 'S'},
+        {'AttributeName': 'user_id', 'AttributeType': 'S'},
+        {'AttributeName': 'file_name', 'AttributeType': 'S'}
+    ]
+
+
+def wait_for_index(client, table_name, index_name):
+    '''Wait until DynamoDB has backfilled the index'''
+    while True:
+        table = client.describe_table(TableName=table_name)['Table']
+        for index in table.get('GlobalSecondaryIndexes', []):
+            if index['IndexName'] != index_name:
+                continue
+            if index['IndexStatus'] == 'ACTIVE' and not index.get('Backfilling', False):
+                return
+            print('Index {} is {}, waiting...'.format(index_name, index['IndexStatus']))
+        time.sleep(20)
+
+
+def enable_ttl(client, table_name):
+    '''Let DynamoDB drop the abandoned pending uploads'''
+    response = client.describe_time_to_live(TableName=table_name)
+    if response['TimeToLiveDescription']['TimeToLiveStatus'] in ('ENABLED', 'ENABLING'):
+        return
+    client.update_time_to_live(
+        TableName=table_name,
+        TimeToLiveSpecification={'Enabled': True, 'AttributeName': TTL_ATTRIBUTE}
+    )
+
+
+def create_table(client, args):
+    '''Create the table with its index'''
+    client.create_table(
+        TableName=args.table,
+        KeySchema=[{'AttributeName': 'file_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=index_attribute_definitions(),
+        GlobalSecondaryIndexes=[user_files_index(args.index)],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    client.get_waiter('table_exists').wait(TableName=args.table)
+    enable_ttl(client, args.table)
+    print('Table {} created'.format(args.table))
+
+
+def create_sessions_table(client, args):
+    '''Create the table of the resumable upload sessions'''
+    client.create_table(
+        TableName=args.table,
+        KeySchema=[{'AttributeName': 'upload_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'upload_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    client.get_waiter('table_exists').wait(TableName=args.table)
+    enable_ttl(client, args.table)
+    print('Table {} created'.format(args.table))
+
+
+def create_manifests_table(client, args):
+    '''Create the table of the per-user file manifests'''
+    client.create_table(
+        TableName=args.table,
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    client.get_waiter('table_exists').wait(TableName=args.table)
+    print('Table {} created'.format(args.table))
+
+
+def create_idempotency_table(client, args):
+    '''Create the table of the upload responses kept for their retries'''
+    client.create_table(
+        TableName=args.table,
+        KeySchema=[{'AttributeName': 'idempotency_key', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'idempotency_key', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    client.get_waiter('table_exists').wait(TableName=args.table)
+    enable_ttl(client, args.table)
+    print('Table {} created'.format(args.table))
+
+
+def create_shares_table(client, args):
+    '''Create the table of the share delivery statuses'''
+    client.create_table(
+        TableName=args.table,
+        KeySchema=[{'AttributeName': 'share_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'share_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    client.get_waiter('table_exists').wait(TableName=args.table)
+    enable_ttl(client, args.table)
+    print('Table {} created'.format(args.table))
+
+
+def add_index(client, args):
+    '''Add the index to an existing table'''
+    table = client.describe_table(TableName=args.table)['Table']
+    indexes = [index['IndexName'] for index in table.get('GlobalSecondaryIndexes', [])]
+    if args.index in indexes:
+        print('Index {} already exists'.format(args.index))
+        return
+    index = user_files_index(args.index)
+    if table.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+        throughput = table['ProvisionedThroughput']
+        index['ProvisionedThroughput'] = {
+            'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+            'WriteCapacityUnits': throughput['WriteCapacityUnits']
+        }
+    client.update_table(
+        TableName=args.table,
+        AttributeDefinitions=index_attribute_definitions(),
+        GlobalSecondaryIndexUpdates=[{'Create': index}]
+    )
+    print('Index {} is being created'.format(args.index))
+
+
+def backfill_items(args):
+    '''Normalize the items written before the index existed'''
+    table = boto3.resource('dynamodb').Table(args.table)
+    scan_args = {
+        'FilterExpression': Attr('file_status').not_exists() |
+                            Attr('user_id').not_exists() |
+                            Attr('file_name').not_exists()
+    }
+    updated = 0
+    unindexable = []
+    while True:
+        response = table.scan(**scan_args)
+        for item in response['Items']:
+            if 'user_id' not in item or 'file_name' not in item:
+                unindexable.append(item['file_id'])
+                continue
+            if not args.dry_run:
+                table.update_item(
+                    Key={'file_id': item['file_id']},
+                    UpdateExpression='SET file_status = :uploaded',
+                    ConditionExpression='attribute_not_exists(file_status)',
+                    ExpressionAttributeValues={':uploaded': FILE_STATUS_UPLOADED}
+                )
+            updated += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    print('{} items marked as {}'.format(updated, FILE_STATUS_UPLOADED))
+    for file_id in unindexable:
+        print('Item {} has no user_id or file_name and is not indexed'.format(file_id))
+
+
+def migrate_table(client, args):
+    '''Add the index, wait for its backfill and normalize old items'''
+    if not args.dry_run:
+        add_index(client, args)
+        wait_for_index(client, args.table, args.index)
+        enable_ttl(client, args.table)
+    backfill_items(args)
+
+
+def parse_args(argv):
+    '''Parse the command line'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('command', choices=[
+        'create', 'migrate', 'create-sessions', 'create-manifests', 'create-idempotency', 'create-shares'
+    ])
+    parser.add_argument(
+        '--table',
+        required=True,
+        help='The FILE_SHARING_TABLE name, UPLOAD_SESSIONS_TABLE for create-sessions, '
+             'FILE_MANIFEST_TABLE for create-manifests, IDEMPOTENCY_TABLE for create-idempotency '
+             'or SHARE_STATUS_TABLE for create-shares'
+    )
+    parser.add_argument('--index', default=USER_FILES_INDEX, help='The USER_FILES_INDEX name')
+    parser.add_argument('--dry-run', action='store_true', help='Only report the items to backfill')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    '''Command line entrypoint'''
+    args = parse_args(argv)
+    client = boto3.client('dynamodb')
+    if args.command == 'create':
+        create_table(client, args)
+    elif args.command == 'create-sessions':
+        create_sessions_table(client, args)
+    elif args.command == 'create-manifests':
+        create_manifests_table(client, args)
+    elif args.command == 'create-idempotency':
+        create_idempotency_table(client, args)
+    elif args.command == 'create-shares':
+        create_shares_table(client, args)
+    else:
+        migrate_table(client, args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
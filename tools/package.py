@@ -0,0 +1,240 @@
+#! /usr/bin/env python
+'''Build the deployment zip of the Lambda functions, without the unused code'''
+
+import os
+import re
+import sys
+import ast
+import shutil
+import zipfile
+import argparse
+import tempfile
+import compileall
+import subprocess
+import py_compile
+from import_profile import ROOT, HANDLERS, SERVED_FUNCTIONS, source_folders
+
+
+DIST_FOLDER = os.path.join(ROOT, 'dist')
+# Data files read by the handlers at run time
+DATA_FOLDERS = ['schemas']
+# The distributions whose import name differs from their own
+IMPORT_NAMES = {
+    'pyjwt': 'jwt',
+    'python-dateutil': 'dateutil'
+}
+# Provided by the Lambda Python runtime, a packaged copy only adds to the
+# size of the zip and to the time needed to unpack it
+RUNTIME_PACKAGES = ['boto3', 'botocore', 's3transfer', 'jmespath', 'dateutil', 'urllib3', 'six']
+# Console scripts of the installed packages, never run by a function
+STRIPPED_ENTRIES = ['bin']
+# Never imported by a running function
+STRIPPED_FOLDERS = ['__pycache__', 'tests', 'test']
+STRIPPED_EXTENSIONS = ['.pyc', '.pyi', '.c', '.h', '.pyx', '.pxd']
+
+
+def imported_names(path):
+    '''The top level names imported by a module, at any depth of its code'''
+    with open(path) as source_file:
+        tree = ast.parse(source_file.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split('.')[0])
+    return names
+
+
+def find_local_modules(folders):
+    '''The path of every module of the folders, by module name'''
+    local_modules = {}
+    for folder in folders:
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith('.py'):
+                continue
+            path = os.path.join(folder, name)
+            previous = local_modules.setdefault(name[:-3], path)
+            # The modules used by several functions belong to the shared
+            # folder, a module name means a single module in the zip
+            if previous != path:
+                raise RuntimeError('{} and {} have the same name'.format(
+                    os.path.relpath(previous, ROOT),
+                    os.path.relpath(path, ROOT)
+                ))
+    return local_modules
+
+
+def collect_modules(local_modules, modules):
+    '''Follow the imports of the handlers, return their local modules and the others'''
+    reached = set()
+    external = set()
+    pending = list(modules)
+    while pending:
+        name = pending.pop()
+        if name in reached:
+            continue
+        reached.add(name)
+        for imported in imported_names(local_modules[name]):
+            if imported in local_modules:
+                pending.append(imported)
+            else:
+                external.add(imported)
+    return reached, external
+
+
+def read_requirements(path):
+    '''The requirement lines of a requirements file, with their import names'''
+    requirements = []
+    if not os.path.exists(path):
+        return requirements
+    with open(path) as requirements_file:
+        for line in requirements_file:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            name = re.split(r'[\[<>=!~;\s]', line, 1)[0].lower()
+            requirements.append((line, IMPORT_NAMES.get(name, name.replace('-', '_'))))
+    return requirements
+
+
+def install_requirements(requirements, target, args):
+    '''pip install the requirements in the build folder'''
+    command = [args.python, '-m', 'pip', 'install', '--quiet', '--no-compile', '--target', target]
+    if args.platform:
+        command += ['--platform', args.platform, '--only-binary=:all:']
+    if args.python_version:
+        command += ['--python-version', args.python_version]
+    subprocess.run(command + requirements, check=True)
+
+
+def strip_build(target, include_boto3):
+    '''Remove what the functions never load from the installed packages'''
+    for name in os.listdir(target):
+        package = name.split('-')[0] if name.endswith('.dist-info') else name
+        if name in STRIPPED_ENTRIES or (not include_boto3 and package.lower() in RUNTIME_PACKAGES):
+            path = os.path.join(target, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    for folder, subfolders, files in os.walk(target):
+        for subfolder in [name for name in subfolders if name in STRIPPED_FOLDERS]:
+            shutil.rmtree(os.path.join(folder, subfolder))
+            subfolders.remove(subfolder)
+        for name in files:
+            if os.path.splitext(name)[1] in STRIPPED_EXTENSIONS:
+                os.remove(os.path.join(folder, name))
+
+
+def build_folder(name, target, args):
+    '''Gather the modules and dependencies of a function in the build folder'''
+    folders = source_folders(name)
+    local_modules = find_local_modules(folders)
+    # The router imports the endpoints by name, on their first request
+    handlers = [
+        os.path.splitext(os.path.basename(HANDLERS[function]))[0]
+        for function in [name] + SERVED_FUNCTIONS.get(name, [])
+    ]
+    modules, external = collect_modules(local_modules, handlers)
+    for local_module in sorted(modules):
+        shutil.copy(local_modules[local_module], target)
+    for folder in folders:
+        for data_folder in DATA_FOLDERS:
+            if os.path.isdir(os.path.join(folder, data_folder)):
+                shutil.copytree(
+                    os.path.join(folder, data_folder),
+                    os.path.join(target, data_folder),
+                    dirs_exist_ok=True
+                )
+    requirements = []
+    for line, import_name in read_requirements(os.path.join(os.path.dirname(folders[0]), 'requirements.txt')):
+        if import_name in external:
+            requirements.append(line)
+        else:
+            print('  {} is never imported, not packaged'.format(line))
+    if requirements:
+        install_requirements(requirements, target, args)
+    strip_build(target, args.include_boto3)
+    if not args.no_compile:
+        # /var/task is read only: without bytecode in the zip, every cold
+        # start compiles the modules again. Unchecked hashes survive the
+        # timestamps the zip format rounds.
+        compileall.compile_dir(
+            target,
+            quiet=1,
+            invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH
+        )
+    return modules
+
+
+def write_zip(folder, output):
+    '''Zip the build folder, with stable entry order'''
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for current, subfolders, files in os.walk(folder):
+            subfolders.sort()
+            for name in sorted(files):
+                path = os.path.join(current, name)
+                zip_file.write(path, os.path.relpath(path, folder))
+
+
+def package(name, args):
+    '''Build the zip of one function'''
+    print('{}:'.format(name))
+    output = os.path.join(args.output, name + '.zip')
+    with tempfile.TemporaryDirectory() as target:
+        modules = build_folder(name, target, args)
+        write_zip(target, output)
+    print('  {} modules, {:.1f} KB -> {}'.format(
+        len(modules),
+        os.path.getsize(output) / 1024.0,
+        os.path.relpath(output)
+    ))
+
+
+def parse_args(argv):
+    '''Parse the command line'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'functions',
+        nargs='*',
+        metavar='function',
+        help='The functions to package among {}, all of them by default'.format(
+            ', '.join(sorted(HANDLERS))
+        )
+    )
+    parser.add_argument('--output', default=DIST_FOLDER, help='The folder of the zip files')
+    parser.add_argument('--python', default=sys.executable, help='The interpreter running pip')
+    parser.add_argument(
+        '--platform',
+        help='Install the wheels of this platform, e.g. manylinux2014_x86_64 or manylinux2014_aarch64'
+    )
+    parser.add_argument('--python-version', help='Install the wheels of this Python version, e.g. 3.12')
+    parser.add_argument(
+        '--include-boto3',
+        action='store_true',
+        help='Keep boto3 and its dependencies when a requirement pulls them in'
+    )
+    parser.add_argument(
+        '--no-compile',
+        action='store_true',
+        help='Do not add bytecode, when the runtime Python differs from the building one'
+    )
+    args = parser.parse_args(argv)
+    for name in args.functions:
+        if name not in HANDLERS:
+            parser.error('Unknown function {}'.format(name))
+    args.functions = args.functions or sorted(HANDLERS)
+    return args
+
+
+def main(argv):
+    '''Command line entrypoint'''
+    args = parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+    for name in args.functions:
+        package(name, args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
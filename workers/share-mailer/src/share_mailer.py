@@ -0,0 +1,221 @@
+#! /usr/bin/env python
+'''Send the file shares queued by share-file'''
+
+import os
+import sys
+import json
+import time
+import random
+import collections
+import constants
+import log
+import aws_clients
+import metrics
+import mailer
+import share_queue
+
+
+LOGGER = log.setup_logging()
+
+
+def parse_jobs(event):
+    '''Read the share jobs out of the SQS records'''
+    jobs = []
+    for record in event['Records']:
+        try:
+            jobs.append((record['messageId'], json.loads(record['body'])))
+        except ValueError as error:
+            # A malformed job will never succeed, do not send it back
+            LOGGER.error('Dropping message %s: %s', record['messageId'], error)
+    return jobs
+
+
+def load_share_status(table, share_id):
+    '''Get the recipients already handled by a previous delivery of the job'''
+    if table is None:
+        return {}
+    item = table.get_item(Key={'share_id': share_id}, ConsistentRead=True).get('Item')
+    if item is None:
+        return {}
+    return item['recipients']
+
+
+def get_share_status(recipients):
+    '''Summarize the recipient statuses'''
+    statuses = [recipient['status'] for recipient in recipients.values()]
+    if 'RETRYING' in statuses:
+        return 'RETRYING'
+    if all(status == 'SENT' for status in statuses):
+        return 'SHARED'
+    if 'SENT' in statuses:
+        return 'PARTIALLY_SHARED'
+    return 'NOT_SHARED'
+
+
+def save_share_status(table, job, recipients):
+    '''Record the delivery status of a share job'''
+    if table is None:
+        return
+    table.put_item(
+        Item={
+            'share_id': job['share_id'],
+            'user_id': job['user_id'],
+            'file_id': job['file_id'],
+            'share_status': get_share_status(recipients),
+            'recipients': recipients,
+            'requested_at': job['requested_at'],
+            'updated_at': int(time.time()),
+            'expires_at': int(time.time()) + constants.SHARE_STATUS_RETENTION
+        }
+    )
+
+
+def get_file_url(job, conf_values):
+    '''Presign the download link of the shared file'''
+    s3_client = aws_clients.get_client('s3', conf_values['REGION'])
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params=mailer.get_download_params(
+            conf_values['USER_FILES_BUCKET'],
+            job['user_id']+'/'+job['file_name'],
+            job.get('content_encoding')
+        ),
+        ExpiresIn=constants.FILE_LINK_EXPIRATION
+    )
+
+
+def send_with_retries(file_owner, emails, file_presigned_url, conf_values):
+    '''Send the link, retrying the throttled recipients with a backoff'''
+    results = {}
+    pending = emails
+    for attempt in range(conf_values['SHARE_MAX_ATTEMPTS']):
+        if attempt > 0:
+            delay = constants.SHARE_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            time.sleep(delay + random.uniform(0, delay))
+        for result in mailer.send_file_links(file_owner, pending, file_presigned_url, conf_values):
+            results[result['email']] = result
+        pending = [email for email in pending if mailer.is_retryable(results[email])]
+        if not pending:
+            break
+        LOGGER.warning('%d recipients throttled, attempt %d', len(pending), attempt + 1)
+    return results
+
+
+def send_shares(jobs, table, conf_values):
+    '''Send the jobs, one email per recipient and file across the batch'''
+    # Jobs sharing the same file are coalesced into a single send
+    groups = collections.OrderedDict()
+    for message_id, job in jobs:
+        previous = load_share_status(table, job['share_id'])
+        to_send = [
+            email for email in job['share_with']
+            if previous.get(email, {}).get('status') != 'SENT'
+        ]
+        key = (job['user_id'], job['file_name'], job['file_owner'])
+        groups.setdefault(key, []).append((message_id, job, previous, to_send))
+
+    failed_messages = []
+    for entries in groups.values():
+        emails = list(dict.fromkeys(
+            email for _, _, _, to_send in entries for email in to_send
+        ))
+        try:
+            results = {}
+            if emails:
+                file_presigned_url = get_file_url(entries[0][1], conf_values)
+                results = send_with_retries(
+                    entries[0][1]['file_owner'],
+                    emails,
+                    file_presigned_url,
+                    conf_values
+                )
+        except Exception as error:
+            LOGGER.error(error)
+            failed_messages.extend(message_id for message_id, _, _, _ in entries)
+            continue
+        for message_id, job, previous, to_send in entries:
+            recipients = dict(previous)
+            for email in to_send:
+                result = dict(results[email])
+                if mailer.is_retryable(result):
+                    result['status'] = 'RETRYING'
+                recipients[email] = result
+            try:
+                save_share_status(table, job, recipients)
+            except Exception as error:
+                LOGGER.error(error)
+            if any(recipient['status'] == 'RETRYING' for recipient in recipients.values()):
+                # SQS delivers the job again after its visibility timeout
+                failed_messages.append(message_id)
+    return failed_messages
+
+
+def init_env_vars():
+    '''Get all environment variables'''
+    conf_values = {}
+    conf_values['REGION'] = os.getenv(constants.REGION)
+    conf_values['USER_FILES_BUCKET'] = os.environ['USER_FILES_BUCKET']
+    conf_values['SENDER_EMAIL'] = os.environ['SENDER_EMAIL']
+    conf_values['SENDER_SES_ARN'] = os.environ['SENDER_SES_ARN']
+    conf_values['SES_TEMPLATE_NAME'] = os.getenv(constants.SES_TEMPLATE_NAME)
+    conf_values['SES_MAX_SEND_RATE'] = float(os.getenv(
+        constants.SES_MAX_SEND_RATE,
+        constants.DEFAULT_SES_MAX_SEND_RATE
+    ))
+    conf_values['SES_MAX_WORKERS'] = int(os.getenv(
+        constants.SES_MAX_WORKERS,
+        constants.DEFAULT_SES_MAX_WORKERS
+    ))
+    conf_values['SHARE_STATUS_TABLE'] = os.getenv(constants.SHARE_STATUS_TABLE)
+    conf_values['SHARE_MAX_ATTEMPTS'] = int(os.getenv(
+        constants.SHARE_MAX_ATTEMPTS,
+        constants.DEFAULT_SHARE_MAX_ATTEMPTS
+    ))
+    return conf_values
+
+
+@metrics.instrument_handler('share-mailer')
+def lambda_handler(event, _):
+    '''Lambda entrypoint, fed by the SQS share queue'''
+    conf_values = init_env_vars()
+    table = None
+    if conf_values['SHARE_STATUS_TABLE']:
+        table = aws_clients.get_table(conf_values['SHARE_STATUS_TABLE'])
+    failed_messages = send_shares(parse_jobs(event), table, conf_values)
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': message_id} for message_id in failed_messages
+        ]
+    }
+
+
+def drain_local_queue(queue_url, batch_size=10):
+    '''Send the jobs of a local queue batch by batch, as the SQS event source does'''
+    queue = share_queue.get_queue(queue_url)
+    undelivered = []
+    while True:
+        event = queue.receive_event(batch_size)
+        if not event['Records']:
+            return undelivered
+        failed = set(item['itemIdentifier'] for item in lambda_handler(event, None)['batchItemFailures'])
+        undelivered.extend(record['body'] for record in event['Records'] if record['messageId'] in failed)
+
+
+def main(argv):
+    '''Command line entrypoint, the worker of a local SHARE_QUEUE_URL'''
+    import argparse
+    parser = argparse.ArgumentParser(description='Send the share jobs queued in a local queue file')
+    parser.add_argument('queue_url', help='The local:// SHARE_QUEUE_URL of share-file')
+    parser.add_argument('--batch-size', type=int, default=10, help='Jobs per worker invocation')
+    args = parser.parse_args(argv)
+    if not args.queue_url.startswith(share_queue.LOCAL_QUEUE_PREFIX):
+        parser.error('Only the local queues can be drained, SQS feeds the deployed worker')
+    undelivered = drain_local_queue(args.queue_url, args.batch_size)
+    # The throttled jobs go back to the queue, for the next run
+    for body in undelivered:
+        share_queue.get_queue(args.queue_url).send(json.loads(body))
+    print('{} jobs left in the queue'.format(len(undelivered)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])